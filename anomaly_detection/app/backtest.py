@@ -0,0 +1,88 @@
+from app.classes.backtest import load_history, load_incidents, expand_grid, run_backtest, history_files
+from app.classes.temperature_analyzer import TemperatureAnalyzer
+import argparse
+import csv
+import os
+import time
+import yaml
+
+# Replay recorded temperature histories offline and compare threshold sets.
+#
+# From the anomaly_detection directory:
+#    python3 -m app.backtest app/persistence/save \
+#        --grid printer.high=280,300,320 --grid printer.max_rate=60,100 \
+#        --incidents incidents.csv --output backtest.csv
+
+def parse_grid(items):
+    """KEY=V1,V2,... (repeatable) to {KEY: [V1, V2, ...]}, values parsed as YAML scalars."""
+    grid = {}
+    for item in items or []:
+        key, sep, values = item.partition("=")
+        if not sep or not values:
+            raise ValueError(f"Invalid grid '{item}', expected KEY=V1,V2,...")
+        grid[key.strip()] = [yaml.safe_load(value) for value in values.split(",")]
+    return grid
+
+def format_seconds(value):
+    return "-" if value is None else f"{value:.1f}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay temperature histories through the anomaly detection, offline")
+    parser.add_argument("paths", nargs="+", help="history CSV files (.csv or rotated .csv.gz) or directories holding them")
+    parser.add_argument("--config", default="app/anomaly_detection_config.yaml", help="base thresholds")
+    parser.add_argument("--grid", action="append", metavar="KEY=V1,V2",
+                        help="config values to sweep, e.g. printer.high=280,300 (repeatable)")
+    parser.add_argument("--incidents", help="CSV of the real incidents: source, sourceId, start, end")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="processes (default: all cores)")
+    parser.add_argument("--safe-required", type=int, default=3, help="consecutive safe readings resolving an alert")
+    parser.add_argument("--printer-ttl", type=float, default=float(os.getenv("PRINTER_TTL", "90")),
+                        help="seconds without readings after which a printer's rate detector restarts")
+    parser.add_argument("--top", type=int, default=20, help="threshold sets printed")
+    parser.add_argument("--output", help="CSV file with the results of every threshold set")
+    args = parser.parse_args()
+
+    base_config = TemperatureAnalyzer(config_path=args.config).thresholds
+    try:
+        threshold_sets = expand_grid(base_config, parse_grid(args.grid))
+    except (TypeError, ValueError) as e:
+        parser.error(str(e))
+    incidents = load_incidents(args.incidents) if args.incidents else None
+
+    start = time.perf_counter()
+    history = load_history(args.paths)
+    loaded = time.perf_counter() - start
+    readings = sum(len(t) for t, _ in history.values())
+    print(f"[BACKTEST] Loaded {readings:,} readings of {len(history)} sources from "
+          f"{len(history_files(args.paths))} files in {loaded:.1f} s")
+
+    start = time.perf_counter()
+    results = run_backtest(history, threshold_sets, incidents=incidents, workers=args.workers,
+                           safe_required=args.safe_required, printer_ttl=args.printer_ttl)
+    elapsed = time.perf_counter() - start
+    print(f"[BACKTEST] Replayed {len(threshold_sets)} threshold sets in {elapsed:.1f} s "
+          f"({readings * len(threshold_sets) / max(elapsed, 1e-9):,.0f} readings/s)")
+
+    if incidents is not None:
+        # Fewest missed incidents, then fewest false positives, then fastest detection
+        results.sort(key=lambda r: (r.missed, r.false_positives, r.mean_time_to_detect or float("inf")))
+    width = max(len("threshold set"), *(len(r.threshold_set.name) for r in results)) + 2
+    print("=" * (width + 70))
+    print(f"{'threshold set':<{width}}{'raised':>8}{'overheat':>10}{'runaway':>9}{'false pos':>11}"
+          f"{'missed':>8}{'ttd avg [s]':>12}{'ttd max [s]':>12}")
+    for result in results[:args.top]:
+        print(f"{result.threshold_set.name:<{width}}{result.raised:>8}{result.overheat:>10}{result.thermal_runaway:>9}"
+              f"{'-' if result.false_positives is None else result.false_positives:>11}"
+              f"{'-' if result.missed is None else f'{result.missed}/{len(incidents)}':>8}"
+              f"{format_seconds(result.mean_time_to_detect):>12}{format_seconds(result.max_time_to_detect):>12}")
+    print("=" * (width + 70))
+
+    if args.output:
+        rows = [result.row() for result in results]
+        with open(args.output, mode="w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"[BACKTEST] Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
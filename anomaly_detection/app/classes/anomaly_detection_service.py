@@ -2,11 +2,15 @@
 from app.mqtt.client import MQTTClient
 from app.mqtt.subscriber import MQTTSubscriber
 from app.mqtt.publisher import MQTTPublisher
+from app.mqtt.emergency_queue import EmergencyQueue
 
 # persistence
 from app.classes.temperature_analyzer import TemperatureAnalyzer
-from app.persistence.temperature_history import TemperatureHistory
-from app.persistence.alert_history import AlertHistory
+from app.classes.batch_evaluator import PrinterBatchEvaluator, THRESHOLD
+from app.persistence.temperature_ring_buffer import to_epoch
+from app.persistence.temperature_history import TemperatureHistory, FIELDNAMES as TEMPERATURE_FIELDS
+from app.persistence.alert_history import AlertHistory, FIELDNAMES as ALERT_FIELDS
+from app.persistence.history_sink import HistorySink
 
 # internal data models
 from app.models.emergency_model import EmergencyAlert
@@ -18,8 +22,12 @@ from app.dto.emergency_command_dto import EmergencyCommandDTO
 
 # services
 from app.services.discover_printers import discover_printers
+from app.services.liveness_registry import LivenessRegistry
 
 # standard libraries
+from collections import deque
+import numpy as np
+import atexit
 import yaml
 import os
 import threading
@@ -28,7 +36,8 @@ from typing import List
 
 
 class AnomalyDetectionService:
-    def __init__(self, mqtt_client, debug_service=True, discover_printers_timeout=60, debug_alerts=True, debug_analysis=True):
+    def __init__(self, mqtt_client, debug_service=True, discover_printers_timeout=2, debug_alerts=True, debug_analysis=True,
+                 printer_ttl=90, batch_window=0.05, emergency_workers=2, history_capacity=86400, alert_retention=1000, alert_archive_path="app/persistence/save/alert_archive.csv"):
 
         # Initialize self attributes
         self.debug = debug_service
@@ -44,32 +53,17 @@ class AnomalyDetectionService:
         # Initialize MQTT communication with provided client
         self.subscriber = MQTTSubscriber(self.mqtt_client)
         self.publisher = MQTTPublisher(self.mqtt_client)
+        # Emergency commands are published by a few workers, in order of precedence
+        self.emergency_queue = EmergencyQueue(self.publisher, workers=emergency_workers, debug=self.debug_alerts)
 
         if self.debug:
             print("[ANOMALY_DETECTION DEBUG] Initialized MQTT client and pub/sub")
 
-        # Search all printers in the network -> blocking call
-        # Any payload with printerId will be added to the discovered printers
-        print(f"\033[91m[ANOMALY_DETECTION DEBUG] Discovering printers with timeout {self.discover_printers_timeout} seconds...\033[0m")
-        self.printers = discover_printers(self.subscriber, timeout=self.discover_printers_timeout, debug=self.debug)
-
-        # Classes
-        # Initialize temperature history and analyzer
-        self.history = TemperatureHistory(self.printers, debug=self.debug)
-        # Initialize alert history for emergency alerts
-        self.alert_history = AlertHistory(debug=self.debug_alerts)
-        # Initialize temperature analyzer for heat level computation
-        self.analyzer = TemperatureAnalyzer(debug=self.debug_analysis)
-
-
         # VARIABLES FOR KEEPING TRACK OF TEMPERATURES
-        # Initialize printer temperature dicts with: key printerID and DTOs as values (None initially)
-        self.current_printer_temperatures = {
-            pid: None for pid in self.printers
-        }
-        self.prev_printer_temperatures = {
-            pid: None for pid in self.printers
-        }
+        # Printer readings waiting for the next batch, their state is in the evaluator's table
+        self._pending_printer_readings = deque()
+        self.batch_window = batch_window
+        self._stop_batches = threading.Event()
 
         # Initialize room temperature: DTOs as values (None initially)
         self.current_room_temperature = None
@@ -78,10 +72,33 @@ class AnomalyDetectionService:
         # Hysteresis counters for emergency resolution
         self.room_threshold_safe_count = 0
         self.room_rate_safe_count = 0
-        self.printer_threshold_safe_count = {pid: 0 for pid in self.printers}
-        self.printer_rate_safe_count = {pid: 0 for pid in self.printers}
         self.SAFE_REQUIRED = 3  # Number of consecutive safe readings required
 
+        # Initialize temperature analyzer for anomaly analysis
+        self.analyzer = TemperatureAnalyzer(debug=self.debug_analysis)
+        # Printer readings are evaluated in batches, with the analyzer's thresholds and rate detector
+        self.evaluator = PrinterBatchEvaluator(self.analyzer, safe_required=self.SAFE_REQUIRED)
+
+        # Printers that sent a temperature reading within printer_ttl seconds
+        self.liveness = LivenessRegistry(ttl=printer_ttl, debug=self.debug)
+        self.liveness.subscribe(on_online=self._on_printer_online, on_offline=self._on_printer_offline)
+
+        # Printers from their retained announces -> returns within milliseconds,
+        # printers joining or leaving later are tracked through the callbacks
+        print(f"\033[91m[ANOMALY_DETECTION DEBUG] Discovering printers (at most {self.discover_printers_timeout} seconds)...\033[0m")
+        self.printers = discover_printers(self.subscriber, timeout=self.discover_printers_timeout, debug=self.debug,
+                                          on_join=self.liveness.touch, on_leave=self.liveness.forget)
+        for pid in self.printers:
+            self.liveness.touch(pid)
+
+        # Classes
+        # Initialize temperature history and analyzer, the last history_capacity readings of each source
+        self.history = TemperatureHistory(self.printers, debug=self.debug, capacity=history_capacity)
+        # Initialize alert history for emergency alerts, resolved alerts beyond
+        # alert_retention are dropped from memory (moved to the archive file until the alert sink is attached)
+        self.alert_history = AlertHistory(debug=self.debug_alerts, max_resolved=alert_retention,
+                                          archive_path=alert_archive_path)
+
 
     def start(self):
 
@@ -95,15 +112,21 @@ class AnomalyDetectionService:
         if self.debug:
             print("[GLOBAL_TEMP DEBUG] Subscribed to room and printer temperature topics.")
 
+        # Expire printers that stopped sending readings
+        self.liveness.start()
+
+        # Publish the emergency commands
+        self.emergency_queue.start()
+
+        # Evaluate the printer readings every batch window
+        threading.Thread(target=self._run_printer_batches, daemon=True).start()
+
         print(f"\033[92m[ANOMALY_DETECTION] Service started successfully. ({len(self.printers)} printers discovered.)\033[0m")
 
     # Custom callbacks for MQTT messages, for store temperature readings
     def _publish_emergency_async(self, action, type_, source, id_):
-        threading.Thread(
-            target=self.publisher.publish_emergency_command,
-            args=(action, type_, source, id_),
-            daemon=True
-        ).start()
+        # Queued for the publisher workers: never blocks the MQTT thread on the QoS 2 round trip
+        self.emergency_queue.submit(action, type_, source, id_)
 
     def _on_room_temp(self, client, userdata, dto_received):
         # Update previous and current room temperature DTOs
@@ -113,11 +136,8 @@ class AnomalyDetectionService:
         # Analyze the room temperature reading for anomalies
         alert_threshold = self.analyzer.check_thresholds(self.current_room_temperature)
 
-        # Only check rate if both previous and current readings are available
-        if self.prev_room_temperature is not None and self.current_room_temperature is not None:
-            alert_rate = self.analyzer.check_rate(self.prev_room_temperature, self.current_room_temperature)
-        else:
-            alert_rate = False
+        # Rate detector of the sensor, updated with every reading
+        alert_rate = self.analyzer.observe_rate(dto_received)
 
         # Add the room temperature reading to the history
         self.history.add_room_reading(dto_received)
@@ -147,7 +167,7 @@ class AnomalyDetectionService:
         else:
             added_threshold = False
 
-        self.reentrant_threshold_on_room_temp(alert_threshold, added_threshold)
+        self.reentrant_threshold_on_room_temp(dto_received.sensorId, alert_threshold, added_threshold)
 
         if alert_rate:
             # Add alert to the alert history, only publish if new
@@ -174,96 +194,88 @@ class AnomalyDetectionService:
         else:
             added_rate = False
 
-        self.reentrant_rate_on_room_temp(alert_rate, added_rate)
-
-    def _on_printer_temp(self, client, userdata, dto_received):
-        printer_id = dto_received.printerId
-
-        # Dynamically add new printer IDs if not present
-        if printer_id not in self.current_printer_temperatures:
-            self.current_printer_temperatures[printer_id] = None
-            self.prev_printer_temperatures[printer_id] = None
-            self.printer_threshold_safe_count[printer_id] = 0
-            self.printer_rate_safe_count[printer_id] = 0
-            if self.debug:
-                print(f"[ANOMALY_DETECTION DEBUG] Discovered new printer: {printer_id} (no temperature history will be available for this printer)")
-
-        # Update previous and current printer temperature DTOs
-        self.prev_printer_temperatures[printer_id] = self.current_printer_temperatures.get(printer_id)
-        self.current_printer_temperatures[printer_id] = dto_received
-
-        # Analyze the printer temperature reading for anomalies
-        alert_threshold = self.analyzer.check_thresholds(reading=self.current_printer_temperatures[printer_id])
-
-        # Only check rate if both previous and current readings are available
-        if self.prev_printer_temperatures[printer_id] is not None and self.current_printer_temperatures[printer_id] is not None:
-            alert_rate = self.analyzer.check_rate(
-                reading_prev=self.prev_printer_temperatures[printer_id], 
-                reading_curr=self.current_printer_temperatures[printer_id]
-            )
-        else:
-            alert_rate = False
-
-        # Add the printer temperature reading to the history
-        self.history.add_printer_reading(dto_received)
+        self.reentrant_rate_on_room_temp(dto_received.sensorId, alert_rate, added_rate)
 
-        if alert_threshold:
-            # Add alert to the alert history
-            # Return True if the alert was added (not already present)
-            added_threshold = self.alert_history.add_alert(
-                EmergencyAlert(
-                    alert_id=f"printer_{printer_id}_{dto_received.timestamp}_threshold",
-                    alert_type="Threshold Alert",
-                    source="printer",
-                    source_id=printer_id,
-                    timestamp=dto_received.timestamp,
-                    details={
-                        "description": f"Printer {printer_id} temperature exceeded threshold: {dto_received.temperature} {dto_received.unit}"
-                    }
-                )
-            )
-            if added_threshold:
-                self._publish_emergency_async(
-                    action="emergency",
-                    type_="overheat",
-                    source="printer",
-                    id_=printer_id
-                )
-        else:
-            added_threshold = False
+    # Liveness events
+    def _on_printer_online(self, printer_id):
+        if self.debug:
+            print(f"[ANOMALY_DETECTION DEBUG] Printer online: {printer_id}")
 
-        self.reentrant_threshold_on_printer_temp(printer_id, alert_threshold, added_threshold)
+    def _on_printer_offline(self, printer_id):
+        # The rate check restarts when the printer is back, instead of comparing across the gap
+        self.evaluator.reset(printer_id)
+        print(f"\033[91m[ANOMALY_DETECTION] Printer {printer_id} offline: no temperature reading for {self.liveness.ttl} seconds\033[0m")
 
-        if alert_rate:
-            # Keep track of the alert
-            # Return True if the alert was added (not already present)
-            added_rate = self.alert_history.add_alert(
-                EmergencyAlert(
-                    alert_id=f"printer_{printer_id}_{dto_received.timestamp}_rate",
-                    alert_type="Rate Alert",
-                    source="printer",
-                    source_id=printer_id,
-                    timestamp=dto_received.timestamp,
-                    details={
-                        "description": f"Printer {printer_id} temperature rate of change exceeded: {dto_received.temperature} {dto_received.unit}"
-                    }
-                )
-            )
-            if added_rate:
-                self._publish_emergency_async(
-                    action="emergency",
-                    type_="thermal_runaway",
-                    source="printer",
-                    id_=printer_id
+    def _on_printer_temp(self, client, userdata, dto_received):
+        # Adds printers seen for the first time, or back after going offline
+        self.liveness.touch(dto_received.printerId)
+
+        # Evaluated with the other readings of the batch window, off the MQTT network thread
+        self._pending_printer_readings.append(dto_received)
+
+    def _run_printer_batches(self):
+        """Every batch_window seconds, evaluate the printer readings received meanwhile."""
+        while not self._stop_batches.wait(self.batch_window):
+            batch = []
+            while self._pending_printer_readings:
+                batch.append(self._pending_printer_readings.popleft())
+            if not batch:
+                continue
+            started = time.monotonic()
+            try:
+                self.evaluate_printer_batch(batch)
+            except Exception as e:
+                print(f"[ANOMALY_DETECTION ERROR] Batch of {len(batch)} printer readings failed: {e}")
+            elapsed = time.monotonic() - started
+            if elapsed > self.batch_window:
+                print(f"[ANOMALY_DETECTION] Batch of {len(batch)} printer readings took {elapsed * 1000:.0f} ms, "
+                      f"longer than the {self.batch_window * 1000:.0f} ms window")
+
+    def evaluate_printer_batch(self, readings: List[TemperatureReadingPrinterDTO]):
+        """Thresholds, rates and hysteresis of all the readings at once, then dispatch the alert transitions."""
+        for reading in readings:
+            self.history.add_printer_reading(reading)
+
+        # Timestamps have a one-second resolution: a batch only has a few distinct ones to parse
+        epochs = {timestamp: to_epoch(timestamp) for timestamp in {r.timestamp for r in readings}}
+        transitions = self.evaluator.evaluate(
+            [r.printerId for r in readings],
+            np.fromiter((epochs[r.timestamp] for r in readings), dtype=np.float64, count=len(readings)),
+            np.fromiter((r.temperature for r in readings), dtype=np.float64, count=len(readings))
+        )
+
+        for transition in transitions:
+            reading = readings[transition.index]
+            printer_id = transition.printer_id
+            type_ = "overheat" if transition.alert_type == THRESHOLD else "thermal_runaway"
+            if transition.action == "emergency":
+                description = ("temperature exceeded threshold" if transition.alert_type == THRESHOLD
+                               else "temperature rate of change exceeded")
+                # Return True if the alert was added (not already present)
+                added = self.alert_history.add_alert(
+                    EmergencyAlert(
+                        alert_id=f"printer_{printer_id}_{reading.timestamp}_{'threshold' if transition.alert_type == THRESHOLD else 'rate'}",
+                        alert_type=transition.alert_type,
+                        source="printer",
+                        source_id=printer_id,
+                        timestamp=reading.timestamp,
+                        details={
+                            "description": f"Printer {printer_id} {description}: {reading.temperature} {reading.unit}"
+                        }
+                    )
                 )
-        else:
-            added_rate = False
-
-        self.reentrant_rate_on_printer_temp(printer_id, alert_rate, added_rate)
-
-
-
-    def reentrant_threshold_on_room_temp(self, alert_threshold, added):
+                if added:
+                    self._publish_emergency_async(action="emergency", type_=type_, source="printer", id_=printer_id)
+            else:
+                # Hysteresis: resolved after SAFE_REQUIRED consecutive safe readings
+                alert = self.alert_history.resolve_active(transition.alert_type, "printer", printer_id)
+                if alert is not None:
+                    self._publish_emergency_async(action="resolve", type_=type_, source="printer", id_=printer_id)
+                    if self.debug_alerts:
+                        print(f"[REENTRANT] Printer {printer_id} {'threshold' if transition.alert_type == THRESHOLD else 'rate'} "
+                              f"emergency resolved: {alert.alert_id}")
+
+    def reentrant_threshold_on_room_temp(self, sensor_id, alert_threshold, added):
         """
         Reentrant function to resolve room threshold emergency if condition is cleared.
         Uses hysteresis to avoid pendulum effect.
@@ -271,22 +283,21 @@ class AnomalyDetectionService:
         if not alert_threshold:
             self.room_threshold_safe_count += 1
             if self.room_threshold_safe_count >= self.SAFE_REQUIRED:
-                for alert in self.alert_history.get_unresolved_alerts():
-                    if alert.source == "room" and alert.alert_type == "Threshold Alert":
-                        self.alert_history.resolve_alert(alert.alert_id)
-                        self._publish_emergency_async(
-                            action="resolve",
-                            type_="overheat",
-                            source="room",
-                            id_=alert.source_id
-                        )
-                        if self.debug_alerts:
-                            print(f"[REENTRANT] Room threshold emergency resolved: {alert.alert_id}")
+                alert = self.alert_history.resolve_active("Threshold Alert", "room", sensor_id)
+                if alert is not None:
+                    self._publish_emergency_async(
+                        action="resolve",
+                        type_="overheat",
+                        source="room",
+                        id_=sensor_id
+                    )
+                    if self.debug_alerts:
+                        print(f"[REENTRANT] Room threshold emergency resolved: {alert.alert_id}")
                 self.room_threshold_safe_count = 0
         else:
             self.room_threshold_safe_count = 0
 
-    def reentrant_rate_on_room_temp(self, alert_rate, added):
+    def reentrant_rate_on_room_temp(self, sensor_id, alert_rate, added):
         """
         Reentrant function to resolve room rate emergency if condition is cleared.
         Uses hysteresis to avoid pendulum effect.
@@ -294,83 +305,36 @@ class AnomalyDetectionService:
         if not alert_rate:
             self.room_rate_safe_count += 1
             if self.room_rate_safe_count >= self.SAFE_REQUIRED:
-                for alert in self.alert_history.get_unresolved_alerts():
-                    if alert.source == "room" and alert.alert_type == "Rate Alert":
-                        self.alert_history.resolve_alert(alert.alert_id)
-                        self._publish_emergency_async(
-                            action="resolve",
-                            type_="thermal_runaway",
-                            source="room",
-                            id_=alert.source_id
-                        )
-                        if self.debug_alerts:
-                            print(f"[REENTRANT] Room rate emergency resolved: {alert.alert_id}")
+                alert = self.alert_history.resolve_active("Rate Alert", "room", sensor_id)
+                if alert is not None:
+                    self._publish_emergency_async(
+                        action="resolve",
+                        type_="thermal_runaway",
+                        source="room",
+                        id_=sensor_id
+                    )
+                    if self.debug_alerts:
+                        print(f"[REENTRANT] Room rate emergency resolved: {alert.alert_id}")
                 self.room_rate_safe_count = 0
         else:
             self.room_rate_safe_count = 0
 
-    def reentrant_threshold_on_printer_temp(self, printer_id, alert_threshold, added):
-        """
-        Reentrant function to resolve printer threshold emergency if condition is cleared.
-        Uses hysteresis to avoid pendulum effect.
-        """
-        if not alert_threshold:
-            self.printer_threshold_safe_count[printer_id] += 1
-            if self.printer_threshold_safe_count[printer_id] >= self.SAFE_REQUIRED:
-                for alert in self.alert_history.get_unresolved_alerts():
-                    if alert.source == "printer" and alert.source_id == printer_id and alert.alert_type == "Threshold Alert":
-                        self.alert_history.resolve_alert(alert.alert_id)
-                        self._publish_emergency_async(
-                            action="resolve",
-                            type_="overheat",
-                            source="printer",
-                            id_=printer_id
-                        )
-                        if self.debug_alerts:
-                            print(f"[REENTRANT] Printer {printer_id} threshold emergency resolved: {alert.alert_id}")
-                self.printer_threshold_safe_count[printer_id] = 0
-        else:
-            self.printer_threshold_safe_count[printer_id] = 0
-
-    def reentrant_rate_on_printer_temp(self, printer_id, alert_rate, added):
+    def periodic_csv_dump(self, file_path="app/persistence/save", interval=120, max_bytes=10_000_000, max_age=86400, backups=7):
         """
-        Reentrant function to resolve printer rate emergency if condition is cleared.
-        Uses hysteresis to avoid pendulum effect.
+        Stream the temperature and alert histories to CSV files: the rows added since the last
+        flush are written every `interval` seconds, the files are rotated and gzipped by size or age.
         """
-        if not alert_rate:
-            self.printer_rate_safe_count[printer_id] += 1
-            if self.printer_rate_safe_count[printer_id] >= self.SAFE_REQUIRED:
-                for alert in self.alert_history.get_unresolved_alerts():
-                    if alert.source == "printer" and alert.source_id == printer_id and alert.alert_type == "Rate Alert":
-                        self.alert_history.resolve_alert(alert.alert_id)
-                        self._publish_emergency_async(
-                            action="resolve",
-                            type_="thermal_runaway",
-                            source="printer",
-                            id_=printer_id
-                        )
-                        if self.debug_alerts:
-                            print(f"[REENTRANT] Printer {printer_id} rate emergency resolved: {alert.alert_id}")
-                self.printer_rate_safe_count[printer_id] = 0
-        else:
-            self.printer_rate_safe_count[printer_id] = 0
-
-
-
-    def periodic_csv_dump(self, file_path="app/persistence/save", interval=120):
-        """Periodically dump the temperature history to a CSV file."""
-        def run():
-            while True:
-                # CSVs dump
-                self.history.csv_dump(os.path.join(file_path, "temperature_history.csv"))
-                self.alert_history.csv_dump(os.path.join(file_path, "alert_history.csv"))
-                
-                # Sleep for the specified interval before the next dump
-                time.sleep(interval)
-        
-        # Start the periodic CSV dump in a separate thread
-        thread = threading.Thread(target=run, daemon=True)
-        thread.start()
+        self.temperature_sink = HistorySink(os.path.join(file_path, "temperature_history.csv"), TEMPERATURE_FIELDS,
+                                            flush_interval=interval, max_bytes=max_bytes, max_age=max_age, backups=backups)
+        self.alert_sink = HistorySink(os.path.join(file_path, "alert_history.csv"), ALERT_FIELDS,
+                                      flush_interval=interval, max_bytes=max_bytes, max_age=max_age, backups=backups)
+        self.history.sink = self.temperature_sink
+        self.alert_history.sink = self.alert_sink
+
+        for sink in (self.temperature_sink, self.alert_sink):
+            sink.start()
+            # Write the last rows when the service exits
+            atexit.register(sink.stop)
 
         if self.debug:
             print(f"[GLOBAL_TEMP DEBUG] Periodic CSV dump started with interval {interval} seconds.")
@@ -387,7 +351,7 @@ if __name__ == "__main__":
     from app.mqtt.client import MQTTClient
 
     client = MQTTClient()
-    service = AnomalyDetectionService(mqtt_client=client, debug=True, discover_printers_timeout=10)
+    service = AnomalyDetectionService(mqtt_client=client, debug=True, discover_printers_timeout=2)
     service.start()
 
     service.periodic_csv_dump(file_path="app/persistence/save")
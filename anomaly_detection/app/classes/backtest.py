@@ -0,0 +1,322 @@
+"""
+Backtest: offline replay of recorded temperature histories through the anomaly analysis.
+
+The readings of the temperature history files written by the service (the current
+CSV file and the rotated, gzipped ones) are evaluated as AnomalyDetectionService
+would evaluate them, without MQTT and without waiting for the wall clock:
+
+- thresholds, max rates and rate detectors of a TemperatureAnalyzer built from each threshold set
+- the service hysteresis: an alert is raised on the first reading over the limit,
+  and resolved after `safe_required` consecutive safe readings
+- the rate detector of a printer restarts after `printer_ttl` seconds without
+  readings, as when the LivenessRegistry takes it offline
+
+Every source is replayed in its own process task, a rate detector config once for
+all the thresholds that share it, and the alerts are scored against the incidents
+labelled in an optional CSV file (source, sourceId, start, end).
+"""
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+import copy
+import csv
+import glob
+import gzip
+import itertools
+import json
+import os
+
+import numpy as np
+
+from app.classes.temperature_analyzer import TemperatureAnalyzer
+from app.classes.rate_detectors import make_detector
+from app.persistence.temperature_history import FIELDNAMES
+from app.persistence.temperature_ring_buffer import to_epoch
+
+# Alert types, as in the emergency commands
+OVERHEAT = "overheat"
+THERMAL_RUNAWAY = "thermal_runaway"
+
+# Readings of one source: (epoch seconds, °C), sorted by time
+Series = Tuple[np.ndarray, np.ndarray]
+
+
+def history_files(paths: Sequence[str]) -> List[str]:
+    """
+    Files to replay, oldest first: a directory gives its rotated temperature
+    histories (their suffix sorts by time) then the current file.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(glob.glob(os.path.join(glob.escape(path), "temperature_history.*.csv.gz")))
+            current = os.path.join(path, "temperature_history.csv")
+            if os.path.exists(current):
+                files.append(current)
+        else:
+            files.append(path)
+    return files
+
+
+def load_history(paths: Sequence[str]) -> Dict[Tuple[str, str], Series]:
+    """Readings of the history files by (source, sourceId). Rows that cannot be parsed are skipped."""
+    columns: Dict[Tuple[str, str], Tuple[array, array]] = {}
+    # Many sources share each second: parse a timestamp once, keep only the recent ones
+    epochs: Dict[str, float] = {}
+
+    for path in history_files(paths):
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", newline="") as f:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if header is None:
+                continue
+            try:
+                t_col, y_col, source_col, id_col = (header.index(name) for name in FIELDNAMES)
+            except ValueError:
+                raise ValueError(f"{path}: expected the columns {FIELDNAMES}, got {header}")
+
+            for row in reader:
+                try:
+                    timestamp = row[t_col]
+                    epoch = epochs.get(timestamp)
+                    if epoch is None:
+                        if len(epochs) > 4096:
+                            epochs.clear()
+                        epoch = epochs[timestamp] = to_epoch(timestamp)
+                    temperature = float(row[y_col])
+                    key = (row[source_col], row[id_col])
+                except (IndexError, ValueError):
+                    continue
+                series = columns.get(key)
+                if series is None:
+                    series = columns[key] = (array("d"), array("d"))
+                series[0].append(epoch)
+                series[1].append(temperature)
+
+    history = {}
+    for key, (timestamps, temperatures) in columns.items():
+        t = np.frombuffer(timestamps, dtype=np.float64)
+        y = np.frombuffer(temperatures, dtype=np.float64)
+        keep = ~np.isnan(t)
+        t, y = t[keep], y[keep]
+        if len(t) and np.any(np.diff(t) < 0):
+            # Files given out of order: stable, so same-second readings keep their order
+            order = np.argsort(t, kind="stable")
+            t, y = t[order], y[order]
+        history[key] = (t, y)
+    return history
+
+
+@dataclass
+class ThresholdSet:
+    """A config of anomaly_detection_config.yaml, with the grid values it was built from."""
+    name: str
+    config: dict
+    overrides: Dict[str, object] = field(default_factory=dict)
+
+    def limits(self, source: str) -> Tuple[float, float, dict]:
+        """(high, max_rate, rate detector config) of a source, as the TemperatureAnalyzer reads them."""
+        analyzer = TemperatureAnalyzer(config=self.config)
+        if source == "room":
+            return analyzer.room_max_threshold, analyzer.room_max_rate, analyzer.detector_configs["room"]
+        return analyzer.printer_max_threshold, analyzer.printer_max_rate, analyzer.detector_configs["printer"]
+
+
+def expand_grid(base_config: dict, grid: Dict[str, Sequence]) -> List[ThresholdSet]:
+    """
+    One threshold set per combination of the grid values, keys being dotted paths of the
+    config (e.g. "printer.high", "room.rate_detector.window"). A set that changes the type
+    of a rate detector only keeps the detector parameters it sets itself.
+    """
+    keys = list(grid)
+    sets = []
+    for values in itertools.product(*(grid[key] for key in keys)):
+        config = copy.deepcopy(base_config)
+        overrides = dict(zip(keys, values))
+        for section in ("room", "printer"):
+            kind = overrides.get(f"{section}.rate_detector.type")
+            base_detector = base_config[section].get("rate_detector") or {}
+            if kind is not None and kind != base_detector.get("type", "two_point"):
+                config[section]["rate_detector"] = {}
+        for key, value in overrides.items():
+            node = config
+            *parents, leaf = key.split(".")
+            for part in parents:
+                node = node.setdefault(part, {})
+            node[leaf] = value
+
+        threshold_set = ThresholdSet(name=" ".join(f"{k}={v}" for k, v in overrides.items()) or "config",
+                                     config=config, overrides=overrides)
+        # Fails before the replay on an invalid threshold set
+        for section in ("room", "printer"):
+            make_detector(threshold_set.limits(section)[2])
+        sets.append(threshold_set)
+    return sets
+
+
+def rate_series(t: np.ndarray, y: np.ndarray, detector_config: dict, reset_gap: Optional[float] = None) -> np.ndarray:
+    """Rate of every reading (°C per minute) from the source's detector, NaN while it has none."""
+    rates = np.full(len(t), np.nan)
+    starts = [0]
+    if reset_gap is not None and len(t) > 1:
+        starts += (np.flatnonzero(np.diff(t) > reset_gap) + 1).tolist()
+    for start, end in zip(starts, starts[1:] + [len(t)]):
+        update = make_detector(detector_config).update
+        rates[start:end] = [np.nan if rate is None else rate
+                            for rate in map(update, t[start:end].tolist(), y[start:end].tolist())]
+    return rates
+
+
+def hysteresis(alert: np.ndarray, safe_required: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Indices of the readings raising and resolving an alert, given which readings are
+    over the limit. Same transitions as the service's safe reading counters: after
+    its last alert reading, an alert stays active for `safe_required` safe readings.
+    """
+    index = np.arange(len(alert))
+    last_alert = np.maximum.accumulate(np.where(alert, index, -1))
+    # Last alert reading before each reading
+    previous = np.concatenate(([-1], last_alert[:-1]))
+    active = (previous >= 0) & (index - previous <= safe_required)
+    raised = np.flatnonzero(alert & ~active)
+    resolved = np.flatnonzero(~alert & (previous >= 0) & (index - previous == safe_required))
+    return raised, resolved
+
+
+def _replay_source(task):
+    """Alerts of one source for every threshold set sharing a rate detector config."""
+    t, y, detector_config, reset_gap, limits, safe_required = task
+    rates = rate_series(t, y, detector_config, reset_gap)
+    results = []
+    for set_index, high, max_rate in limits:
+        alerts = []
+        for alert_type, over in ((OVERHEAT, y > high), (THERMAL_RUNAWAY, rates > max_rate)):
+            raised, resolved = hysteresis(over, safe_required)
+            alerts.append((alert_type, t[raised], len(resolved)))
+        results.append((set_index, alerts))
+    return results
+
+
+@dataclass
+class Incident:
+    source: str
+    source_id: str
+    start: float
+    end: float
+
+
+def load_incidents(path: str) -> List[Incident]:
+    """Labelled incidents, CSV with columns source, sourceId, start and end (ISO 8601 or epoch seconds)."""
+    with open(path, newline="") as f:
+        return [Incident(row["source"], row["sourceId"], to_epoch(row["start"]), to_epoch(row["end"]))
+                for row in csv.DictReader(f)]
+
+
+@dataclass
+class BacktestResult:
+    threshold_set: ThresholdSet
+    raised: int = 0
+    overheat: int = 0
+    thermal_runaway: int = 0
+    resolved: int = 0
+    # Scored against the incidents, None without them
+    false_positives: Optional[int] = None
+    detected: Optional[int] = None
+    missed: Optional[int] = None
+    mean_time_to_detect: Optional[float] = None
+    max_time_to_detect: Optional[float] = None
+
+    def row(self) -> Dict[str, object]:
+        return {"name": self.threshold_set.name, **self.threshold_set.overrides,
+                "raised": self.raised, "overheat": self.overheat, "thermal_runaway": self.thermal_runaway,
+                "resolved": self.resolved, "false_positives": self.false_positives, "detected": self.detected,
+                "missed": self.missed, "mean_time_to_detect": self.mean_time_to_detect,
+                "max_time_to_detect": self.max_time_to_detect}
+
+
+def _score(result: BacktestResult, raises: Dict[Tuple[str, str], np.ndarray], incidents: List[Incident]):
+    """False positives: raises outside the incidents of their source. Time to detect: first raise in an incident."""
+    by_source: Dict[Tuple[str, str], List[Incident]] = {}
+    for incident in incidents:
+        by_source.setdefault((incident.source, incident.source_id), []).append(incident)
+
+    false_positives, delays = 0, []
+    for key, times in raises.items():
+        labelled = sorted(by_source.get(key, []), key=lambda i: i.start)
+        if not labelled:
+            false_positives += len(times)
+            continue
+        starts = np.array([i.start for i in labelled])
+        # Running max of the ends, so overlapping incidents still cover their union
+        ends = np.maximum.accumulate(np.array([i.end for i in labelled]))
+        covering = np.searchsorted(starts, times, side="right") - 1
+        inside = (covering >= 0) & (times <= ends[np.maximum(covering, 0)])
+        false_positives += int(np.count_nonzero(~inside))
+
+    for key, labelled in by_source.items():
+        times = raises.get(key, np.empty(0))
+        for incident in labelled:
+            first = np.searchsorted(times, incident.start, side="left")
+            if first < len(times) and times[first] <= incident.end:
+                delays.append(float(times[first] - incident.start))
+
+    result.false_positives = false_positives
+    result.detected = len(delays)
+    result.missed = len(incidents) - len(delays)
+    if delays:
+        result.mean_time_to_detect = sum(delays) / len(delays)
+        result.max_time_to_detect = max(delays)
+
+
+def run_backtest(history: Dict[Tuple[str, str], Series], threshold_sets: List[ThresholdSet],
+                 incidents: Optional[List[Incident]] = None, workers: Optional[int] = None,
+                 safe_required: int = 3, printer_ttl: Optional[float] = 90) -> List[BacktestResult]:
+    """
+    Replay the history once per rate detector config and source, across `workers`
+    processes (all the cores by default, in this process if 1), and evaluate every
+    threshold set on it.
+    """
+    limits = {source: [ts.limits(source) for ts in threshold_sets] for source in ("room", "printer")}
+    tasks = []
+    for (source, source_id), (t, y) in history.items():
+        if source not in limits:
+            continue
+        # Threshold sets sharing the detector config of this source share its rates
+        groups: Dict[str, list] = {}
+        for set_index, (high, max_rate, detector_config) in enumerate(limits[source]):
+            groups.setdefault(json.dumps(detector_config, sort_keys=True), []).append((set_index, high, max_rate))
+        for detector_json, group in groups.items():
+            reset_gap = printer_ttl if source == "printer" else None
+            tasks.append(((source, source_id), (t, y, json.loads(detector_json), reset_gap, group, safe_required)))
+    # Longest first, so the last tasks running are short ones
+    tasks.sort(key=lambda task: -len(task[1][0]))
+
+    results = [BacktestResult(threshold_set=ts) for ts in threshold_sets]
+    raises: List[Dict[Tuple[str, str], List[np.ndarray]]] = [{} for _ in threshold_sets]
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(tasks) <= 1:
+        outputs = map(_replay_source, (task for _, task in tasks))
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=min(workers, len(tasks)))
+        outputs = executor.map(_replay_source, (task for _, task in tasks))
+    try:
+        for (key, _), output in zip(tasks, outputs):
+            for set_index, alerts in output:
+                result = results[set_index]
+                for alert_type, times, resolved in alerts:
+                    result.raised += len(times)
+                    setattr(result, alert_type, getattr(result, alert_type) + len(times))
+                    result.resolved += resolved
+                    raises[set_index].setdefault(key, []).append(times)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    if incidents is not None:
+        for result, by_source in zip(results, raises):
+            _score(result, {key: np.sort(np.concatenate(times)) for key, times in by_source.items()}, incidents)
+    return results
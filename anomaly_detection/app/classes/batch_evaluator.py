@@ -0,0 +1,194 @@
+"""
+PrinterBatchEvaluator: threshold, rate and hysteresis evaluation of a batch of printer readings at once.
+"""
+from dataclasses import dataclass
+from typing import Dict, List, Sequence
+import threading
+import numpy as np
+
+from app.classes.rate_detectors import make_detector, DEFAULT_MIN_INTERVAL
+
+THRESHOLD = "Threshold Alert"
+RATE = "Rate Alert"
+
+@dataclass
+class Transition:
+    printer_id: str
+    alert_type: str         # THRESHOLD | RATE
+    action: str             # "emergency" | "resolve"
+    index: int              # position of the reading in the batch
+    value: float            # temperature (threshold) or °C per minute (rate)
+
+
+class PrinterBatchEvaluator:
+    """
+    State of every printer in a struct-of-arrays table, one row per printer:
+    the rate detector state, the hysteresis counters and whether a threshold or
+    rate alert is active. `evaluate()` takes all the readings received during a
+    batch window and updates the rows with NumPy array operations, returning only
+    the alert transitions (raise or resolve) to dispatch.
+
+    Thresholds, max rates and the rate detector come from the TemperatureAnalyzer
+    config. The two_point and ewma detectors are vectorized, the other detectors
+    are updated reading by reading with their own per-printer state.
+
+    Hysteresis is the one of AnomalyDetectionService: an alert is raised on the
+    first reading over the limit, and resolved after `safe_required` consecutive
+    safe readings.
+    """
+
+    def __init__(self, analyzer, safe_required: int = 3, capacity: int = 64):
+        self.max_threshold = analyzer.printer_max_threshold
+        self.max_rate = analyzer.printer_max_rate
+        self.detector_config = dict(analyzer.detector_configs["printer"])
+        self.detector = self.detector_config.get("type", "two_point")
+        self.alpha = self.detector_config.get("alpha", 0.3)
+        self.min_interval = self.detector_config.get("min_interval", DEFAULT_MIN_INTERVAL)
+        self.safe_required = safe_required
+
+        self._lock = threading.Lock()
+        self.rows: Dict[str, int] = {}
+        self.printer_ids: List[str] = []
+        # Scalar detectors of the printers, for the detectors that are not vectorized
+        self._detectors = {}
+        self._allocate(capacity)
+
+    def _allocate(self, capacity: int):
+        old = getattr(self, "capacity", 0)
+        self.capacity = capacity
+
+        def grow(name, dtype):
+            array = np.zeros(capacity, dtype=dtype)
+            if old:
+                array[:old] = getattr(self, name)
+            setattr(self, name, array)
+
+        # Rate detector state: EWMA (or last) temperature, anchor of the last rate, EWMA rate
+        grow("temperature", np.float64)
+        grow("anchor_t", np.float64)
+        grow("anchor_temperature", np.float64)
+        grow("rate", np.float64)
+        grow("has_temperature", bool)
+        grow("has_rate", bool)
+        # Hysteresis
+        grow("threshold_safe_count", np.int32)
+        grow("rate_safe_count", np.int32)
+        grow("threshold_active", bool)
+        grow("rate_active", bool)
+
+    def row(self, printer_id: str) -> int:
+        row = self.rows.get(printer_id)
+        if row is None:
+            row = self.rows[printer_id] = len(self.printer_ids)
+            self.printer_ids.append(printer_id)
+            if row >= self.capacity:
+                self._allocate(self.capacity * 2)
+        return row
+
+    def reset(self, printer_id: str):
+        """Restart the rate detection of a printer, e.g. back after going offline. Active alerts stay active."""
+        with self._lock:
+            row = self.rows.get(printer_id)
+            if row is not None:
+                self.has_temperature[row] = self.has_rate[row] = False
+                self.rate[row] = 0.0
+            self._detectors.pop(printer_id, None)
+
+    def evaluate(self, printer_ids: Sequence[str], timestamps: np.ndarray, temperatures: np.ndarray) -> List[Transition]:
+        """
+        Evaluate a batch of readings (epoch seconds, °C), in the order they arrived.
+        A printer with several readings in the batch gets them evaluated in order.
+        """
+        with self._lock:
+            get = self.rows.get
+            rows = [get(pid) for pid in printer_ids]
+            if None in rows:
+                rows = [self.row(pid) if row is None else row for pid, row in zip(printer_ids, rows)]
+            rows = np.array(rows, dtype=np.int64)
+            timestamps = np.asarray(timestamps, dtype=np.float64)
+            temperatures = np.asarray(temperatures, dtype=np.float64)
+
+            # Round k holds the k-th reading of each printer in the batch: rows are unique within a round
+            order = np.argsort(rows, kind="stable")
+            sorted_rows = rows[order]
+            starts = np.r_[0, np.flatnonzero(np.diff(sorted_rows)) + 1]
+            occurrence = np.empty(len(rows), dtype=np.int64)
+            occurrence[order] = np.arange(len(rows)) - np.repeat(starts, np.diff(np.r_[starts, len(rows)]))
+
+            transitions = []
+            for k in range(int(occurrence.max()) + 1 if len(rows) else 0):
+                indices = np.flatnonzero(occurrence == k)
+                transitions += self._evaluate_round(indices, rows[indices], timestamps[indices],
+                                                    temperatures[indices], printer_ids)
+            return transitions
+
+    def _evaluate_round(self, indices, rows, t, y, printer_ids) -> List[Transition]:
+        threshold_alert = y > self.max_threshold
+        rate, valid = self._update_rate(rows, t, y, printer_ids, indices)
+        rate_alert = valid & (rate > self.max_rate)
+
+        transitions = []
+        for alert, counts, active, alert_type, values in (
+                (threshold_alert, self.threshold_safe_count, self.threshold_active, THRESHOLD, y),
+                (rate_alert, self.rate_safe_count, self.rate_active, RATE, rate)):
+            # Safe readings count up, an alert resets the count
+            counts[rows] = np.where(alert, 0, counts[rows] + 1)
+            raised = alert & ~active[rows]
+            # As in the service: every safe_required safe readings resolve what is active and restart the count
+            due = counts[rows] >= self.safe_required
+            resolved = due & active[rows]
+            counts[rows[due]] = 0
+            active[rows[raised]] = True
+            active[rows[resolved]] = False
+
+            for i in np.flatnonzero(raised):
+                transitions.append(Transition(printer_ids[indices[i]], alert_type, "emergency", int(indices[i]), float(values[i])))
+            for i in np.flatnonzero(resolved):
+                transitions.append(Transition(printer_ids[indices[i]], alert_type, "resolve", int(indices[i]), float(values[i])))
+        return transitions
+
+    def _update_rate(self, rows, t, y, printer_ids, indices):
+        """Rates in °C per minute of a round and whether each one is defined."""
+        new = ~self.has_temperature[rows]
+        if self.detector == "ewma":
+            smoothed = np.where(new, y, self.temperature[rows] + self.alpha * (y - self.temperature[rows]))
+        elif self.detector == "two_point":
+            smoothed = y
+        else:
+            return self._update_rate_scalar(t, y, printer_ids, indices)
+
+        anchor_t = np.where(new, t, self.anchor_t[rows])
+        anchor_temperature = np.where(new, smoothed, self.anchor_temperature[rows])
+        dt = t - anchor_t
+        updated = ~new & (dt >= self.min_interval)
+        rate = (smoothed - anchor_temperature) / np.where(updated, dt, 1.0) * 60
+
+        if self.detector == "ewma":
+            has_rate = self.has_rate[rows]
+            rate = np.where(updated & has_rate, self.rate[rows] + self.alpha * (rate - self.rate[rows]), rate)
+            rate = np.where(updated, rate, self.rate[rows])
+            valid = ~new & (updated | has_rate)
+            # The EWMA temperature moves with every reading
+            self.temperature[rows] = smoothed
+        else:
+            valid = updated
+
+        self.rate[rows] = rate
+        self.has_rate[rows] |= updated
+        self.anchor_t[rows] = np.where(updated | new, t, anchor_t)
+        self.anchor_temperature[rows] = np.where(updated | new, smoothed, anchor_temperature)
+        self.has_temperature[rows] = True
+        return rate, valid
+
+    def _update_rate_scalar(self, t, y, printer_ids, indices):
+        rate = np.zeros(len(indices))
+        valid = np.zeros(len(indices), dtype=bool)
+        for i, index in enumerate(indices):
+            printer_id = printer_ids[index]
+            detector = self._detectors.get(printer_id)
+            if detector is None:
+                detector = self._detectors[printer_id] = make_detector(self.detector_config)
+            value = detector.update(float(t[i]), float(y[i]))
+            if value is not None:
+                rate[i], valid[i] = value, True
+        return rate, valid
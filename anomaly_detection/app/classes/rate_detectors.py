@@ -0,0 +1,175 @@
+"""
+Rate detectors: incremental per-source state deciding the rate (thermal runaway) alerts.
+
+Each detector gets the readings of one source (epoch seconds, temperature) and
+updates in O(1). `update()` returns the detected rise in °C per minute, or None
+while the detector has not seen enough readings to decide.
+"""
+from collections import deque
+import math
+
+# Readings closer than this (seconds) do not give a rate: timestamps have a
+# one-second resolution, two readings in the same second would give an infinite one
+DEFAULT_MIN_INTERVAL = 0.5
+
+
+class TwoPointDetector:
+    """Rate between the last two readings at least `min_interval` seconds apart."""
+
+    name = "two_point"
+
+    def __init__(self, min_interval: float = DEFAULT_MIN_INTERVAL):
+        self.min_interval = min_interval
+        self.prev = None
+
+    def update(self, t: float, temperature: float):
+        if self.prev is None:
+            self.prev = (t, temperature)
+            return None
+        prev_t, prev_temperature = self.prev
+        if t - prev_t < self.min_interval:
+            # Too close: compared with the same anchor at the next reading
+            return None
+        self.prev = (t, temperature)
+        return (temperature - prev_temperature) / (t - prev_t) * 60
+
+
+class EwmaDetector:
+    """
+    Exponentially weighted moving averages of the temperature and of its rate:
+    single noisy steps are smoothed out, a sustained rise is not.
+    """
+
+    name = "ewma"
+
+    def __init__(self, alpha: float = 0.3, min_interval: float = DEFAULT_MIN_INTERVAL):
+        self.alpha = alpha
+        self.min_interval = min_interval
+        self.temperature = None     # EWMA of the temperature
+        self.rate = None            # EWMA of the rate, °C per minute
+        # Time of the last rate update and the temperature EWMA then
+        self.anchor = None
+
+    def update(self, t: float, temperature: float):
+        if self.temperature is None:
+            self.temperature = temperature
+            self.anchor = (t, temperature)
+            return None
+        self.temperature += self.alpha * (temperature - self.temperature)
+        anchor_t, anchor_temperature = self.anchor
+        if t - anchor_t < self.min_interval:
+            return self.rate
+        rate = (self.temperature - anchor_temperature) / (t - anchor_t) * 60
+        self.anchor = (t, self.temperature)
+        self.rate = rate if self.rate is None else self.rate + self.alpha * (rate - self.rate)
+        return self.rate
+
+
+class SlopeDetector:
+    """
+    Least-squares slope of the readings of the last `window` seconds, from running
+    sums updated as readings enter and leave the window.
+    """
+
+    name = "slope"
+
+    def __init__(self, window: float = 30, min_points: int = 3):
+        self.window = window
+        self.min_points = min_points
+        self.points = deque()
+        # Times are taken relative to t0, moved forward now and then, so the sums
+        # keep their precision however long the source runs
+        self.t0 = None
+        self.n = 0
+        self.sum_t = self.sum_y = self.sum_tt = self.sum_ty = 0.0
+
+    def _add(self, t, y, sign):
+        t -= self.t0
+        self.n += sign
+        self.sum_t += sign * t
+        self.sum_y += sign * y
+        self.sum_tt += sign * t * t
+        self.sum_ty += sign * t * y
+
+    def update(self, t: float, temperature: float):
+        if self.t0 is None or t - self.t0 > 100 * self.window:
+            # Rebase on the oldest reading in the window (amortized O(1))
+            self.t0 = self.points[0][0] if self.points else t
+            self.n = 0
+            self.sum_t = self.sum_y = self.sum_tt = self.sum_ty = 0.0
+            for pt, py in self.points:
+                self._add(pt, py, 1)
+        self.points.append((t, temperature))
+        self._add(t, temperature, 1)
+        while self.points and self.points[0][0] < t - self.window:
+            old_t, old_y = self.points.popleft()
+            self._add(old_t, old_y, -1)
+
+        if self.n < self.min_points:
+            return None
+        denominator = self.n * self.sum_tt - self.sum_t * self.sum_t
+        # Readings spread over less than a second do not give a slope
+        if denominator <= self.n * self.n * 0.25:
+            return None
+        return (self.n * self.sum_ty - self.sum_t * self.sum_y) / denominator * 60
+
+
+class ZScoreDetector:
+    """
+    Rate of the readings (two-point) scored against a baseline learned with
+    exponentially weighted mean and variance. Returns the rate when it is more
+    than `limit` standard deviations above the baseline and 0 otherwise, so it
+    is compared with the same max rate as the other detectors. Anomalous rates
+    are not learned into the baseline.
+    """
+
+    name = "zscore"
+
+    def __init__(self, limit: float = 4.0, alpha: float = 0.05, warmup: int = 30,
+                 min_interval: float = DEFAULT_MIN_INTERVAL):
+        self.limit = limit
+        self.alpha = alpha
+        self.warmup = warmup
+        self.rates = TwoPointDetector(min_interval)
+        self.mean = 0.0
+        self.var = 0.0
+        self.count = 0
+        self.z = 0.0
+
+    def update(self, t: float, temperature: float):
+        rate = self.rates.update(t, temperature)
+        if rate is None:
+            return None
+        if self.count < self.warmup:
+            self._learn(rate)
+            return None
+        std = math.sqrt(self.var)
+        self.z = (rate - self.mean) / std if std > 1e-9 else 0.0
+        if self.z > self.limit:
+            return rate
+        self._learn(rate)
+        return 0.0
+
+    def _learn(self, rate: float):
+        self.count += 1
+        if self.count == 1:
+            self.mean = rate
+            return
+        diff = rate - self.mean
+        self.mean += self.alpha * diff
+        self.var = (1 - self.alpha) * (self.var + self.alpha * diff * diff)
+
+
+DETECTORS = {d.name: d for d in (TwoPointDetector, EwmaDetector, SlopeDetector, ZScoreDetector)}
+
+
+def make_detector(config: dict):
+    """
+    Detector from a config section, e.g. {"type": "slope", "window": 30}: the other
+    keys are the detector's parameters.
+    """
+    config = dict(config or {})
+    kind = config.pop("type", "two_point")
+    if kind not in DETECTORS:
+        raise ValueError(f"Unknown rate detector '{kind}', expected one of {sorted(DETECTORS)}")
+    return DETECTORS[kind](**config)
@@ -1,18 +1,21 @@
 from app.dto.temperature_reading_room_dto import TemperatureReadingRoomDTO
 from app.dto.temperature_reading_printer_dto import TemperatureReadingPrinterDTO
 import yaml
+import math
 import os
 from app.models.emergency_model import EmergencyAlert
+from app.classes.rate_detectors import make_detector, DEFAULT_MIN_INTERVAL
+from app.persistence.temperature_ring_buffer import to_epoch
 from datetime import datetime
 
 # input: TemperatureReadingPrinterDTO or TemperatureReadingRoomDTO
 #       - for thresholds: 1 value
-#       - for rate: 2 values
+#       - for rate: 2 values (check_rate), or the readings of the source one at a time (observe_rate)
 #
 # output: EmergencyAlert (internal data model) or None
 
 class TemperatureAnalyzer:
-    def __init__(self, config_path: str = 'app/anomaly_detection_config.yaml', debug: bool = False):
+    def __init__(self, config_path: str = 'app/anomaly_detection_config.yaml', debug: bool = False, config: dict | None = None):
         
         self.debug = debug
 
@@ -21,23 +24,32 @@ class TemperatureAnalyzer:
         self.printer_max_rate = 100
         self.room_max_rate = 10
 
-        # Load thresholds from YAML config if provided
-        self.thresholds = self._load_thresholds_from_yaml(config_path)
+        # Load thresholds from YAML config, or from a config already loaded (e.g. a backtest threshold set)
+        if config is not None:
+            self.thresholds = self._validate_thresholds(config)
+        else:
+            self.thresholds = self._load_thresholds_from_yaml(config_path)
+        self.room_max_threshold = self.thresholds['room']['high']
+        self.printer_max_threshold = self.thresholds['printer']['high']
+        self.room_max_rate = self.thresholds['room'].get('max_rate', self.room_max_rate)
+        self.printer_max_rate = self.thresholds['printer'].get('max_rate', self.printer_max_rate)
+
+        # Rate detector of each source, from the rate_detector section of room and printer
+        self.detector_configs = {
+            section: self.thresholds[section].get('rate_detector') or {"type": "two_point"}
+            for section in ('room', 'printer')
+        }
+        for section, detector_config in self.detector_configs.items():
+            # Fails at startup on an invalid detector config
+            make_detector(detector_config)
+        self._detectors = {}
 
 
     def _load_thresholds_from_yaml(self, path: str):
         if os.path.exists(path):
             with open(path, 'r') as f:
                 try:
-                    config = yaml.safe_load(f)
-                    # Validate config structure
-                    for section in ['room', 'printer']:
-                        if section not in config:
-                            raise ValueError(f"Missing '{section}' section in config")
-                        if 'high' not in config[section]:
-                            raise ValueError(f"Missing 'high' in '{section}' section")
-                        if not isinstance(config[section]['high'], (int, float)):
-                            raise ValueError(f"'high' in '{section}' must be numeric")
+                    config = self._validate_thresholds(yaml.safe_load(f))
                     
                     if self.debug:
                         print(f"[TEMP_ANALYZER DEBUG] Loaded thresholds from {path}: {config}")
@@ -46,6 +58,18 @@ class TemperatureAnalyzer:
                     raise ValueError(f"Invalid config file: {e}")
         raise FileNotFoundError(f"Config file not found: {path}")
 
+    @staticmethod
+    def _validate_thresholds(config: dict) -> dict:
+        # Validate config structure
+        for section in ['room', 'printer']:
+            if section not in config:
+                raise ValueError(f"Missing '{section}' section in config")
+            if 'high' not in config[section]:
+                raise ValueError(f"Missing 'high' in '{section}' section")
+            if not isinstance(config[section]['high'], (int, float)):
+                raise ValueError(f"'high' in '{section}' must be numeric")
+        return config
+
     def check_thresholds(self, reading: TemperatureReadingPrinterDTO | TemperatureReadingRoomDTO) -> EmergencyAlert | None:
         # Check if reading exceeds thresholds
         if isinstance(reading, TemperatureReadingPrinterDTO):
@@ -100,8 +124,10 @@ class TemperatureAnalyzer:
             prev_time = _parse_timestamp(reading_prev.timestamp)
             curr_time = _parse_timestamp(reading_curr.timestamp)
             delta_time = abs(curr_time - prev_time)
-            rate_per_second = delta_temp / delta_time if delta_time > 0 else float('inf')
-            rate_per_minute = rate_per_second * 60
+            if delta_time < DEFAULT_MIN_INTERVAL:
+                # Same-second readings: no meaningful rate (it used to be infinite)
+                return None
+            rate_per_minute = delta_temp / delta_time * 60
 
             if self.debug:
                 print(f"[TEMP_ANALYZER DEBUG] Detected: printer rate per minute {rate_per_minute} with delta_temp {delta_temp} and delta_time {delta_time}")
@@ -129,8 +155,10 @@ class TemperatureAnalyzer:
             prev_time = _parse_timestamp(reading_prev.timestamp)
             curr_time = _parse_timestamp(reading_curr.timestamp)
             delta_time = abs(curr_time - prev_time)
-            rate_per_second = delta_temp / delta_time if delta_time > 0 else float('inf')
-            rate_per_minute = rate_per_second * 60
+            if delta_time < DEFAULT_MIN_INTERVAL:
+                # Same-second readings: no meaningful rate (it used to be infinite)
+                return None
+            rate_per_minute = delta_temp / delta_time * 60
 
             if self.debug:
                 print(f"[TEMP_ANALYZER DEBUG] Detected: room rate per minute {rate_per_minute} with delta_temp {delta_temp} and delta_time {delta_time}")
@@ -159,6 +187,49 @@ class TemperatureAnalyzer:
 
         return None
 
+    def observe_rate(self, reading: TemperatureReadingPrinterDTO | TemperatureReadingRoomDTO) -> EmergencyAlert | None:
+        """
+        Feed a reading to the rate detector of its source (selected in the config), O(1) per reading.
+        Returns a rate alert if the detected rise exceeds the source's max rate (°C per minute).
+        """
+        if isinstance(reading, TemperatureReadingPrinterDTO):
+            source, source_id, max_rate = "printer", reading.printerId, self.printer_max_rate
+        elif isinstance(reading, TemperatureReadingRoomDTO):
+            source, source_id, max_rate = "room", reading.sensorId, self.room_max_rate
+        else:
+            raise TypeError("Invalid reading type. Expected TemperatureReadingPrinterDTO or TemperatureReadingRoomDTO.")
+
+        detector = self._detectors.get((source, source_id))
+        if detector is None:
+            detector = self._detectors[(source, source_id)] = make_detector(self.detector_configs[source])
+
+        # The timestamp is parsed once, the detector keeps epoch seconds
+        t = to_epoch(reading.timestamp)
+        try:
+            temperature = float(reading.temperature)
+        except (TypeError, ValueError):
+            temperature = float("nan")
+        if not (math.isfinite(t) and math.isfinite(temperature)):
+            # A NaN would stay in the detector state and disable it until restart
+            print(f"[TEMP_ANALYZER ERROR] Skipped reading of {source} {source_id} in the rate detector: "
+                  f"timestamp {reading.timestamp!r}, temperature {reading.temperature!r}")
+            return None
+        rate_per_minute = detector.update(t, temperature)
+        if rate_per_minute is None or not rate_per_minute > max_rate:
+            return None
+
+        if self.debug:
+            print(f"[TEMP_ANALYZER DEBUG] Rate alert generated for {source} {source_id} ({detector.name}): "
+                  f"{rate_per_minute} > {max_rate}")
+        return EmergencyAlert(
+            alert_id=f"rate_{source}_{source_id}_{reading.timestamp}",
+            source=source,
+            source_id=source_id,
+            alert_type="rate_exceeded",
+            timestamp=reading.timestamp,
+            details={"rate per minute": rate_per_minute, "detector": detector.name}
+        )
+
 def _parse_timestamp(ts):
     # Handles ISO 8601 and float timestamps
     if isinstance(ts, (float, int)):
@@ -12,7 +12,12 @@ def main():
     debug_alerts = str2bool(os.getenv("DEBUG_ALERTS", "False"))
     debug_analysis = str2bool(os.getenv("DEBUG_ANALYSIS", "False"))
     debug_service = str2bool(os.getenv("DEBUG", "False"))
-    timer_hear = int(os.getenv("timer_hear", "60"))
+    timer_hear = int(os.getenv("timer_hear", "2"))
+    printer_ttl = float(os.getenv("PRINTER_TTL", "90"))
+    batch_window = float(os.getenv("BATCH_WINDOW_MS", "50")) / 1000
+    emergency_workers = int(os.getenv("EMERGENCY_WORKERS", "2"))
+    history_capacity = int(os.getenv("HISTORY_CAPACITY", "86400"))
+    alert_retention = int(os.getenv("ALERT_RETENTION", "1000"))
 
     client = MQTTClient(debug=debug_communication) # let communication with the broker
 
@@ -20,7 +25,12 @@ def main():
                                       debug_service=debug_service,
                                       debug_alerts=debug_alerts,
                                       debug_analysis=debug_analysis,
-                                      discover_printers_timeout=timer_hear)
+                                      discover_printers_timeout=timer_hear,
+                                      printer_ttl=printer_ttl,
+                                      batch_window=batch_window,
+                                      emergency_workers=emergency_workers,
+                                      history_capacity=history_capacity,
+                                      alert_retention=alert_retention)
     
     service.start()
 
@@ -33,6 +43,9 @@ def main():
             time.sleep(1)
     except KeyboardInterrupt:
         print("Service stopped by user.")
+        # Publish the emergency commands still queued before disconnecting
+        service.emergency_queue.stop()
+        print(f"[ANOMALY_DETECTION] Emergency queue: {service.emergency_queue.metrics()}")
         service.mqtt_client.loop_stop()
 
 if __name__ == "__main__":
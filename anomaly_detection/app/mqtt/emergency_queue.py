@@ -0,0 +1,192 @@
+"""
+EmergencyQueue: Bounded queue of emergency commands, published by a small pool of worker threads.
+"""
+from collections import deque
+from typing import Dict, Optional, Set, Tuple
+import threading
+import time
+
+EMERGENCY = "emergency"
+RESOLVE = "resolve"
+
+# (action, type, source, id)
+Command = Tuple[str, str, str, str]
+
+
+class EmergencyQueue:
+    """
+    Emergency and resolve commands wait here for one of `workers` threads, each
+    publish blocking on the QoS 2 round trip.
+
+    - A command already waiting in the queue is not queued again (coalesced).
+    - Emergencies are published before resolves.
+    - A command waits while another command for the same target (type, source, id)
+      is being published, and a resolve while an emergency for it is queued, so the
+      fan controller never gets them swapped.
+    - An emergency cancels a resolve still queued for the same target: the alert
+      was raised again, the fan controller must stay in emergency.
+    - At most `maxsize` commands wait: a new emergency replaces the oldest resolve,
+      otherwise the new command is dropped.
+    """
+
+    def __init__(self, publisher, workers: int = 2, maxsize: int = 1000, debug: bool = False):
+        self.publisher = publisher
+        self.workers = workers
+        self.maxsize = maxsize
+        self.debug = debug
+
+        self._cond = threading.Condition()
+        self._emergencies: deque = deque()      # (command, enqueued_at)
+        self._resolves: deque = deque()
+        self._queued: Dict[Command, float] = {}
+        # Targets with a command (emergency or resolve) being published
+        self._publishing: Set[Tuple[str, str, str]] = set()
+        self._threads = []
+        self._stopped = False
+
+        self.counters = {"submitted": 0, "coalesced": 0, "cancelled": 0, "dropped": 0, "published": 0, "failed": 0}
+        # Submit-to-published seconds of the last commands
+        self._latencies: deque = deque(maxlen=1000)
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"emergency-publisher-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0):
+        """Publish what is queued (waiting at most `timeout` seconds), then stop the workers."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._queued and time.monotonic() < deadline:
+                self._cond.wait(deadline - time.monotonic())
+            self._stopped = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        self._threads = []
+
+    def submit(self, action: str, type_: str, source: str, id_: str) -> bool:
+        """Queue a command, returns False if it was coalesced or dropped."""
+        command = (action, type_, source, id_)
+        with self._cond:
+            self.counters["submitted"] += 1
+            if action == EMERGENCY:
+                # Before coalescing: emergency, resolve, emergency must not end on the resolve
+                resolve = (RESOLVE, type_, source, id_)
+                if resolve in self._queued:
+                    self._remove(self._resolves, resolve)
+                    self.counters["cancelled"] += 1
+            if command in self._queued:
+                self.counters["coalesced"] += 1
+                return False
+
+            if len(self._queued) >= self.maxsize:
+                if action == EMERGENCY and self._resolves:
+                    oldest, _ = self._resolves.popleft()
+                    del self._queued[oldest]
+                else:
+                    self.counters["dropped"] += 1
+                    print(f"[EMERGENCY_QUEUE ERROR] Queue full ({self.maxsize}), dropped {command}")
+                    return False
+
+            now = time.monotonic()
+            self._queued[command] = now
+            (self._emergencies if action == EMERGENCY else self._resolves).append((command, now))
+            self._cond.notify()
+            return True
+
+    def _remove(self, queue: deque, command: Command):
+        for i, (queued, _) in enumerate(queue):
+            if queued == command:
+                del queue[i]
+                break
+        del self._queued[command]
+
+    def _next(self) -> Optional[Tuple[Command, float]]:
+        # Called with the lock held: the oldest emergency, else the oldest resolve,
+        # whose target has no command being published
+        for queue in (self._emergencies, self._resolves):
+            for i, (command, enqueued_at) in enumerate(queue):
+                if command[1:] not in self._publishing:
+                    del queue[i]
+                    del self._queued[command]
+                    self._publishing.add(command[1:])
+                    return command, enqueued_at
+        return None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                item = self._next()
+                while item is None:
+                    if self._stopped:
+                        return
+                    self._cond.wait()
+                    item = self._next()
+
+            (action, type_, source, id_), enqueued_at = item
+            try:
+                self.publisher.publish_emergency_command(action, type_, source, id_)
+                published = True
+            except Exception as e:
+                published = False
+                print(f"[EMERGENCY_QUEUE ERROR] Could not publish {action} {type_} for {source} {id_}: {e}")
+
+            with self._cond:
+                self.counters["published" if published else "failed"] += 1
+                self._latencies.append(time.monotonic() - enqueued_at)
+                self._publishing.discard((type_, source, id_))
+                # Wakes up workers waiting on a held command and stop()
+                self._cond.notify_all()
+            if self.debug:
+                print(f"[EMERGENCY_QUEUE DEBUG] Published {action} {type_} for {source} {id_} "
+                      f"in {(time.monotonic() - enqueued_at) * 1000:.1f} ms")
+
+    def metrics(self) -> dict:
+        """Queue depth, counters and publish latency (ms, from submit to published) of the last commands."""
+        with self._cond:
+            latencies = sorted(self._latencies)
+            metrics = {"depth": len(self._queued), "emergencies": len(self._emergencies),
+                       "resolves": len(self._resolves), **self.counters}
+        if latencies:
+            metrics["latency_ms"] = {
+                "avg": sum(latencies) / len(latencies) * 1000,
+                "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+                "max": latencies[-1] * 1000,
+            }
+        return metrics
+
+
+if __name__ == "__main__":
+    # Example usage for testing
+    #
+    # From anomaly_detection directory:
+    #    python3 -m app.mqtt.emergency_queue
+    #
+    class SlowPublisher:
+        """Stands in for MQTTPublisher: a QoS 2 round trip of 50 ms."""
+        def publish_emergency_command(self, action, type_, source, id_):
+            time.sleep(0.05)
+            print(f"published {action} {type_} {source} {id_}")
+
+    queue = EmergencyQueue(SlowPublisher(), workers=2)
+    queue.start()
+    for printer in range(5):
+        queue.submit(RESOLVE, "overheat", "printer", f"printer{printer}")
+    for printer in range(5):
+        # Duplicates are coalesced, the queued resolves are cancelled
+        queue.submit(EMERGENCY, "overheat", "printer", f"printer{printer}")
+        queue.submit(EMERGENCY, "overheat", "printer", f"printer{printer}")
+    queue.submit(RESOLVE, "overheat", "printer", "printer0")
+    queue.stop()
+    print(queue.metrics())
+
+    # A resolve being published holds back the emergency raised meanwhile: resolve, then emergency
+    queue = EmergencyQueue(SlowPublisher(), workers=2)
+    queue.start()
+    queue.submit(RESOLVE, "overheat", "printer", "printer9")
+    time.sleep(0.02)
+    queue.submit(EMERGENCY, "overheat", "printer", "printer9")
+    queue.stop()
+    print(queue.metrics())
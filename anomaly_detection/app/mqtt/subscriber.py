@@ -1,6 +1,7 @@
 import json
 from app.dto.temperature_reading_room_dto import TemperatureReadingRoomDTO
 from app.dto.temperature_reading_printer_dto import TemperatureReadingPrinterDTO
+from app.dto.printer_announce_dto import PrinterAnnounceDTO
 
 class MQTTSubscriber:
     def __init__(self, mqtt_client):
@@ -44,6 +45,27 @@ class MQTTSubscriber:
             callback(client, userdata, dto)
         self.mqtt_client.subscribe(topic, dto_callback, qos=1)
 
+    def subscribe_printer_announce(self, callback):
+        """
+        Subscribes to printer announces (retained, last will "offline").
+        Topic: device/printer/all printers/announce
+        Type: PrinterAnnounceDTO
+        QoS: 1
+        """
+        topic = "device/printer/+/announce"
+        def dto_callback(client, userdata, message):
+            if not message.payload:
+                # Retained announce cleared (printer removed)
+                return
+            payload = json.loads(message.payload.decode())
+            dto = PrinterAnnounceDTO(
+                printerId=payload.get("printerId"),
+                status=payload.get("status"),
+                timestamp=payload.get("timestamp")
+            )
+            callback(client, userdata, dto)
+        self.mqtt_client.subscribe(topic, dto_callback, qos=1)
+
 if __name__ == "__main__":
     # Example usage for testing
     #
@@ -1,25 +1,57 @@
 """
 AlertHistory: Stores and manages all triggered emergency alerts.
 """
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
+from collections import deque
 import threading
 import csv
 from datetime import datetime
 from app.models.emergency_model import EmergencyAlert
+from app.persistence.history_sink import HistorySink
 import os
 
+FIELDNAMES = ["alert_id", "timestamp", "source", "source_id", "alert_type", "resolved", "details"]
+
 class AlertHistory:
-    def __init__(self, debug: bool = False):
+    """
+    Active alerts are indexed by (alert_type, source, source_id), at most one per key,
+    so deduplicating, looking up and resolving an alert costs O(1) however long the
+    service has been running. Resolved alerts are kept in a bounded archive: when it
+    holds `max_resolved` alerts the oldest half is dropped from memory. With a sink
+    attached they are already in its history; without one they are appended to
+    `archive_path` (CSV) first.
+    """
+
+    def __init__(self, debug: bool = False, max_resolved: int = 1000, archive_path: Optional[str] = None):
         
         # Thread-safe storage for emergency alerts
         self._lock = threading.RLock()
 
-        # Store all emergency alerts
-        self.alerts: List[EmergencyAlert] = []
+        # Active alerts by (alert_type, source, source_id), in the order they were raised
+        self._active: Dict[Tuple[str, str, str], EmergencyAlert] = {}
+        # Resolved alerts still in memory, oldest first
+        self._resolved: deque = deque()
+        # Every alert in memory by alert_id
+        self._by_id: Dict[str, EmergencyAlert] = {}
+
+        self.max_resolved = max_resolved
+        self.archive_path = archive_path
+
+        # Optional sink the alerts are streamed to when raised and when resolved
+        self.sink: Optional[HistorySink] = None
 
         # Debug mode
         self.debug = debug
-    
+
+    @staticmethod
+    def _key(alert_type: str, source: str, source_id: str) -> Tuple[str, str, str]:
+        return (alert_type, source, source_id)
+
+    @property
+    def alerts(self) -> List[EmergencyAlert]:
+        """Alerts in memory: the resolved ones still kept, then the active ones."""
+        with self._lock:
+            return list(self._resolved) + list(self._active.values())
 
     def add_alert(self, alert: EmergencyAlert) -> bool:
         """
@@ -27,56 +59,95 @@ class AlertHistory:
         Only adds if there is no unresolved alert with the same type, source, and source_id.
         Returns True if added, False if duplicate.
         """
+        key = self._key(alert.alert_type, alert.source, alert.source_id)
         with self._lock:
-            for existing in self.alerts:
-                if (
-                    existing.alert_type == alert.alert_type and
-                    existing.source == alert.source and
-                    existing.source_id == alert.source_id and
-                    not existing.resolved
-                ):
-                    if self.debug:
-                        print(f"[ALERT_HISTORY DEBUG] Duplicate active alert not added: {alert.alert_id}")
-                    return False  # Duplicate, not added
-
-            self.alerts.append(alert)
+            if key in self._active:
+                if self.debug:
+                    print(f"[ALERT_HISTORY DEBUG] Duplicate active alert not added: {alert.alert_id}")
+                return False  # Duplicate, not added
+
+            if alert.resolved:
+                self._archive(alert)
+            else:
+                self._active[key] = alert
+            self._by_id[alert.alert_id] = alert
+            self._stream(alert)
             if self.debug:
                 print(f"[ALERT_HISTORY DEBUG] Added alert: {alert.alert_id}")
             return True
 
     def resolve_alert(self, alert_id: str):
         with self._lock:
-            for alert in self.alerts:
-                if alert.alert_id == alert_id:
-                    alert.mark_resolved()
+            alert = self._by_id.get(alert_id)
+            if alert is not None:
+                if alert.is_active():
+                    self._resolve(alert)
 
-                    if self.debug:
-                        print(f"[ALERT_HISTORY DEBUG] Resolved alert: {alert_id}")
+                if self.debug:
+                    print(f"[ALERT_HISTORY DEBUG] Resolved alert: {alert_id}")
 
-                    return True
+                return True
             
             if self.debug:
                 print(f"[ALERT_HISTORY DEBUG] Alert not found for resolution: {alert_id}")
 
             return False
 
-    def clear(self):
+    def resolve_active(self, alert_type: str, source: str, source_id: str) -> Optional[EmergencyAlert]:
+        """Resolve the active alert of the given type and source, returns it (None if there was none)."""
         with self._lock:
-            self.alerts.clear()
+            alert = self._active.get(self._key(alert_type, source, source_id))
+            if alert is None:
+                return None
+            self._resolve(alert)
+            if self.debug:
+                print(f"[ALERT_HISTORY DEBUG] Resolved alert: {alert.alert_id}")
+            return alert
+
+    def _resolve(self, alert: EmergencyAlert):
+        del self._active[self._key(alert.alert_type, alert.source, alert.source_id)]
+        alert.mark_resolved()
+        self._stream(alert)
+        self._archive(alert)
+
+    def _stream(self, alert: EmergencyAlert):
+        if self.sink is not None:
+            self.sink.append((alert.alert_id, alert.timestamp, alert.source, alert.source_id, alert.alert_type,
+                              alert.resolved, str(alert.details) if alert.details else ""))
+
+    def _archive(self, alert: EmergencyAlert):
+        self._resolved.append(alert)
+        if len(self._resolved) >= self.max_resolved:
+            # Spilling half at a time keeps the cost O(1) per resolved alert
+            spilled = [self._resolved.popleft() for _ in range(max(1, self.max_resolved // 2))]
+            for old in spilled:
+                if self._by_id.get(old.alert_id) is old:
+                    del self._by_id[old.alert_id]
+            # The sink streamed them when raised and resolved, archiving them again would duplicate its rows
+            archive_path = self.archive_path if self.sink is None else None
+            if archive_path:
+                self._write_rows(archive_path, spilled)
+            if self.debug:
+                print(f"[ALERT_HISTORY DEBUG] Archived {len(spilled)} resolved alerts"
+                      f"{' to ' + archive_path if archive_path else ''}")
 
-    def csv_dump(self, file_path: str):
-        """Dump the alert history to a CSV file."""
+    def clear(self):
+        with self._lock:
+            self._active.clear()
+            self._resolved.clear()
+            self._by_id.clear()
 
+    @staticmethod
+    def _write_rows(file_path: str, alerts: List[EmergencyAlert], mode: str = "a"):
         # Ensure the directory exists
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
 
         # Write to CSV file
-        with open(file_path, mode="a", newline="") as csvfile:
-            fieldnames = ["alert_id", "timestamp", "source", "source_id", "alert_type", "resolved", "details"]
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            if os.path.getsize(file_path) == 0:
+        with open(file_path, mode=mode, newline="") as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES)
+            if csvfile.tell() == 0:
                 writer.writeheader()
-            for alert in self.alerts:
+            for alert in alerts:
                 writer.writerow({
                     "alert_id": alert.alert_id,
                     "timestamp": alert.timestamp,
@@ -86,6 +157,10 @@ class AlertHistory:
                     "resolved": alert.resolved,
                     "details": str(alert.details) if alert.details else ""
                 })
+
+    def csv_dump(self, file_path: str):
+        """Write the alerts in memory to a CSV file, overwriting it (the periodic history is streamed through the sink)."""
+        self._write_rows(file_path, self.alerts, mode="w")
     
 
     # Retrieval methods
@@ -98,9 +173,13 @@ class AlertHistory:
                 return filtered[-1]
             return None
 
+    def get_active_alert(self, alert_type: str, source: str, source_id: str) -> Optional[EmergencyAlert]:
+        with self._lock:
+            return self._active.get(self._key(alert_type, source, source_id))
+
     def get_unresolved_alerts(self) -> List[EmergencyAlert]:
         with self._lock:
-            return [a for a in self.alerts if a.is_active()]
+            return list(self._active.values())
         
 
 
@@ -1,88 +1,137 @@
 """
 TemperatureHistory: Stores and manages all received temperature readings (room and printers).
 """
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from app.dto.temperature_reading_room_dto import TemperatureReadingRoomDTO
 from app.dto.temperature_reading_printer_dto import TemperatureReadingPrinterDTO
+from app.persistence.temperature_ring_buffer import TemperatureRingBuffer, to_epoch, to_iso
+from app.persistence.history_sink import HistorySink
 import threading
 import csv
 from datetime import datetime, timedelta
 
+# Readings kept per source: one day at one reading per second, about 1 MB
+DEFAULT_CAPACITY = 86400
+
+FIELDNAMES = ["timestamp", "temperature", "source", "sourceId"]
+
 
 class TemperatureHistory:
-    def __init__(self, printer_ids: List[str], debug: bool = True):
+    def __init__(self, printer_ids: List[str], debug: bool = True, capacity: int = DEFAULT_CAPACITY):
         # Thread-safe storage for temperature readings
         self._lock = threading.RLock()
 
-        # Store room and printer readings
-        # Using lists to maintain order of readings
-        self.room_readings: List[TemperatureReadingRoomDTO] = []
-        self.printer_readings: List[TemperatureReadingPrinterDTO] = []
-        
+        # The last `capacity` readings of each room sensor and printer, in ring buffers
+        # of NumPy arrays, so memory is bounded whatever the uptime
+        self.capacity = capacity
+        self.room_buffers: Dict[str, TemperatureRingBuffer] = {}
+        self.printer_buffers: Dict[str, TemperatureRingBuffer] = {}
+
+        # Last DTO of each source, for O(1) latest lookups
+        self._latest_room: Dict[str, TemperatureReadingRoomDTO] = {}
+        self._latest_printer: Dict[str, TemperatureReadingPrinterDTO] = {}
+        self._units: Dict[str, str] = {}
+
         # Initialize with known printer IDs
         self.printer_ids = printer_ids
 
+        # Optional sink the readings are streamed to as they are added
+        self.sink: Optional[HistorySink] = None
+
         self.debug = debug
 
+    def _buffer(self, buffers: Dict[str, TemperatureRingBuffer], source_id: str) -> TemperatureRingBuffer:
+        buffer = buffers.get(source_id)
+        if buffer is None:
+            buffer = buffers[source_id] = TemperatureRingBuffer(self.capacity)
+        return buffer
+
     def add_room_reading(self, reading: TemperatureReadingRoomDTO):
         with self._lock:
-            self.room_readings.append(reading)
+            self._buffer(self.room_buffers, reading.sensorId).append(to_epoch(reading.timestamp), reading.temperature)
+            self._latest_room[reading.sensorId] = reading
+            self._units[reading.sensorId] = reading.unit
+        if self.sink is not None:
+            self.sink.append((reading.timestamp, reading.temperature, "room", reading.sensorId))
 
     def add_printer_reading(self, reading: TemperatureReadingPrinterDTO):
         with self._lock:
-            self.printer_readings.append(reading)
+            self._buffer(self.printer_buffers, reading.printerId).append(to_epoch(reading.timestamp), reading.temperature)
+            self._latest_printer[reading.printerId] = reading
+            self._units[reading.printerId] = reading.unit
+        if self.sink is not None:
+            self.sink.append((reading.timestamp, reading.temperature, "printer", reading.printerId))
 
     def get_latest_room_temperature(self, timestamp: str) -> TemperatureReadingRoomDTO:
         """Get the latest room temperature reading up to the given timestamp."""
+        until = to_epoch(timestamp)
         with self._lock:
-            readings = [r for r in self.room_readings if r.timestamp <= timestamp]
-            if readings:
-                return readings[-1]  # Return the most recent one
-            return None  # No reading found
+            latest = None
+            for sensor_id, buffer in self.room_buffers.items():
+                found = buffer.latest_until(until)
+                if found is not None and (latest is None or found[0] >= latest[1][0]):
+                    latest = (sensor_id, found)
+            if latest is None:
+                return None  # No reading found
+            sensor_id, (epoch, temperature) = latest
+            last = self._latest_room[sensor_id]
+            if to_epoch(last.timestamp) == epoch:
+                return last
+            return TemperatureReadingRoomDTO(sensorId=sensor_id, temperature=round(temperature, 2),
+                                             unit=self._units[sensor_id], timestamp=to_iso(epoch))
     
     def get_latest_printer_temperature(self, timestamp: str) -> Dict[str, TemperatureReadingPrinterDTO]:
         """Get the latest printer temperature readings up to the given timestamp."""
+        until = to_epoch(timestamp)
         with self._lock:
             latest_readings = {}
-            for pid in self.printer_ids:
-                readings = [r for r in self.printer_readings if r.printerId == pid and r.timestamp <= timestamp]
-                if readings:
-                    latest_readings[pid] = readings[-1]
+            for pid, buffer in self.printer_buffers.items():
+                found = buffer.latest_until(until)
+                if found is None:
+                    continue
+                epoch, temperature = found
+                last = self._latest_printer[pid]
+                if to_epoch(last.timestamp) == epoch:
+                    latest_readings[pid] = last
+                else:
+                    latest_readings[pid] = TemperatureReadingPrinterDTO(printerId=pid, temperature=round(temperature, 2),
+                                                                        unit=self._units[pid], timestamp=to_iso(epoch))
             return latest_readings  # Return a dict of printerId to latest reading
 
+    def memory_usage(self) -> int:
+        """Bytes allocated by the ring buffers."""
+        with self._lock:
+            return sum(b.nbytes for b in self.room_buffers.values()) + sum(b.nbytes for b in self.printer_buffers.values())
+
     def clear(self):
         with self._lock:
-            self.room_readings.clear()
-            self.printer_readings.clear()
+            for buffer in (*self.room_buffers.values(), *self.printer_buffers.values()):
+                buffer.clear()
+            self._latest_room.clear()
+            self._latest_printer.clear()
 
     def csv_dump(self, file_path: str):
-        """Dump the temperature history to a CSV file."""
+        """Write the readings in memory to a CSV file, overwriting it (the periodic history is streamed through the sink)."""
 
         # Create directories if they do not exist
         import os
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
 
-        with open(file_path, mode="a", newline="") as csvfile:
-            fieldnames = ["timestamp", "temperature", "source", "sourceId"]
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-
-            # Write the header only if the file is new
-            if os.path.getsize(file_path) == 0:
-                writer.writeheader()
-            for reading in self.room_readings:
-                writer.writerow({
-                    "timestamp": reading.timestamp,
-                    "temperature": reading.temperature,
-                    "source": "room",
-                    "sourceId": reading.sensorId
-                })
-            for reading in self.printer_readings:
-                writer.writerow({
-                    "timestamp": reading.timestamp,
-                    "temperature": reading.temperature,
-                    "source": "printer",
-                    "sourceId": reading.printerId
-                })
+        with self._lock:
+            sources = [("room", sid, b.arrays()) for sid, b in self.room_buffers.items()]
+            sources += [("printer", pid, b.arrays()) for pid, b in self.printer_buffers.items()]
+
+        with open(file_path, mode="w", newline="") as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES)
+            writer.writeheader()
+            for source, source_id, (timestamps, temperatures) in sources:
+                for epoch, temperature in zip(timestamps.tolist(), temperatures.tolist()):
+                    writer.writerow({
+                        "timestamp": to_iso(epoch),
+                        "temperature": round(temperature, 2),
+                        "source": source,
+                        "sourceId": source_id
+                    })
         
         if self.debug:
             print(f"[TEMPERATURE_HISTORY DEBUG] Dumped temperature history to {file_path}")
@@ -0,0 +1,90 @@
+"""
+TemperatureRingBuffer: Fixed-capacity store of the readings of a single source (room sensor or printer).
+"""
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+import numpy as np
+
+
+def to_epoch(timestamp) -> float:
+    """ISO 8601 timestamp (e.g. "2025-06-15T08:30:00Z") or number to seconds since the epoch."""
+    if isinstance(timestamp, (int, float)):
+        return float(timestamp)
+    try:
+        parsed = datetime.fromisoformat(timestamp)
+    except (TypeError, ValueError):
+        try:
+            return float(timestamp)
+        except (TypeError, ValueError):
+            return float("nan")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def to_iso(epoch: float) -> str:
+    """Seconds since the epoch to the ISO 8601 format of the readings."""
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class TemperatureRingBuffer:
+    """
+    The last `capacity` readings of a source, in two preallocated NumPy arrays:
+    float64 epoch timestamps and float32 temperatures, 12 bytes per reading.
+    When full, each new reading overwrites the oldest one, so memory stays
+    constant however long the service runs.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.temperatures = np.zeros(capacity, dtype=np.float32)
+        # Index the next reading is written to, and number of readings stored
+        self._next = 0
+        self._count = 0
+        # Total readings appended, including the overwritten ones
+        self.appended = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def nbytes(self) -> int:
+        return self.timestamps.nbytes + self.temperatures.nbytes
+
+    def append(self, timestamp: float, temperature: float):
+        self.timestamps[self._next] = timestamp
+        self.temperatures[self._next] = temperature
+        self._next = (self._next + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+        self.appended += 1
+
+    def latest(self) -> Optional[Tuple[float, float]]:
+        """(timestamp, temperature) of the last reading, None if empty."""
+        if self._count == 0:
+            return None
+        last = self._next - 1
+        return float(self.timestamps[last]), float(self.temperatures[last])
+
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Copies of the timestamps and temperatures, oldest first."""
+        if self._count < self.capacity:
+            return self.timestamps[:self._count].copy(), self.temperatures[:self._count].copy()
+        return (np.concatenate((self.timestamps[self._next:], self.timestamps[:self._next])),
+                np.concatenate((self.temperatures[self._next:], self.temperatures[:self._next])))
+
+    def latest_until(self, timestamp: float) -> Optional[Tuple[float, float]]:
+        """(timestamp, temperature) of the last reading at or before `timestamp`, None if there is none."""
+        latest = self.latest()
+        if latest is None or latest[0] <= timestamp:
+            return latest
+        # Readings arrive in order: binary search the ones before the latest
+        timestamps, temperatures = self.arrays()
+        index = int(np.searchsorted(timestamps, timestamp, side="right")) - 1
+        if index < 0:
+            return None
+        return float(timestamps[index]), float(temperatures[index])
+
+    def clear(self):
+        self._next = 0
+        self._count = 0
@@ -0,0 +1,162 @@
+## Liveness Registry Service
+# printers seen within a TTL, fed with every printer message
+#  the same module is used by job_handler, printer_monitoring
+#  and anomaly_detection
+
+import math
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set
+
+class LivenessRegistry:
+    """
+    Printers that sent a message within the last `ttl` seconds.
+
+    `touch()` is called for every progress or temperature message of a printer.
+    Silent printers are expired by a timer wheel of `ttl / tick` slots advanced
+    every `tick` seconds: a printer sits in the slot of its expiry, and touching
+    it only updates its last-seen time. When its slot comes up it is either
+    expired or moved to the slot of its new expiry, so heartbeats cost O(1)
+    and each tick only looks at the printers due in it.
+
+    Subscribers get `on_online(printer_id)` when a printer is first seen or
+    comes back, and `on_offline(printer_id)` when it expires or is forgotten
+    (the printer announced it went offline). Callbacks run outside the
+    registry lock, on the thread that touched or forgot the printer, or on
+    the wheel thread for expiries.
+    """
+
+    def __init__(self, ttl: float = 90.0, tick: float = 1.0, debug: bool = False):
+        self.ttl = ttl
+        self.tick = tick
+        self.debug = debug
+        # One extra slot: an expiry never lands in the slot being processed
+        self._slots: List[Set[str]] = [set() for _ in range(math.ceil(ttl / tick) + 1)]
+        self._last_seen: Dict[str, float] = {}
+        self._current_tick = int(time.monotonic() / tick)
+        self._lock = threading.Lock()
+        self._on_online: List[Callable[[str], None]] = []
+        self._on_offline: List[Callable[[str], None]] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def subscribe(self, on_online: Optional[Callable[[str], None]] = None,
+                  on_offline: Optional[Callable[[str], None]] = None):
+        if on_online is not None:
+            self._on_online.append(on_online)
+        if on_offline is not None:
+            self._on_offline.append(on_offline)
+
+    def touch(self, printer_id: str, now: Optional[float] = None):
+        """Record a message of the printer, emits on_online if it was not online."""
+        if not printer_id:
+            return
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            came_online = printer_id not in self._last_seen
+            self._last_seen[printer_id] = now
+            if came_online:
+                self._schedule(printer_id, now + self.ttl)
+        if came_online:
+            if self.debug:
+                print(f"[LIVENESS DEBUG] Printer {printer_id} online")
+            self._emit(self._on_online, printer_id)
+
+    def forget(self, printer_id: str):
+        """The printer announced it is gone: offline now, without waiting for its TTL."""
+        with self._lock:
+            # Its wheel entry is skipped when its slot comes up
+            was_online = self._last_seen.pop(printer_id, None) is not None
+        if was_online:
+            if self.debug:
+                print(f"[LIVENESS DEBUG] Printer {printer_id} offline (announced)")
+            self._emit(self._on_offline, printer_id)
+
+    def is_online(self, printer_id: str) -> bool:
+        with self._lock:
+            return printer_id in self._last_seen
+
+    def online_printers(self) -> Set[str]:
+        with self._lock:
+            return set(self._last_seen)
+
+    def last_seen(self, printer_id: str) -> Optional[float]:
+        """Monotonic time of the printer's last message, None if it is offline."""
+        with self._lock:
+            return self._last_seen.get(printer_id)
+
+    def advance(self, now: Optional[float] = None) -> List[str]:
+        """Process the slots due up to `now`, returns the printers that went offline."""
+        now = time.monotonic() if now is None else now
+        expired = []
+        with self._lock:
+            target = int(now / self.tick)
+            # After a long stall every slot is due once, not once per missed round
+            start = max(self._current_tick + 1, target - len(self._slots) + 1)
+            for tick in range(start, target + 1):
+                slot = self._slots[tick % len(self._slots)]
+                due = list(slot)
+                slot.clear()
+                for printer_id in due:
+                    last_seen = self._last_seen.get(printer_id)
+                    if last_seen is None:
+                        continue
+                    if last_seen + self.ttl <= now:
+                        del self._last_seen[printer_id]
+                        expired.append(printer_id)
+                    else:
+                        self._schedule(printer_id, last_seen + self.ttl, after_tick=tick)
+            self._current_tick = max(self._current_tick, target)
+        for printer_id in expired:
+            if self.debug:
+                print(f"[LIVENESS DEBUG] Printer {printer_id} offline, silent for more than {self.ttl} seconds")
+            self._emit(self._on_offline, printer_id)
+        return expired
+
+    def _schedule(self, printer_id: str, expires: float, after_tick: Optional[int] = None):
+        # Rounded up, a printer is never expired before its TTL
+        tick = max(math.ceil(expires / self.tick), (self._current_tick if after_tick is None else after_tick) + 1)
+        self._slots[tick % len(self._slots)].add(printer_id)
+
+    @staticmethod
+    def _emit(callbacks: List[Callable[[str], None]], printer_id: str):
+        for callback in callbacks:
+            try:
+                callback(printer_id)
+            except Exception as e:
+                print(f"[LIVENESS ERROR] Callback for printer {printer_id} failed: {e}")
+
+    def start(self):
+        """Advance the wheel every `tick` seconds on a daemon thread."""
+        if self._thread is not None:
+            return
+        def run():
+            while not self._stop.wait(self.tick):
+                self.advance()
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.tick * 2)
+            self._thread = None
+
+if __name__ == "__main__":
+    # Example usage for testing
+    #
+    # From the service directory:
+    #    python3 -m app.services.liveness_registry
+    #
+    registry = LivenessRegistry(ttl=3, tick=0.5, debug=True)
+    registry.subscribe(on_offline=lambda printer_id: print(f"{printer_id} went offline"))
+    registry.start()
+    registry.touch("printer-1")
+    registry.touch("printer-2")
+    for _ in range(4):
+        time.sleep(1)
+        registry.touch("printer-1")
+    print("Online printers:", registry.online_printers())
+    time.sleep(4)
+    print("Online printers:", registry.online_printers())
+    registry.stop()
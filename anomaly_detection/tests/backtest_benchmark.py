@@ -0,0 +1,97 @@
+import argparse
+import csv
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Run from the anomaly_detection directory:
+#   python3 tests/backtest_benchmark.py
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.chdir(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.classes.backtest import load_history, expand_grid, run_backtest, Incident
+from app.classes.temperature_analyzer import TemperatureAnalyzer
+from app.persistence.temperature_history import FIELDNAMES
+from app.persistence.temperature_ring_buffer import to_iso
+
+def write_farm(directory: str, printers: int, days: int, incidents_per_day: int):
+    """
+    A day per rotated file, as the HistorySink leaves them: printers at 1 Hz (200 °C ± 1.5 while printing,
+    25 °C idle, 10 minutes offline every day) and the room sensor every 5 seconds.
+    Runaways of 3 °C/s are injected in random printers and returned as the labelled incidents.
+    """
+    rng = np.random.default_rng(0)
+    start = 1.7e9
+    incidents = []
+    for day in range(days):
+        t = start + day * 86400 + np.arange(86400, dtype=np.float64)
+        stamps = [to_iso(epoch) for epoch in t]
+        rows = []
+        for p in range(printers):
+            printing = (np.arange(86400) // 7200 + p) % 3 != 0
+            y = np.where(printing, 200, 25) + rng.normal(0, 1.5, 86400)
+            for _ in range(rng.poisson(incidents_per_day / printers)):
+                at = int(rng.integers(0, 86400 - 120))
+                y[at:at + 60] += np.arange(60) * 3.0
+                incidents.append(Incident("printer", f"printer-{p}", t[at], t[at + 60]))
+            offline = int(rng.integers(0, 86400 - 600))
+            keep = np.ones(86400, dtype=bool)
+            keep[offline:offline + 600] = False
+            rows += [(stamps[i], round(float(y[i]), 2), "printer", f"printer-{p}") for i in np.flatnonzero(keep)]
+        y = 22 + rng.normal(0, 0.3, 86400 // 5)
+        rows += [(stamps[i * 5], round(float(y[i]), 2), "room", "room-1") for i in range(86400 // 5)]
+        rows.sort(key=lambda row: row[0])
+        with gzip.open(os.path.join(directory, f"temperature_history.{day:04d}.csv.gz"), "wt", newline="", compresslevel=1) as f:
+            writer = csv.writer(f)
+            writer.writerow(FIELDNAMES)
+            writer.writerows(rows)
+    return incidents
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline replay of a synthetic farm history over a threshold grid")
+    parser.add_argument("--printers", type=int, default=10)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--incidents-per-day", type=float, default=1)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        start = time.perf_counter()
+        incidents = write_farm(directory, args.printers, args.days, args.incidents_per_day)
+        print(f"Wrote {args.days} days of {args.printers} printers in {time.perf_counter() - start:.1f} s "
+              f"({len(incidents)} runaways)")
+
+        start = time.perf_counter()
+        history = load_history([directory])
+        loaded = time.perf_counter() - start
+        readings = sum(len(t) for t, _ in history.values())
+
+        grid = {"printer.max_rate": [60, 100, 150],
+                "printer.rate_detector.type": ["two_point", "ewma"],
+                "printer.high": [280, 300]}
+        threshold_sets = expand_grid(TemperatureAnalyzer().thresholds, grid)
+        start = time.perf_counter()
+        results = run_backtest(history, threshold_sets, incidents=incidents, workers=args.workers)
+        elapsed = time.perf_counter() - start
+
+        print("=" * 80)
+        print(f"Backtest benchmark: {readings:,} readings, {len(threshold_sets)} threshold sets, {args.workers} workers")
+        print("=" * 80)
+        print(f"load: {loaded:.1f} s ({readings / loaded:,.0f} readings/s)")
+        print(f"replay: {elapsed:.1f} s ({readings * len(threshold_sets) / elapsed:,.0f} readings/s over the grid)")
+        print(f"{'threshold set':<58}{'false pos':>11}{'missed':>8}{'ttd [s]':>9}")
+        for result in results:
+            ttd = "-" if result.mean_time_to_detect is None else f"{result.mean_time_to_detect:.1f}"
+            print(f"{result.threshold_set.name:<58}{result.false_positives:>11}{result.missed:>8}{ttd:>9}")
+        print("=" * 80)
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+# Run from the anomaly_detection directory:
+#   python3 tests/batch_evaluator_benchmark.py
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.chdir(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.classes.batch_evaluator import PrinterBatchEvaluator
+from app.classes.temperature_analyzer import TemperatureAnalyzer
+from app.dto.temperature_reading_printer_dto import TemperatureReadingPrinterDTO
+from app.persistence.temperature_ring_buffer import to_epoch, to_iso
+
+def readings(printers: int, rate: float, seconds: float):
+    """Readings of `printers` printers at `rate` Hz, in arrival order."""
+    random.seed(0)
+    start = 1.7e9
+    result = []
+    for step in range(int(seconds * rate)):
+        t = start + step / rate
+        # Timestamps on the wire have a one-second resolution
+        timestamp = to_iso(t)
+        for p in range(printers):
+            result.append(TemperatureReadingPrinterDTO(printerId=f"printer-{p}", temperature=round(200 + random.gauss(0, 1), 2),
+                                                       unit="C", timestamp=timestamp))
+    return result
+
+def per_reading(analyzer: TemperatureAnalyzer, batch):
+    """The previous path: analysis and hysteresis one message at a time, state in dicts."""
+    threshold_safe, rate_safe = {}, {}
+    for reading in batch:
+        printer_id = reading.printerId
+        alert_threshold = analyzer.check_thresholds(reading)
+        alert_rate = analyzer.observe_rate(reading)
+        threshold_safe[printer_id] = 0 if alert_threshold else threshold_safe.get(printer_id, 0) + 1
+        rate_safe[printer_id] = 0 if alert_rate else rate_safe.get(printer_id, 0) + 1
+
+def batched(evaluator: PrinterBatchEvaluator, batch):
+    """AnomalyDetectionService.evaluate_printer_batch without the history and the dispatch."""
+    epochs = {timestamp: to_epoch(timestamp) for timestamp in {r.timestamp for r in batch}}
+    evaluator.evaluate(
+        [r.printerId for r in batch],
+        np.fromiter((epochs[r.timestamp] for r in batch), dtype=np.float64, count=len(batch)),
+        np.fromiter((r.temperature for r in batch), dtype=np.float64, count=len(batch))
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Printer readings evaluated per message and in batch windows")
+    parser.add_argument("--printers", type=int, default=5000)
+    parser.add_argument("--rate", type=float, default=10, help="readings per second of each printer")
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+
+    data = readings(args.printers, args.rate, args.seconds)
+    incoming = args.printers * args.rate
+    print("=" * 80)
+    print(f"Batch evaluator benchmark: {args.printers} printers at {args.rate:g} Hz "
+          f"({incoming:,.0f} readings/s), {len(data):,} readings")
+    print("=" * 80)
+    print(f"{'path':<28}{'readings/s':>14}{'per batch [ms]':>17}{'load':>10}")
+
+    analyzer = TemperatureAnalyzer(config_path="app/anomaly_detection_config.yaml")
+    start = time.perf_counter()
+    per_reading(analyzer, data)
+    elapsed = time.perf_counter() - start
+    print(f"{'per message':<28}{len(data) / elapsed:>14,.0f}{'':>17}{incoming * elapsed / len(data):>9.0%}")
+
+    for window in (0.05, 0.1):
+        evaluator = PrinterBatchEvaluator(TemperatureAnalyzer(config_path="app/anomaly_detection_config.yaml"))
+        size = max(1, int(incoming * window))
+        start = time.perf_counter()
+        for i in range(0, len(data), size):
+            batched(evaluator, data[i:i + size])
+        elapsed = time.perf_counter() - start
+        batches = (len(data) + size - 1) // size
+        # load: share of each window spent evaluating the readings received in it
+        print(f"{f'batches of {window * 1000:.0f} ms ({size})':<28}{len(data) / elapsed:>14,.0f}"
+              f"{elapsed / batches * 1000:>17.2f}{incoming * elapsed / len(data):>9.0%}")
+    print("=" * 80)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+# Run from the anomaly_detection directory:
+#   python3 tests/temperature_history_benchmark.py
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.dto.temperature_reading_printer_dto import TemperatureReadingPrinterDTO
+from app.persistence.temperature_history import TemperatureHistory
+
+class ListHistory:
+    """The previous store: every DTO appended to a list, latest found by rescanning it."""
+
+    def __init__(self, printer_ids):
+        self.printer_ids = printer_ids
+        self.printer_readings = []
+
+    def add_printer_reading(self, reading):
+        self.printer_readings.append(reading)
+
+    def get_latest_printer_temperature(self, timestamp):
+        latest_readings = {}
+        for pid in self.printer_ids:
+            readings = [r for r in self.printer_readings if r.printerId == pid and r.timestamp <= timestamp]
+            if readings:
+                latest_readings[pid] = readings[-1]
+        return latest_readings
+
+def readings(printers: int, count: int):
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    for i in range(count):
+        # One reading per second per printer
+        timestamp = (start + timedelta(seconds=i // printers)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        yield TemperatureReadingPrinterDTO(printerId=f"printer-{i % printers}", temperature=200 + (i % 50) * 0.5,
+                                           unit="C", timestamp=timestamp)
+
+def measure(history, printers: int, count: int):
+    # The DTOs are created in the loop, only the ones the store keeps stay allocated
+    tracemalloc.start()
+    start = time.perf_counter()
+    last = None
+    for reading in readings(printers, count):
+        history.add_printer_reading(reading)
+        last = reading.timestamp
+    elapsed = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    start = time.perf_counter()
+    latest = history.get_latest_printer_temperature(last)
+    lookup = time.perf_counter() - start
+    return memory, elapsed, lookup, latest
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory of the temperature history after many readings")
+    parser.add_argument("--readings", type=int, default=1_000_000)
+    parser.add_argument("--printers", type=int, default=5)
+    parser.add_argument("--capacity", type=int, default=86400)
+    args = parser.parse_args()
+
+    rows = [("list of DTOs", ListHistory([f"printer-{i}" for i in range(args.printers)])),
+            (f"ring buffers ({args.capacity})", TemperatureHistory([], debug=False, capacity=args.capacity))]
+    print("=" * 80)
+    print(f"Temperature history benchmark: {args.readings:,} readings from {args.printers} printers")
+    print("=" * 80)
+    print(f"{'store':<26}{'memory [MB]':>14}{'bytes/reading':>16}{'add [us]':>11}{'latest [ms]':>13}")
+    for name, history in rows:
+        memory, elapsed, lookup, latest = measure(history, args.printers, args.readings)
+        kept = args.readings if isinstance(history, ListHistory) else min(args.readings, args.printers * args.capacity)
+        print(f"{name:<26}{memory / 1e6:>14.1f}{memory / kept:>16.1f}{elapsed / args.readings * 1e6:>11.2f}"
+              f"{lookup * 1000:>13.3f}")
+        assert len(latest) == args.printers
+    print("=" * 80)
+
+if __name__ == "__main__":
+    main()
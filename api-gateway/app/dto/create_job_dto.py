@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import Optional
+from typing import List, Optional
 from .job_dto import JobDTO
 
 # This Dto module defines the POST jobs (both request and response)
@@ -24,3 +24,19 @@ class CreateJobResponseDTO:
     """DTO for job creation response"""
     modelId: str
     priority: int
+
+
+@dataclass
+class CreateJobsBatchRequestDTO:
+    """DTO for batch job creation request"""
+    jobs: List[CreateJobRequestDTO]
+
+    def validate(self):
+        """Validate every job of the batch"""
+        if not self.jobs:
+            raise ValueError("jobs must be a non-empty list")
+        for index, job in enumerate(self.jobs):
+            try:
+                job.validate()
+            except ValueError as e:
+                raise ValueError(f"jobs[{index}]: {e}")
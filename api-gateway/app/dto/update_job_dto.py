@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import Optional
+from typing import List, Optional
 from .job_dto import JobDTO
 
 # This Dto module defines the UPDATE job priority (both request and response)
@@ -19,3 +19,25 @@ class UpdateJobRequestDTO:
 class UpdateJobResponseDTO:
     """DTO for job update response"""
     job: JobDTO
+
+
+@dataclass
+class JobPriorityUpdateDTO:
+    """DTO for a single item of a batch priority update"""
+    id: str
+    priority: int
+
+@dataclass
+class UpdateJobsBatchRequestDTO:
+    """DTO for batch priority update request"""
+    jobs: List[JobPriorityUpdateDTO]
+
+    def validate(self):
+        """Validate every item of the batch"""
+        if not self.jobs:
+            raise ValueError("jobs must be a non-empty list")
+        for index, job in enumerate(self.jobs):
+            if not job.id or not isinstance(job.id, str):
+                raise ValueError(f"jobs[{index}]: id must be a non-empty string")
+            if job.priority is None:
+                raise ValueError(f"jobs[{index}]: priority must be provided")
@@ -2,12 +2,19 @@ from flask import Blueprint, jsonify, request
 from app.services.queue_service import (
     get_all_jobs, 
     create_job, 
+    create_jobs_batch,
     update_job, 
+    update_jobs_batch,
     delete_job
 )
 from app.dto.job_dto import JobDTO, JobsResponseDTO
-from app.dto.create_job_dto import CreateJobRequestDTO, CreateJobResponseDTO
-from app.dto.update_job_dto import UpdateJobRequestDTO, UpdateJobResponseDTO
+from app.dto.create_job_dto import CreateJobRequestDTO, CreateJobResponseDTO, CreateJobsBatchRequestDTO
+from app.dto.update_job_dto import (
+    UpdateJobRequestDTO,
+    UpdateJobResponseDTO,
+    JobPriorityUpdateDTO,
+    UpdateJobsBatchRequestDTO
+)
 from app.utils.error_handler import handle_service_error, validate_json_request
 
 jobs_bp = Blueprint('jobs', __name__)
@@ -15,9 +22,12 @@ jobs_bp = Blueprint('jobs', __name__)
 @jobs_bp.route('/jobs', methods=['GET'])
 @handle_service_error
 def get_jobs():
-    """Get all jobs in the queue"""
+    """Get all jobs in the queue, or a page of them with ?limit=N&after=CURSOR"""
+    # Pagination parameters are passed through to the queue manager
+    params = {key: request.args[key] for key in ('limit', 'after') if key in request.args}
+
     # Call the service to get all jobs
-    jobs_data = get_all_jobs()
+    jobs_data = get_all_jobs(params or None)
     
     # Convert raw data to DTOs for validation
     job_dtos = [
@@ -36,9 +46,12 @@ def get_jobs():
     response_dto = JobsResponseDTO(jobs=job_dtos)
     
     # Return the validated data
-    return jsonify({
+    response = {
         'jobs': [vars(job) for job in response_dto.jobs]
-    })
+    }
+    if params:
+        response['nextCursor'] = jobs_data.get('nextCursor')
+    return jsonify(response)
 
 @jobs_bp.route('/jobs', methods=['POST'])
 @handle_service_error
@@ -68,6 +81,88 @@ def post_job():
     # Return the validated data
     return jsonify(vars(response_dto)), 201
 
+@jobs_bp.route('/jobs:batch', methods=['POST'])
+@handle_service_error
+@validate_json_request
+def post_jobs_batch():
+    """Create many jobs with a single request"""
+    # Get request data
+    request_data = request.json
+    items = request_data.get('jobs')
+    if not isinstance(items, list):
+        raise ValueError("jobs must be a list")
+    
+    # Create and validate the request DTO
+    request_dto = CreateJobsBatchRequestDTO(jobs=[
+        CreateJobRequestDTO(
+            modelId=item.get('modelId'),
+            printerId=item.get('printerId'),
+            priority=item.get('priority', 0)
+        ) for item in items
+    ])
+    request_dto.validate()
+    
+    # Call the service to create the jobs
+    created_jobs = create_jobs_batch([vars(job) for job in request_dto.jobs])
+    
+    # Create the response DTOs
+    response_dtos = [
+        CreateJobResponseDTO(
+            modelId=job.get('modelId'),
+            priority=job.get('priority', 0)
+        ) for job in created_jobs.get('jobs', [])
+    ]
+    
+    # Return the validated data, with the IDs needed for later updates
+    return jsonify({
+        'jobs': [
+            dict(id=job.get('id'), **vars(dto))
+            for job, dto in zip(created_jobs.get('jobs', []), response_dtos)
+        ]
+    }), 201
+
+@jobs_bp.route('/jobs:batch', methods=['PATCH'])
+@handle_service_error
+@validate_json_request
+def patch_jobs_batch():
+    """Update the priority of many jobs with a single request"""
+    # Get request data
+    request_data = request.json
+    items = request_data.get('jobs')
+    if not isinstance(items, list):
+        raise ValueError("jobs must be a list")
+    
+    # Create and validate the request DTO
+    request_dto = UpdateJobsBatchRequestDTO(jobs=[
+        JobPriorityUpdateDTO(
+            id=item.get('id'),
+            priority=item.get('priority')
+        ) for item in items
+    ])
+    request_dto.validate()
+    
+    # Call the service to update the jobs
+    updated_jobs = update_jobs_batch([vars(job) for job in request_dto.jobs])
+    
+    # Create the job DTOs
+    job_dtos = [
+        JobDTO(
+            id=job.get('id'),
+            modelId=job.get('modelId'),
+            assignedPrinterId=job.get('assignedPrinterId'),
+            priority=job.get('priority', 0),
+            status=job.get('status', 'pending'),
+            submittedAt=job.get('submittedAt'),
+            updatedAt=job.get('updatedAt')
+        ) for job in updated_jobs.get('jobs', [])
+    ]
+    
+    # Return the validated data
+    return jsonify({
+        'jobs': [vars(job) for job in job_dtos],
+        'notFound': updated_jobs.get('notFound', [])
+    })
+
 @jobs_bp.route('/jobs/<job_id>', methods=['PUT'])
 @handle_service_error
 @validate_json_request
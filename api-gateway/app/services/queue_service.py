@@ -12,8 +12,8 @@ def _get_config():
         config = yaml.safe_load(file)
     return config['services']['priority_queue']
 
-def get_all_jobs():
-    """Get all jobs from the Priority Queue Manager microservice"""
+def get_all_jobs(params=None):
+    """Get all jobs (or a page of jobs, with limit/after) from the Priority Queue Manager microservice"""
     config = _get_config()
     service_url = config['base_url']
     endpoint = config['endpoints']['get_jobs']
@@ -23,7 +23,8 @@ def get_all_jobs():
     # Forward the GET request to the queue microservice
     response_data = forward_request(
         method='GET',
-        url=f"{service_url}{endpoint}"
+        url=f"{service_url}{endpoint}",
+        params=params
     )
     
     return response_data
@@ -45,6 +46,23 @@ def create_job(job_data):
     
     return response_data
 
+def create_jobs_batch(jobs_data):
+    """Create many jobs in the Priority Queue Manager microservice with a single request"""
+    config = _get_config()
+    service_url = config['base_url']
+    endpoint = config['endpoints']['add_jobs_batch']
+    
+    logger.info(f"Forwarding request to Priority Queue Manager service: POST {service_url}{endpoint} ({len(jobs_data)} jobs)")
+    
+    # Forward the POST request to the queue microservice
+    response_data = forward_request(
+        method='POST',
+        url=f"{service_url}{endpoint}",
+        json={'jobs': jobs_data}
+    )
+    
+    return response_data
+
 def update_job(job_id, job_data):
     """Update a job in the Priority Queue Manager microservice"""
     config = _get_config()
@@ -62,6 +80,23 @@ def update_job(job_id, job_data):
     
     return response_data
 
+def update_jobs_batch(jobs_data):
+    """Update the priority of many jobs in the Priority Queue Manager microservice with a single request"""
+    config = _get_config()
+    service_url = config['base_url']
+    endpoint = config['endpoints']['update_jobs_batch']
+    
+    logger.info(f"Forwarding request to Priority Queue Manager service: PATCH {service_url}{endpoint} ({len(jobs_data)} jobs)")
+    
+    # Forward the PATCH request to the queue microservice
+    response_data = forward_request(
+        method='PATCH',
+        url=f"{service_url}{endpoint}",
+        json={'jobs': jobs_data}
+    )
+    
+    return response_data
+
 def delete_job(job_id):
     """Delete a job from the Priority Queue Manager microservice"""
     config = _get_config()
@@ -0,0 +1,13 @@
+# 2.2.4) PrinterAnnounce
+
+from dataclasses import dataclass, asdict
+import json
+
+@dataclass
+class PrinterAnnounceDTO:
+    printerId: str
+    status: str  # "online"|"offline"
+    timestamp: str
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self))
@@ -63,7 +63,7 @@ if __name__ == "__main__":
 
     service = GlobalTemperatureService(mqtt_client=client, 
                                        debug=True, 
-                                       discover_printers_timeout=15)
+                                       discover_printers_timeout=2)
     service.start()
     api = ApiEndpoint(service)
     api.start()
@@ -10,7 +10,7 @@ def str2bool(val):
 def main():
     debug_communication = str2bool(os.getenv("DEBUG_COMMUNICATION", "True"))
     debug_service = str2bool(os.getenv("DEBUG", "False"))
-    timer = int(os.getenv("timer_hear", 60))
+    timer = int(os.getenv("timer_hear", 2))
 
     # Initialize MQTT client
     client = MQTTClient(debug=debug_communication)  # Enable debug mode for MQTT communication
@@ -1,16 +1,18 @@
 from http import client
-from app.persistence.temperature_history import TemperatureHistory
+from app.persistence.temperature_history import TemperatureHistory, FIELDNAMES
+from app.persistence.history_sink import HistorySink
 from app.models.temperature_analyzer import TemperatureAnalyzer
 from app.mqtt.subscriber import MQTTSubscriber
 from app.mqtt.publisher import MQTTPublisher
 from app.dto.fan_controller_temp_dto import FanControllerTempDTO
 from app.dto.global_temperature_response_dto import GlobalTemperatureResponseDTO, TemperatureReadingDTO
 from app.services.discover_printers import discover_printers
+import atexit
 import threading
 import time
 
 class GlobalTemperatureService:
-    def __init__(self, mqtt_client, debug=True, discover_printers_timeout=60):
+    def __init__(self, mqtt_client, debug=True, discover_printers_timeout=2):
 
         self.debug = debug
         self.discover_printers_timeout = discover_printers_timeout
@@ -27,14 +29,17 @@ class GlobalTemperatureService:
         if self.debug:
             print("[GLOBAL_TEMP DEBUG] Initialized MQTT client and pub/sub")
 
-        # Search all printers in the network -> blocking call
-        # Any payload with printerId will be added to the discovered printers
-        print(f"\033[91m[GLOBAL_TEMP DEBUG] Discovering printers with timeout {self.discover_printers_timeout} seconds...\033[0m")
+        # Initialize temperature history, printers are added as they are discovered
+        self.history = TemperatureHistory([], debug=self.debug)
 
-        self.printers = discover_printers(self.subscriber, timeout=self.discover_printers_timeout, debug=self.debug)
+        # Printers from their retained announces -> returns within milliseconds,
+        # printers joining or leaving later are tracked through the callbacks
+        print(f"\033[91m[GLOBAL_TEMP DEBUG] Discovering printers (at most {self.discover_printers_timeout} seconds)...\033[0m")
 
-        # Initialize temperature history and analyzer
-        self.history = TemperatureHistory(self.printers, debug=self.debug)
+        self.printers = discover_printers(self.subscriber, timeout=self.discover_printers_timeout, debug=self.debug,
+                                          on_join=self.history.add_printer, on_leave=self.history.remove_printer)
+        for printer_id in self.printers:
+            self.history.add_printer(printer_id)
 
         # Initialize temperature analyzer for heat level computation
         self.analyzer = TemperatureAnalyzer(debug=self.debug)
@@ -69,6 +74,8 @@ class GlobalTemperatureService:
         self.history.add_room_reading(dto)
 
     def _on_printer_temp(self, client, userdata, dto):
+        # Printers that do not announce themselves are tracked from their first reading
+        self.history.add_printer(dto.printerId)
         self.history.add_printer_reading(dto)
 
     # Method to compute and publish fan heat level one time -> need to be called periodically
@@ -143,14 +150,18 @@ class GlobalTemperatureService:
             lastUpdated=last_updated if last_updated else ""
         )
 
-    def periodic_csv_dump(self, file_path="app/persistence/save/temperature_history.csv", interval=60):
-        """Periodically dump the temperature history to a CSV file."""
-        def run():
-            while True:
-                self.history.csv_dump(file_path)
-                time.sleep(interval)
-        thread = threading.Thread(target=run, daemon=True)
-        thread.start()
+    def periodic_csv_dump(self, file_path="app/persistence/save/temperature_history.csv", interval=60,
+                          max_bytes=10_000_000, max_age=86400, backups=7):
+        """
+        Stream the temperature history to a CSV file: the readings added since the last flush are
+        written every `interval` seconds, the file is rotated and gzipped by size or age.
+        """
+        self.sink = HistorySink(file_path, FIELDNAMES, flush_interval=interval,
+                                max_bytes=max_bytes, max_age=max_age, backups=backups)
+        self.history.sink = self.sink
+        self.sink.start()
+        # Write the last readings when the service exits
+        atexit.register(self.sink.stop)
         if self.debug:
             print(f"[GLOBAL_TEMP DEBUG] Periodic CSV dump started with interval {interval} seconds.")
 
@@ -1,13 +1,16 @@
 """
 TemperatureHistory: Stores and manages all received temperature readings (room and printers).
 """
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from app.dto.temperature_reading_room_dto import TemperatureReadingRoomDTO
 from app.dto.temperature_reading_printer_dto import TemperatureReadingPrinterDTO
 from app.dto.global_temperature_response_dto import TemperatureReadingDTO
+from app.persistence.history_sink import HistorySink
 import threading
 import csv
 
+FIELDNAMES = ["timestamp", "temperature", "source", "sourceId"]
+
 class TemperatureHistory:
     def __init__(self, printer_ids: List[str], debug: bool = False):
         # Thread-safe storage for temperature readings
@@ -21,13 +24,30 @@ class TemperatureHistory:
         # Initialize with known printer IDs
         self.printer_ids = printer_ids
 
+        # Optional sink the readings are streamed to as they are added
+        self.sink: Optional[HistorySink] = None
+
+    def add_printer(self, printer_id: str):
+        with self._lock:
+            if printer_id not in self.printer_ids:
+                self.printer_ids = [*self.printer_ids, printer_id]
+
+    def remove_printer(self, printer_id: str):
+        # Its last readings no longer count in the latest printer temperatures
+        with self._lock:
+            self.printer_ids = [pid for pid in self.printer_ids if pid != printer_id]
+
     def add_room_reading(self, reading: TemperatureReadingRoomDTO):
         with self._lock:
             self.room_readings.append(reading)
+        if self.sink is not None:
+            self.sink.append((reading.timestamp, reading.temperature, "room", reading.sensorId))
 
     def add_printer_reading(self, reading: TemperatureReadingPrinterDTO):
         with self._lock:
             self.printer_readings.append(reading)
+        if self.sink is not None:
+            self.sink.append((reading.timestamp, reading.temperature, "printer", reading.printerId))
 
     def get_latest_room(self) -> TemperatureReadingDTO:
         with self._lock:
@@ -76,19 +96,15 @@ class TemperatureHistory:
             self.printer_readings.clear()
 
     def csv_dump(self, file_path: str):
-        """Dump the temperature history to a CSV file."""
+        """Write the readings in memory to a CSV file, overwriting it (the periodic history is streamed through the sink)."""
 
         # Create directories if they do not exist
         import os
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
 
-        with open(file_path, mode="a", newline="") as csvfile:
-            fieldnames = ["timestamp", "temperature", "source", "sourceId"]
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-
-            # Write the header only if the file is new
-            if os.path.getsize(file_path) == 0:
-                writer.writeheader()
+        with open(file_path, mode="w", newline="") as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES)
+            writer.writeheader()
             for reading in self.room_readings:
                 writer.writerow({
                     "timestamp": reading.timestamp,
@@ -0,0 +1,187 @@
+import time
+import random
+import logging
+import threading
+import requests
+import numpy as np
+from collections import deque
+from typing import Deque, Dict, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the queue manager while the circuit breaker is open"""
+
+class QueueManagerClient:
+    """
+    Keep-alive HTTP client for the Priority Queue Manager.
+
+    Requests go through a pooled session with connect and read timeouts. Failed
+    requests are retried with jittered exponential backoff: connect timeouts and
+    refused connections always (nothing reached the server); dropped connections,
+    read timeouts and 5xx answers only for idempotent calls, the server may have
+    run them already. After `failure_threshold` consecutive failures the circuit
+    opens and calls fail fast for `reset_timeout` seconds, then a single probe
+    request decides whether it closes again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+    LATENCY_SAMPLES = 1000
+
+    def __init__(self, base_url: str, connect_timeout: float = 2.0, read_timeout: float = 5.0,
+                 retries: int = 2, backoff: float = 0.2, backoff_max: float = 2.0,
+                 failure_threshold: int = 5, reset_timeout: float = 10.0, pool_size: int = 4):
+        self.base_url = base_url.rstrip("/")
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.session = requests.Session()
+        # Retries are handled here, with backoff and circuit accounting
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+        self.counters: Dict[str, int] = {
+            "requests": 0, "successes": 0, "failures": 0, "retries": 0,
+            "timeouts": 0, "connection_errors": 0, "server_errors": 0, "rejected": 0, "circuit_opened": 0
+        }
+        self.latencies: Deque[float] = deque(maxlen=self.LATENCY_SAMPLES)
+
+    @classmethod
+    def from_config(cls, config: dict) -> "QueueManagerClient":
+        return cls(
+            config["url"],
+            connect_timeout=config.get("connect_timeout", 2.0),
+            read_timeout=config.get("read_timeout", 5.0),
+            retries=config.get("retries", 2),
+            backoff=config.get("backoff", 0.2),
+            backoff_max=config.get("backoff_max", 2.0),
+            failure_threshold=config.get("failure_threshold", 5),
+            reset_timeout=config.get("reset_timeout", 10.0)
+        )
+
+    def get(self, path: str, params: Optional[dict] = None, extra_read_time: float = 0,
+            idempotent: bool = True) -> requests.Response:
+        return self.request("GET", path, params=params, extra_read_time=extra_read_time, idempotent=idempotent)
+
+    def post(self, path: str, params: Optional[dict] = None, idempotent: bool = True) -> requests.Response:
+        return self.request("POST", path, params=params, idempotent=idempotent)
+
+    def request(self, method: str, path: str, params: Optional[dict] = None,
+                extra_read_time: float = 0, idempotent: bool = True) -> requests.Response:
+        """
+        Send a request and return the response (4xx answers included).
+        `extra_read_time` extends the read timeout, e.g. by the wait of a long poll.
+        Raises CircuitOpenError while the circuit is open, or the last error once retries are exhausted.
+        """
+        attempt = 0
+        while True:
+            self._before_request()
+            start = time.monotonic()
+            self.counters["requests"] += 1
+            try:
+                response = self.session.request(
+                    method, f"{self.base_url}{path}", params=params,
+                    timeout=(self.connect_timeout, self.read_timeout + extra_read_time)
+                )
+                if response.status_code >= 500:
+                    self.counters["server_errors"] += 1
+                    raise requests.HTTPError(f"HTTP {response.status_code}", response=response)
+            except requests.RequestException as e:
+                retryable = self._count_error(e, idempotent)
+                self._on_failure()
+                if not retryable or attempt >= self.retries or self.state == self.OPEN:
+                    raise
+                attempt += 1
+                self.counters["retries"] += 1
+                delay = min(self.backoff_max, self.backoff * 2 ** attempt)
+                time.sleep(random.uniform(0, delay))  # full jitter
+                continue
+            if not extra_read_time:
+                # Long polls mostly measure how long the queue stayed empty
+                self.latencies.append(time.monotonic() - start)
+            self._on_success()
+            return response
+
+    def _count_error(self, error: requests.RequestException, idempotent: bool) -> bool:
+        # Returns whether the request may be sent again
+        if isinstance(error, requests.ConnectionError) and not isinstance(error, requests.ReadTimeout):
+            self.counters["connection_errors"] += 1
+            if isinstance(error, requests.ConnectTimeout):
+                self.counters["timeouts"] += 1
+                return True
+            # Refused (or unresolved): the connection was never established. A connection aborted or closed
+            # by the server, on the other hand, may come after it ran the request
+            reason = getattr(error.args[0], "reason", None) if error.args else None
+            return isinstance(reason, NewConnectionError) or idempotent
+        if isinstance(error, requests.Timeout):
+            self.counters["timeouts"] += 1
+        return idempotent
+
+    def _before_request(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    self.counters["rejected"] += 1
+                    raise CircuitOpenError(f"Queue manager circuit open, retry in {self.retry_after():.1f}s")
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    self.counters["rejected"] += 1
+                    raise CircuitOpenError("Queue manager circuit half open, probe in flight")
+                self._probe_in_flight = True
+
+    def _on_success(self):
+        with self._lock:
+            self.counters["successes"] += 1
+            self._consecutive_failures = 0
+            if self.state != self.CLOSED:
+                logging.info("Queue manager reachable again, circuit closed")
+            self.state = self.CLOSED
+            self._probe_in_flight = False
+
+    def _on_failure(self):
+        with self._lock:
+            self.counters["failures"] += 1
+            self._consecutive_failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.counters["circuit_opened"] += 1
+                    logging.warning(f"Queue manager failing ({self._consecutive_failures} consecutive errors), "
+                                    f"circuit open for {self.reset_timeout}s")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def retry_after(self) -> float:
+        """
+        Seconds until the open circuit lets a probe request through (0 if it is not open)
+        """
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def get_stats(self) -> Dict[str, float]:
+        stats = dict(self.counters)
+        stats["state"] = self.state
+        if self.latencies:
+            samples = np.array(self.latencies) * 1000
+            stats["p50_ms"] = round(float(np.percentile(samples, 50)), 1)
+            stats["p95_ms"] = round(float(np.percentile(samples, 95)), 1)
+            stats["max_ms"] = round(float(samples.max()), 1)
+        return stats
+
+    def close(self):
+        self.session.close()
@@ -9,4 +9,6 @@ class Assignment:
     estimatedTime: int
     priority: int
     assignedAt: str  # or datetime if you want to parse it
-    parameters: Dict[str, float | int]
\ No newline at end of file
+    parameters: Dict[str, float | int]
+    # Reserved while the printer awaits cleaning: it holds the job until the same assignment comes without the flag
+    startAfterCleaning: bool = False
\ No newline at end of file
@@ -2,7 +2,11 @@ import logging
 import yaml
 import sys
 import argparse
+from app.client.queue_client import QueueManagerClient
 from app.model.job_handler import JobHandler
+from app.model.scheduler import Scheduler
+from app.persistence.state_file import PrinterStateFile
+from app.services.liveness_registry import LivenessRegistry
 
 def load_config(path: str):
     with open(path, "r") as f:
@@ -38,8 +42,29 @@ def main():
     broker_host = config["mqtt"]["host"]
     broker_port = config["mqtt"]["port"]
     queue_manager_url = config["queue_manager"]["url"]
+    poll_wait = config["queue_manager"].get("poll_wait", 10)
+    lease_time = config["queue_manager"].get("lease_time", 60)
+    ack_timeout = config.get("assignments", {}).get("ack_timeout", 10)
+    max_republish = config.get("assignments", {}).get("max_republish", 1)
+    pipelining = config.get("assignments", {}).get("pipelining", False)
+    reservation_lease_time = config.get("assignments", {}).get("reservation_lease_time", 600)
 
-    handler = JobHandler(broker_host, broker_port, queue_manager_url)
+    queue_client = QueueManagerClient.from_config(config["queue_manager"])
+    scheduler = Scheduler.from_config(config)
+    state_config = config.get("state", {})
+    state_file = None
+    if state_config.get("enabled", True):
+        state_file = PrinterStateFile(
+            state_config.get("file", "data/job_handler_state.json"),
+            interval=state_config.get("checkpoint_interval", 1),
+            max_age=state_config.get("max_age")
+        )
+
+    liveness_config = config.get("liveness", {})
+    liveness = LivenessRegistry(ttl=liveness_config.get("printer_ttl", 90), tick=liveness_config.get("tick", 1))
+
+    handler = JobHandler(broker_host, broker_port, queue_manager_url, poll_wait, lease_time, scheduler, queue_client,
+                         ack_timeout, max_republish, state_file, pipelining, reservation_lease_time, liveness)
     try:
         handler.start()
     except KeyboardInterrupt:
@@ -0,0 +1,289 @@
+import hashlib
+import logging
+import math
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import BinaryIO, Dict, Iterable, Optional, Tuple
+
+# Bytes read at a time: files are streamed, never loaded whole
+CHUNK_SIZE = 1 << 20
+# Feed rate assumed until the file sets one (mm/min)
+DEFAULT_FEED_RATE = 1500.0
+_X, _Y, _Z, _E, _F = b"XYZEF"
+_MOVES = (b"G1", b"G0", b"G01", b"G00")
+
+@dataclass
+class GcodeStats:
+    print_time: float               # seconds at the programmed feed rates (no acceleration)
+    layer_count: int
+    filament_length: float          # mm of filament extruded
+    max_nozzle_temp: int            # highest M104/M109 target, 0 if none
+    max_bed_temp: int = 0           # highest M140/M190 target
+    layer_height: Optional[float] = None
+    filament_type: Optional[str] = None     # from the slicer's settings comments, when present
+    infill: Optional[int] = None            # percent, from the slicer's settings comments
+
+class _Parser:
+    """
+    Single pass over G-code lines. Tracks the modal state a printer keeps
+    (positions, absolute/relative modes, feed rate) and accumulates the stats.
+    """
+
+    def __init__(self):
+        self.x = self.y = self.z = self.e = 0.0
+        self.feed_rate = DEFAULT_FEED_RATE
+        self.absolute = True            # G90/G91
+        self.absolute_e = True          # M82/M83, G90/G91 also switch it
+        self.time = 0.0
+        self.extruded = 0.0
+        self.layers = 0
+        self.layer_z = None             # Z of the last layer that extruded
+        self.first_layer_z = None
+        self.second_layer_z = None
+        self.max_nozzle_temp = 0
+        self.max_bed_temp = 0
+        self.settings: Dict[str, str] = {}
+
+    def feed(self, lines: Iterable[bytes]):
+        move = self._move
+        for line in lines:
+            comment = line.find(b";")
+            if comment >= 0:
+                if comment == 0 or not line[:comment].strip():
+                    self._comment(line[comment + 1:])
+                    continue
+                line = line[:comment]
+            words = line.split()
+            if not words:
+                continue
+            command = words[0].upper()
+            if command in _MOVES:
+                move(words)
+            elif command == b"M104" or command == b"M109":
+                self.max_nozzle_temp = max(self.max_nozzle_temp, self._temperature(words))
+            elif command == b"M140" or command == b"M190":
+                self.max_bed_temp = max(self.max_bed_temp, self._temperature(words))
+            elif command == b"G92":
+                self._set_position(words)
+            elif command == b"G90":
+                self.absolute = self.absolute_e = True
+            elif command == b"G91":
+                self.absolute = self.absolute_e = False
+            elif command == b"M82":
+                self.absolute_e = True
+            elif command == b"M83":
+                self.absolute_e = False
+            elif command == b"G4":
+                self._dwell(words)
+
+    def _move(self, words):
+        x, y, z, e = self.x, self.y, self.z, self.e
+        absolute = self.absolute
+        de = 0.0
+        for word in words[1:]:
+            # Axis letter as a byte value, lower case folded to upper case
+            axis = word[0] & 0xDF
+            try:
+                value = float(word[1:])
+            except ValueError:
+                continue
+            if axis == _X:
+                x = value if absolute else x + value
+            elif axis == _Y:
+                y = value if absolute else y + value
+            elif axis == _E:
+                de = value - self.e if self.absolute_e else value
+                e = self.e + de
+            elif axis == _Z:
+                z = value if absolute else z + value
+            elif axis == _F and value > 0:
+                self.feed_rate = value
+        dx, dy, dz = x - self.x, y - self.y, z - self.z
+        distance = math.sqrt(dx * dx + dy * dy + dz * dz) or abs(de)
+        self.time += distance * 60.0 / self.feed_rate
+        # Retractions and the matching unretractions cancel out
+        self.extruded += de
+        if de > 0 and (dx or dy) and (self.layer_z is None or z > self.layer_z + 1e-6):
+            # First extrusion at a new height; travel moves and Z hops do not count
+            self.layers += 1
+            self.layer_z = z
+            if self.first_layer_z is None:
+                self.first_layer_z = z
+            elif self.second_layer_z is None:
+                self.second_layer_z = z
+        self.x, self.y, self.z, self.e = x, y, z, e
+
+    def _set_position(self, words):
+        if len(words) == 1:
+            self.x = self.y = self.z = self.e = 0.0
+        for word in words[1:]:
+            axis = word[:1].upper()
+            try:
+                value = float(word[1:])
+            except ValueError:
+                continue
+            if axis == b"E":
+                self.e = value
+            elif axis == b"X":
+                self.x = value
+            elif axis == b"Y":
+                self.y = value
+            elif axis == b"Z":
+                self.z = value
+
+    def _dwell(self, words):
+        for word in words[1:]:
+            axis = word[:1].upper()
+            try:
+                value = float(word[1:])
+            except ValueError:
+                continue
+            if axis == b"P":
+                self.time += value / 1000.0
+            elif axis == b"S":
+                self.time += value
+
+    @staticmethod
+    def _temperature(words) -> int:
+        for word in words[1:]:
+            if word[:1] in (b"S", b"s"):
+                try:
+                    return int(float(word[1:]))
+                except ValueError:
+                    return 0
+        return 0
+
+    def _comment(self, text: bytes):
+        # Slicers append their settings as "; key = value" lines
+        key, sep, value = text.partition(b"=")
+        if sep:
+            self.settings[key.strip().decode(errors="replace")] = value.strip().decode(errors="replace")
+
+    def stats(self) -> GcodeStats:
+        layer_height = self._setting_float("layer_height")
+        if layer_height is None and self.second_layer_z is not None:
+            layer_height = round(self.second_layer_z - self.first_layer_z, 3)
+        infill = self.settings.get("fill_density") or self.settings.get("sparse_infill_density")
+        filament_type = self.settings.get("filament_type")
+        return GcodeStats(
+            print_time=self.time,
+            layer_count=self.layers,
+            filament_length=max(0.0, self.extruded),
+            max_nozzle_temp=self.max_nozzle_temp,
+            max_bed_temp=self.max_bed_temp,
+            layer_height=layer_height,
+            # Multi-extruder files list one value per extruder, the first one is printed with
+            filament_type=filament_type.split(";")[0].strip() if filament_type else None,
+            infill=int(float(infill.rstrip("%"))) if infill and infill.rstrip("%").replace(".", "", 1).isdigit() else None
+        )
+
+    def _setting_float(self, key: str) -> Optional[float]:
+        try:
+            return float(self.settings[key])
+        except (KeyError, ValueError):
+            return None
+
+def _chunks(f: BinaryIO) -> Iterable[bytes]:
+    while True:
+        chunk = f.read(CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+def _lines(chunks: Iterable[bytes]) -> Iterable[bytes]:
+    rest = b""
+    for chunk in chunks:
+        lines = (rest + chunk).split(b"\n")
+        rest = lines.pop()
+        yield from lines
+    if rest:
+        yield rest
+
+def analyze_gcode(f: BinaryIO) -> GcodeStats:
+    """
+    Print time, layer count, filament length and temperatures of a G-code file opened in binary mode,
+    streamed in chunks of CHUNK_SIZE bytes
+    """
+    parser = _Parser()
+    parser.feed(_lines(_chunks(f)))
+    return parser.stats()
+
+def file_digest(f: BinaryIO) -> str:
+    digest = hashlib.sha256()
+    for chunk in _chunks(f):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+class GcodeAnalyzer:
+    """
+    Estimates the G-code files of the models (`<models_dir>/<modelId>.gcode`), cached by content.
+
+    Stats are kept in an LRU keyed by the SHA-256 of the file, so a model uploaded again under
+    another ID is recognized after hashing it, which is far cheaper than parsing it. A second LRU
+    maps (path, size, mtime) to the digest, so a file seen before is answered without reading it.
+    """
+
+    def __init__(self, models_dir: str, cache_size: int = 1024):
+        self.models_dir = models_dir
+        self.cache_size = cache_size
+        self._stats: "OrderedDict[str, GcodeStats]" = OrderedDict()
+        self._digests: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"file_hits": 0, "content_hits": 0, "misses": 0}
+
+    def model_path(self, model_id: str) -> str:
+        return os.path.join(self.models_dir, f"{model_id}.gcode")
+
+    def analyze_model(self, model_id: str) -> Optional[GcodeStats]:
+        """
+        Stats of the model's G-code, None if the file is missing or unreadable
+        """
+        path = self.model_path(model_id)
+        try:
+            return self.analyze_file(path)
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logging.warning(f"Could not analyze G-code of model {model_id}: {e}")
+            return None
+
+    def analyze_file(self, path: str) -> GcodeStats:
+        info = os.stat(path)
+        file_key = (path, info.st_size, info.st_mtime_ns)
+        with self._lock:
+            digest = self._get(self._digests, file_key)
+            stats = self._get(self._stats, digest) if digest else None
+            if stats is not None:
+                self.counters["file_hits"] += 1
+                return stats
+        with open(path, "rb") as f:
+            digest = file_digest(f)
+            with self._lock:
+                stats = self._get(self._stats, digest)
+            if stats is None:
+                f.seek(0)
+                stats = analyze_gcode(f)
+                self.counters["misses"] += 1
+                logging.info(f"Analyzed {path}: {stats.layer_count} layers, {stats.print_time / 60:.0f} min, "
+                             f"{stats.filament_length / 1000:.2f} m of filament")
+            else:
+                self.counters["content_hits"] += 1
+        with self._lock:
+            self._put(self._digests, file_key, digest)
+            self._put(self._stats, digest, stats)
+        return stats
+
+    @staticmethod
+    def _get(cache: OrderedDict, key):
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+
+    def _put(self, cache: OrderedDict, key, value):
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > self.cache_size:
+            cache.popitem(last=False)
@@ -1,11 +1,16 @@
 import time
+import queue
 import threading
 import logging
-import requests
+from collections import deque
 from dataclasses import asdict
 import numpy as np
-from typing import Optional
-from app.persistence.repository import JobHandlerRepository
+from typing import Deque, Dict, List, Optional, Tuple
+from app.client.queue_client import CircuitOpenError, QueueManagerClient
+from app.persistence.repository import JobHandlerRepository, InFlightAssignment
+from app.persistence.state_file import PrinterStateFile
+from app.services.liveness_registry import LivenessRegistry
+from app.model.scheduler import Scheduler, FirstAvailablePolicy, JobProfile
 from app.dto.job_dto import Job
 from app.dto.assignment_dto import Assignment
 from app.dto.printer_progress_dto import PrinterProgress
@@ -15,8 +20,22 @@ from app.mqtt.publisher import MQTTPublisher
 from app.mqtt.subscriber import MQTTSubscriber
 
 class JobHandler:
-    def __init__(self, broker_host: str, broker_port: int, queue_manager_url: str):
+    # Pause after a failed request to the queue manager, so that an outage does not turn into a busy loop
+    ERROR_BACKOFF_SECONDS = 2
+    # Assignment latency samples kept for the statistics, and how often they are logged
+    LATENCY_SAMPLES = 1000
+    LATENCY_LOG_EVERY = 50
+
+    def __init__(self, broker_host: str, broker_port: int, queue_manager_url: str,
+                 poll_wait: float = 10, lease_time: float = 60, scheduler: Optional[Scheduler] = None,
+                 queue_client: Optional[QueueManagerClient] = None,
+                 ack_timeout: float = 10, max_republish: int = 1,
+                 state_file: Optional[PrinterStateFile] = None,
+                 pipelining: bool = False, reservation_lease_time: float = 600,
+                 liveness: Optional[LivenessRegistry] = None):
         self.repo = JobHandlerRepository()
+        # Checkpoint of the printer states, reloaded on start (None: start from scratch)
+        self.state_file = state_file
         self.publisher = MQTTPublisher(broker_host, broker_port)
         self.subscriber = MQTTSubscriber(
             broker_host, broker_port,
@@ -24,94 +43,434 @@ class JobHandler:
             self.on_robot_progress
         )
         self.queue_manager_url = queue_manager_url
-        self.discovery_time = 10  # seconds
+        # Pooled keep-alive client with timeouts, retries and a circuit breaker
+        self.queue_client = queue_client or QueueManagerClient(queue_manager_url)
+        # Long-poll timeout of job requests, the queue manager answers as soon as a job is enqueued
+        self.poll_wait = poll_wait
+        # Jobs are leased and acked once their printer starts printing; a crash before the ack re-queues them after lease_time
+        self.lease_time = lease_time
+        # Seconds a printer has to report it is printing an assignment, and how many times a lost one is re-published
+        self.ack_timeout = ack_timeout
+        self.max_republish = max_republish
+        # Reserve the next job of a printer while it awaits cleaning, it starts as soon as the plate is cleared.
+        # The lease of a reserved job is renewed for reservation_lease_time seconds until then.
+        self.pipelining = pipelining
+        self.reservation_lease_time = reservation_lease_time
+        # Map of jobId to the leaseId it was handed out under and the monotonic time the lease expires
+        self.job_leases: Dict[str, Tuple[str, float]] = {}
+        # Acks that failed, retried until the lease would have expired anyway: (jobId, leaseId, deadline)
+        self.pending_acks: Deque[Tuple[str, str, float]] = deque()
+        # Decides which printer gets which job
+        self.scheduler = scheduler or Scheduler(FirstAvailablePolicy())
+        # Events of the dispatcher (MQTT thread -> dispatcher): ("available", printerId, None) when a printer
+        # becomes available, ("finished", printerId, None) when it awaits cleaning and can get a reservation,
+        # ("printing", printerId, jobId) when it starts printing a job, ("offline", printerId, None) when it went silent
+        self.events: "queue.Queue[Tuple[str, str, Optional[str]]]" = queue.Queue()
+        # Monotonic time at which each available printer reported it was idle
+        self.idle_since: Dict[str, float] = {}
+        # Latest idle message -> assignment publish latencies, in seconds
+        self.assignment_latencies: Deque[float] = deque(maxlen=self.LATENCY_SAMPLES)
+        self.assignment_count = 0
+        # Printers heard from within the TTL; silent ones are dropped and their assignments return to the queue
+        self.liveness = liveness or LivenessRegistry()
+        self.liveness.subscribe(on_offline=self.notify_printer_offline)
 
     def start(self):
         logging.info("Starting JobHandler...")
+        # Printers known before the restart are dispatched to right away, the others as soon as their first idle message arrives
+        if self.state_file is not None:
+            self.restore_state()
+            self.state_file.start(self.repo)
+        self.liveness.start()
         self.subscriber.connect()
-        self.discovery_phase()
         self.main_loop()
 
-    def discovery_phase(self):
-        logging.info(f"Discovery phase started for {self.discovery_time} seconds.")
-        start_time = time.time()
-        while time.time() - start_time < self.discovery_time:
-            # The on_printer_progress callback will populate available printers
-            time.sleep(1)
-        logging.info(f"Discovery phase ended. Available printers: {self.repo.get_available_printers()}")
+    def restore_state(self):
+        # Live progress messages correct whatever changed while the handler was down
+        state = self.state_file.load()
+        if state is None:
+            logging.info("No printer state to restore, waiting for the printers to report.")
+            return
+        self.repo.load_state(state, self.ack_timeout)
+        # Restored printers have one TTL to show up, the ones that are gone are dropped then
+        for printer_id in self.repo.get_known_printers():
+            self.liveness.touch(printer_id)
+        logging.info(f"Restored printer states from {self.state_file.path}: "
+                     f"available {self.repo.get_available_printers()}, busy {self.repo.get_busy_printers()}, "
+                     f"awaiting cleaning {self.repo.get_awaiting_cleaning_printers()}, "
+                     f"{len(self.repo.in_flight)} assignments in flight")
+
+    def notify_printer_available(self, printer_id: str):
+        # Called from the MQTT thread: remember when the printer turned idle and wake up the dispatcher
+        self.idle_since.setdefault(printer_id, time.monotonic())
+        self.events.put(("available", printer_id, None))
+
+    def notify_printer_finished(self, printer_id: str):
+        # Called from the MQTT thread: the printer can get its next job reserved
+        if self.pipelining:
+            self.events.put(("finished", printer_id, None))
+
+    def notify_printing_started(self, printer_id: str, job_id: str):
+        # Called from the MQTT thread: the lease is acked by the dispatcher, not on the MQTT network loop
+        self.events.put(("printing", printer_id, job_id))
+
+    def notify_printer_offline(self, printer_id: str):
+        # Called from the liveness thread: the dispatcher drops the printer and returns its assignment
+        self.events.put(("offline", printer_id, None))
+
+    def wait_for_event(self, timeout: Optional[float] = None):
+        # Block until an event arrives, then handle the ones that are already pending
+        try:
+            event = self.events.get(timeout=timeout)
+        except queue.Empty:
+            return
+        self.handle_event(event)
+        self.drain_events()
+
+    def drain_events(self):
+        while True:
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                return
+            self.handle_event(event)
+
+    def handle_event(self, event: Tuple[str, str, Optional[str]]):
+        kind, printer_id, job_id = event
+        if kind == "printing":
+            self.confirm_assignment(printer_id, job_id)
+        elif kind == "offline":
+            self.drop_printer(printer_id)
+        # Availability wake-ups are covered by the availability reads of the dispatch loop
+
+    def pause(self, seconds: float):
+        # Sleep without leaving printing acks and assignment deadlines unattended
+        until = time.monotonic() + seconds
+        while (remaining := until - time.monotonic()) > 0:
+            self.wait_for_event(self.until_next_deadline(remaining))
+            self.check_in_flight()
 
     def main_loop(self):
-        logging.info("Entering main job assignment loop.")
+        logging.info("Entering event-driven dispatch loop.")
         while True:
+            # Wake-ups received so far are covered by the availability read below
+            self.drain_events()
+            self.check_in_flight()
+            self.retry_pending_acks()
             available_printers = self.repo.get_available_printers()
-            if not available_printers:
-                time.sleep(2)
+            reservable_printers = self.repo.get_reservable_printers() if self.pipelining else []
+            if not available_printers and not reservable_printers:
+                # Nothing to dispatch to: block until a printer message or the next assignment deadline
+                self.wait_for_event(self.until_next_deadline())
+                continue
+            # One long-poll request fetches a window of jobs for every idle printer, it blocks only while the queue is empty
+            printer_ids = available_printers + reservable_printers
+            jobs = self.request_jobs(printer_ids, self.scheduler.window_size(len(printer_ids)))
+            if jobs is None:
+                # While the circuit is open there is no point in asking before the next probe
+                self.pause(max(self.ERROR_BACKOFF_SECONDS, self.queue_client.retry_after()))
                 continue
-            for printer_id in available_printers:
-                job = self.request_job()
-                if job:
-                    self.assign_job_to_printer(printer_id, job)
-                else:
-                    break  # No more jobs available
-            time.sleep(2)
-
-    def request_job(self) -> Optional[Job]:
+            # Idle printers pick first, they start right away; printers awaiting cleaning reserve from the rest
+            matches = self.scheduler.match(available_printers, jobs) if available_printers else []
+            # The leases of assigned jobs are acked once their printers report they are printing them
+            for printer_id, profile in matches:
+                self.assign_job_to_printer(printer_id, profile.job, profile)
+            assigned = {profile.job.id for _, profile in matches}
+            remaining = [job for job in jobs if job.id not in assigned]
+            if reservable_printers and remaining:
+                for printer_id, profile in self.scheduler.match(reservable_printers, remaining):
+                    if self.reserve_job_for_printer(printer_id, profile.job, profile):
+                        assigned.add(profile.job.id)
+            # Jobs left out of the window go back to the queue with their original priority and submission time
+            for job in remaining:
+                if job.id not in assigned:
+                    self.release_job(job.id, ack=False)
+            if jobs and not assigned:
+                # No idle printer can take the queued jobs: the next poll would lease the same jobs at once.
+                # Wait for a printer to change state, or re-check after poll_wait for newly enqueued jobs.
+                self.wait_for_event(self.until_next_deadline(self.poll_wait))
+
+    def request_jobs(self, printer_ids: List[str], count: Optional[int] = None) -> Optional[List[Job]]:
+        # Returns the leased jobs ([] if none was enqueued within poll_wait), None if the request failed
+        # Come back in time for the next assignment deadline
+        wait = self.until_next_deadline(self.poll_wait)
         try:
-            resp = requests.get(f"{self.queue_manager_url}/prioritary_job")
+            # Not retried after a read timeout: the jobs may have been leased, they come back once the lease expires
+            resp = self.queue_client.get(
+                "/prioritary_job",
+                params={
+                    "count": count or len(printer_ids),
+                    "printerIds": ",".join(printer_ids),
+                    "wait": wait,
+                    "lease": self.lease_time
+                },
+                extra_read_time=wait,
+                idempotent=False
+            )
             if resp.status_code == 200:
                 job_data = resp.json()
-                if 'jobs' in job_data and job_data['jobs']:
-                    job = Job(**job_data['jobs'][0])  # Prendi il primo job
-                else:
-                    job = Job(**job_data)  # Parsing diretto se
-                logging.info(f"Received job from queue manager: {job}")
-                return job
+                jobs = [Job(**data) for data in job_data.get('jobs', [])]
+                lease_expires = time.monotonic() + self.lease_time
+                for lease in job_data.get('leases', []):
+                    self.job_leases[lease['jobId']] = (lease['leaseId'], lease_expires)
+                logging.info(f"Received {len(jobs)} jobs from queue manager: {[job.id for job in jobs]}")
+                return jobs
             else:
                 logging.info("No jobs available from queue manager.")
-                return None
+                return []
+        except CircuitOpenError as e:
+            logging.warning(f"Not requesting jobs: {e}")
+            return None
         except Exception as e:
-            logging.error(f"Error requesting job: {e}")
+            logging.error(f"Error requesting jobs: {e}")
             return None
 
-    def assign_job_to_printer(self, printer_id: str, job: Job):
-        # Build assignment DTO (fill with real data as needed)
-        assignment = Assignment(
+    def release_job(self, job_id: str, ack: bool):
+        # Nack a job left out of the window so the queue manager re-queues it immediately
+        lease = self.job_leases.pop(job_id, None)
+        if lease is not None:
+            self.release_lease(job_id, lease[0], lease[1], ack)
+
+    def release_lease(self, job_id: str, lease_id: Optional[str], lease_expires: float, ack: bool):
+        # Ack a job a printer is printing, or nack it so the queue manager re-queues it immediately
+        if lease_id is None:
+            return
+        if not self.send_release(job_id, lease_id, ack) and ack:
+            # An assigned job whose lease expires would be printed twice: keep trying while the lease lasts.
+            # A lost nack only delays the job until its lease expires.
+            self.pending_acks.append((job_id, lease_id, lease_expires))
+
+    def send_release(self, job_id: str, lease_id: str, ack: bool) -> bool:
+        # Returns False if the queue manager could not be reached, the ack or nack can be sent again
+        action = "ack" if ack else "nack"
+        try:
+            resp = self.queue_client.post(f"/leases/{lease_id}/{action}")
+            if resp.status_code != 204:
+                logging.warning(f"Lease {lease_id} of job {job_id} could not be {action}ed: HTTP {resp.status_code}")
+            return True
+        except CircuitOpenError as e:
+            logging.warning(f"Lease {lease_id} of job {job_id} not {action}ed yet: {e}")
+        except Exception as e:
+            logging.error(f"Error releasing lease of job {job_id}: {e}")
+        return False
+
+    def retry_pending_acks(self):
+        now = time.monotonic()
+        for _ in range(len(self.pending_acks)):
+            job_id, lease_id, deadline = self.pending_acks.popleft()
+            if now >= deadline:
+                logging.error(f"Lease {lease_id} of job {job_id} expired before it could be acked, "
+                              f"the job may be assigned again")
+            elif not self.send_release(job_id, lease_id, ack=True):
+                self.pending_acks.append((job_id, lease_id, deadline))
+
+    def build_assignment(self, job: Job, profile: JobProfile, start_after_cleaning: bool = False) -> Assignment:
+        # Build assignment DTO from the profile the scheduler matched the job with
+        return Assignment(
             jobId=job.id,
             modelUrl=f"models/{job.modelId}.gcode",
-            filamentType="PLA",  # Example, adjust as needed
-            estimatedTime=np.random.randint(30, 90),
+            filamentType=profile.filament_type,
+            estimatedTime=profile.estimated_time,
             priority=job.priority,
             assignedAt=job.submittedAt if isinstance(job.submittedAt, str) else job.submittedAt.isoformat(),
-            parameters={"layerHeight": 0.2, "infill": 20, "nozzleTemp": 210, "bedTemp": 60}
+            parameters={"layerHeight": profile.layer_height, "infill": profile.infill,
+                        "nozzleTemp": profile.nozzle_temp, "bedTemp": profile.bed_temp},
+            startAfterCleaning=start_after_cleaning
         )
+
+    def assign_job_to_printer(self, printer_id: str, job: Job, profile: Optional[JobProfile] = None):
+        assignment = self.build_assignment(job, profile or self.scheduler.profile_job(job))
+        # Tracked from before the publish, the printer may report it is printing the job right away
+        lease_id, lease_expires = self.job_leases.pop(job.id, (None, time.monotonic() + self.lease_time))
+        self.repo.add_in_flight(InFlightAssignment(
+            printer_id=printer_id, job=job, assignment=assignment, lease_id=lease_id,
+            lease_expires=lease_expires, deadline=time.monotonic() + self.ack_timeout
+        ))
         self.publisher.publish_assignment(printer_id, assignment)
         self.repo.mark_printer_busy(printer_id, job)
-        logging.info(f"Assigned job {job.id} to printer {printer_id}")
+        latency = self.record_assignment_latency(printer_id)
+        logging.info(f"Assigned job {job.id} to printer {printer_id}"
+                     + (f" {latency * 1000:.1f} ms after it turned idle" if latency is not None else ""))
+
+    def reserve_job_for_printer(self, printer_id: str, job: Job, profile: JobProfile) -> bool:
+        """
+        Push the next job to a printer that awaits cleaning; it holds the job until the go published once
+        the robot cleared its plate. Returns False if the printer was cleaned meanwhile (the job is not used).
+        """
+        lease_id, lease_expires = self.job_leases.get(job.id, (None, time.monotonic() + self.lease_time))
+        in_flight = InFlightAssignment(
+            printer_id=printer_id, job=job, assignment=self.build_assignment(job, profile, start_after_cleaning=True),
+            lease_id=lease_id, lease_expires=lease_expires, deadline=time.monotonic(), reserved=True
+        )
+        if not self.repo.reserve(in_flight):
+            return False
+        self.job_leases.pop(job.id, None)
+        self.publisher.publish_assignment(printer_id, in_flight.assignment)
+        logging.info(f"Reserved job {job.id} for printer {printer_id} while it awaits cleaning")
+        # Hold the job beyond the normal lease, until the plate is cleared
+        self.renew_reservation(in_flight)
+        return True
+
+    def renew_reservation(self, in_flight: InFlightAssignment):
+        job_id, printer_id = in_flight.job.id, in_flight.printer_id
+        now = time.monotonic()
+        try:
+            resp = self.queue_client.post(f"/leases/{in_flight.lease_id}/extend",
+                                          params={"lease": self.reservation_lease_time})
+        except Exception as e:
+            logging.error(f"Error renewing the lease of job {job_id} reserved for printer {printer_id}: {e}")
+            self.repo.renew_in_flight(job_id, now + self.ERROR_BACKOFF_SECONDS)
+            return
+        if resp.status_code == 200:
+            self.repo.renew_in_flight(job_id, now + self.reservation_lease_time / 2,
+                                      lease_expires=now + self.reservation_lease_time)
+            return
+        # The job went back to the queue: forget it, the printer drops it for the next assignment it receives
+        logging.error(f"Lease of job {job_id} reserved for printer {printer_id} is gone (HTTP {resp.status_code}), "
+                      f"dropping the reservation")
+        self.repo.pop_in_flight(job_id)
+
+    def confirm_assignment(self, printer_id: str, job_id: str):
+        # The first printing progress of the job is the printer's acknowledgement of the assignment
+        in_flight = self.repo.pop_in_flight(job_id)
+        if in_flight is None:
+            return
+        if in_flight.printer_id != printer_id:
+            logging.warning(f"Job {job_id} assigned to printer {in_flight.printer_id} is printed by {printer_id}")
+        logging.info(f"Printer {printer_id} started job {job_id}, acking its lease")
+        self.release_lease(job_id, in_flight.lease_id, in_flight.lease_expires, ack=True)
+
+    def check_in_flight(self):
+        """
+        Re-publish the assignments whose printer did not start printing in time, while the lease
+        leaves room for another attempt; otherwise return the job to the priority queue.
+        """
+        now = time.monotonic()
+        for in_flight in self.repo.get_expired_in_flight(now):
+            job_id, printer_id = in_flight.job.id, in_flight.printer_id
+            if in_flight.reserved:
+                self.renew_reservation(in_flight)
+                continue
+            # The next deadline plus a long poll that may delay the ack must fit in the lease
+            if in_flight.attempts <= self.max_republish and now + self.ack_timeout + self.poll_wait < in_flight.lease_expires:
+                if self.repo.retry_in_flight(job_id, now + self.ack_timeout) is None:
+                    # Started by the printer meanwhile
+                    continue
+                logging.warning(f"Printer {printer_id} did not start job {job_id} within {self.ack_timeout}s, "
+                                f"re-publishing the assignment (attempt {in_flight.attempts})")
+                self.publisher.publish_assignment(printer_id, in_flight.assignment)
+                continue
+            logging.warning(f"Printer {printer_id} never started job {job_id}, returning it to the queue")
+            self.repo.pop_in_flight(job_id)
+            self.repo.mark_printer_unreachable(printer_id)
+            self.release_lease(job_id, in_flight.lease_id, in_flight.lease_expires, ack=False)
+
+    def drop_printer(self, printer_id: str):
+        """
+        Forget a printer that stopped sending messages: it is no longer dispatched to and the job
+        assigned or reserved to it goes back to the queue. Its next message adds it again.
+        """
+        if self.liveness.is_online(printer_id):
+            # It spoke again after the event was queued
+            return
+        message = f"Printer {printer_id} offline: no message for {self.liveness.ttl}s"
+        in_flight = self.repo.get_in_flight_for_printer(printer_id)
+        job = self.repo.get_job_for_printer(printer_id)
+        if in_flight is not None:
+            self.repo.pop_in_flight(in_flight.job.id)
+            self.release_lease(in_flight.job.id, in_flight.lease_id, in_flight.lease_expires, ack=False)
+            message += f", job {in_flight.job.id} returned to the queue"
+        elif job is not None and printer_id not in self.repo.awaiting_cleaning:
+            message += f", job {job.id} it was printing is lost"
+        self.repo.mark_printer_unreachable(printer_id)
+        self.idle_since.pop(printer_id, None)
+        logging.warning(message)
+
+    def until_next_deadline(self, limit: Optional[float] = None) -> Optional[float]:
+        # Seconds until the earliest assignment deadline, capped at `limit` (None: no deadline and no limit)
+        deadline = self.repo.next_in_flight_deadline()
+        if deadline is None:
+            return limit
+        remaining = max(0.0, deadline - time.monotonic())
+        return remaining if limit is None else min(limit, remaining)
+
+    def record_assignment_latency(self, printer_id: str) -> Optional[float]:
+        # End-to-end latency from the printer's idle message to the assignment publish
+        idle_since = self.idle_since.pop(printer_id, None)
+        if idle_since is None:
+            return None
+        latency = time.monotonic() - idle_since
+        self.assignment_latencies.append(latency)
+        self.assignment_count += 1
+        if self.assignment_count % self.LATENCY_LOG_EVERY == 0:
+            logging.info(f"Assignment latency over the last {len(self.assignment_latencies)} assignments: "
+                         f"{self.get_latency_stats()}")
+            logging.info(f"Queue manager requests: {self.queue_client.get_stats()}")
+        return latency
+
+    def get_latency_stats(self) -> Dict[str, float]:
+        # Percentiles in milliseconds; they include the time a printer waited on an empty queue
+        if not self.assignment_latencies:
+            return {}
+        samples = np.array(self.assignment_latencies) * 1000
+        return {
+            "count": len(samples),
+            "mean_ms": round(float(samples.mean()), 1),
+            "p50_ms": round(float(np.percentile(samples, 50)), 1),
+            "p95_ms": round(float(np.percentile(samples, 95)), 1),
+            "max_ms": round(float(samples.max()), 1)
+        }
 
     def on_printer_progress(self, progress: PrinterProgress):
+        self.liveness.touch(progress.printerId)
         if progress.status == "idle" and progress.progress == 100:
             # Job completed, notify robot manager
             self.repo.mark_printer_awaiting_cleaning(progress.printerId)
+            self.notify_printer_finished(progress.printerId)
             printers_list = PrintersList(
                 printers=[PrinterStatus(printerId=progress.printerId, status="idle", timestamp=progress.timestamp)]
             )
             self.publisher.publish_printers_list(printers_list)
             logging.info(f"Printer {progress.printerId} completed job, published to robot manager.")
         elif progress.status == "idle":
-            # Printer is idle and not assigned, add to available
+            if progress.printerId in self.repo.in_flight_printers:
+                # Its assignment is still on the way (or lost): it stays busy until the deadline decides
+                return
+            # Printer is idle and not assigned, add to available and wake up the dispatcher
             self.repo.add_available_printer(progress.printerId)
+            self.notify_printer_available(progress.printerId)
         elif progress.status == "printing":
             # Printer is busy, ensure it's not in available
-            self.repo.busy_printers.add(progress.printerId)
-            self.repo.available_printers.discard(progress.printerId)
+            self.repo.mark_printer_printing(progress.printerId)
+            self.idle_since.pop(progress.printerId, None)
+            if progress.jobId in self.repo.in_flight:
+                self.notify_printing_started(progress.printerId, progress.jobId)
 
     def on_robot_progress(self, progress: RobotProgress):
         if progress.status == "completed":
-            # Cleaning done, mark printer as available
-            self.repo.mark_printer_available(progress.printerId)
+            if not self.liveness.is_online(progress.printerId):
+                # Cleaned a printer that went silent: it is dispatched to again once it reports idle
+                self.repo.mark_printer_unreachable(progress.printerId)
+                logging.info(f"Printer {progress.printerId} cleaned but offline, waiting for it to report.")
+                return
+            # Cleaning done: start the reserved job right away (published from this thread, no dispatch round trip)
+            reservation = self.repo.mark_printer_cleaned(progress.printerId, self.ack_timeout)
+            if reservation is not None:
+                self.publisher.publish_assignment(progress.printerId, reservation.assignment)
+                logging.info(f"Printer {progress.printerId} cleaned, starting reserved job {reservation.job.id}.")
+                return
+            # Otherwise mark printer as available
+            self.notify_printer_available(progress.printerId)
             logging.info(f"Printer {progress.printerId} cleaned and available.")
 
     def stop(self):
+        if self.assignment_latencies:
+            logging.info(f"Assignment latency: {self.get_latency_stats()}")
+        logging.info(f"Queue manager requests: {self.queue_client.get_stats()}")
+        self.queue_client.close()
+        self.liveness.stop()
+        if self.state_file is not None:
+            self.state_file.stop(self.repo)
         self.subscriber.disconnect()
         self.publisher.disconnect()
         logging.info("JobHandler stopped.")
\ No newline at end of file
@@ -0,0 +1,282 @@
+import math
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from app.dto.job_dto import Job
+from app.model.gcode_analyzer import GcodeAnalyzer, GcodeStats
+
+# Print speed the estimated print times refer to (mm/s)
+REFERENCE_PRINT_SPEED = 60
+
+@dataclass
+class PrinterProfile:
+    # Same keys as the printer_config.yaml of the printers
+    printer_id: str
+    filament_type: str = "PLA"      # filament currently loaded
+    nozzle_diameter: float = 0.4
+    max_nozzle_temp: int = 250
+    print_speed: float = REFERENCE_PRINT_SPEED
+
+@dataclass
+class JobProfile:
+    job: Job
+    filament_type: str = "PLA"
+    nozzle_temp: int = 210
+    estimated_time: int = 60        # minutes at the reference print speed
+    layer_height: float = 0.2
+    infill: int = 20                # percent
+    bed_temp: int = 60
+
+    def print_time_on(self, printer: PrinterProfile) -> float:
+        return self.estimated_time * REFERENCE_PRINT_SPEED / printer.print_speed
+
+class MatchingPolicy:
+    """
+    Decides which of the window's jobs go to which idle printers.
+    Jobs come in queue order (highest priority first).
+    """
+    name = ""
+
+    def match(self, printers: List[PrinterProfile], jobs: List[JobProfile]) -> List[Tuple[PrinterProfile, JobProfile]]:
+        raise NotImplementedError
+
+    @staticmethod
+    def compatible(printer: PrinterProfile, job: JobProfile) -> bool:
+        return job.nozzle_temp <= printer.max_nozzle_temp
+
+class FirstAvailablePolicy(MatchingPolicy):
+    """
+    Jobs that prefer one of the idle printers get it, the others take the remaining printers in order.
+    Printer capabilities are not checked.
+    """
+    name = "first_available"
+
+    def match(self, printers, jobs):
+        free_printers = list(printers)
+        by_id = {printer.printer_id: printer for printer in printers}
+        matches = []
+        unmatched = []
+        for job in jobs[:len(printers)]:
+            preferred = by_id.get(job.job.assignedPrinterId)
+            if preferred in free_printers:
+                free_printers.remove(preferred)
+                matches.append((preferred, job))
+            else:
+                unmatched.append(job)
+        for printer, job in zip(free_printers, unmatched):
+            matches.append((printer, job))
+        return matches
+
+class GreedyCompatiblePolicy(MatchingPolicy):
+    """
+    Jobs in queue order take their preferred printer, else a compatible printer that
+    already has their filament loaded, else any compatible printer.
+    """
+    name = "greedy_compatible"
+
+    def match(self, printers, jobs):
+        free_printers = list(printers)
+        matches = []
+        for job in jobs:
+            if not free_printers:
+                break
+            candidates = [printer for printer in free_printers if self.compatible(printer, job)]
+            if not candidates:
+                continue
+            printer = next((p for p in candidates if p.printer_id == job.job.assignedPrinterId), None) \
+                or next((p for p in candidates if p.filament_type == job.filament_type), None) \
+                or candidates[0]
+            free_printers.remove(printer)
+            matches.append((printer, job))
+        return matches
+
+class ThroughputPolicy(MatchingPolicy):
+    """
+    Minimum-cost assignment (Hungarian algorithm) of the window's jobs to the idle printers.
+
+    Priority ordering is kept by giving priority levels a weight larger than every other
+    cost, so a job is never passed over for a lower priority one that could take its place.
+    Among jobs of the same priority the cost of a pair is, in minutes:
+    - the time the job takes on that printer beyond the reference speed (long jobs go to fast printers)
+    - `swap_minutes` if the printer has to change filament
+    - `preference_minutes` if the job prefers another printer
+    - `order_minutes` per position in the queue, so equal jobs keep their queue order
+    Incompatible pairs (nozzle temperature above the printer limit) are never chosen.
+    """
+    name = "throughput"
+
+    PRIORITY_WEIGHT = 1e6
+    INCOMPATIBLE = 1e12
+
+    def __init__(self, swap_minutes: float = 15, preference_minutes: float = 60, order_minutes: float = 1):
+        self.swap_minutes = swap_minutes
+        self.preference_minutes = preference_minutes
+        self.order_minutes = order_minutes
+
+    def cost(self, printer: PrinterProfile, job: JobProfile, priority_rank: int, position: int) -> float:
+        if not self.compatible(printer, job):
+            return self.INCOMPATIBLE
+        cost = priority_rank * self.PRIORITY_WEIGHT + position * self.order_minutes
+        cost += job.print_time_on(printer) - job.estimated_time
+        if printer.filament_type != job.filament_type:
+            cost += self.swap_minutes
+        if job.job.assignedPrinterId and job.job.assignedPrinterId != printer.printer_id:
+            cost += self.preference_minutes
+        return cost
+
+    def match(self, printers, jobs):
+        if not printers or not jobs:
+            return []
+        # Rank 0 for the highest priority of the window, 1 for the next level, ...
+        levels = sorted({int(job.job.priority) for job in jobs}, reverse=True)
+        rank = {priority: index for index, priority in enumerate(levels)}
+        cost = [[self.cost(printer, job, rank[int(job.job.priority)], position) for position, job in enumerate(jobs)]
+                for printer in printers]
+        if len(printers) <= len(jobs):
+            pairs = enumerate(solve_assignment(cost))
+        else:
+            transposed = [list(column) for column in zip(*cost)]
+            pairs = ((row, column) for column, row in enumerate(solve_assignment(transposed)))
+        return [(printers[row], jobs[column]) for row, column in pairs if cost[row][column] < self.INCOMPATIBLE]
+
+def solve_assignment(cost: List[List[float]]) -> List[int]:
+    """
+    Minimum-cost assignment of every row to a distinct column (rows <= columns).
+    Hungarian algorithm with potentials, O(rows^2 * columns). Returns the column of each row.
+    """
+    n, m = len(cost), len(cost[0])
+    inf = float("inf")
+    u = [0.0] * (n + 1)
+    v = [0.0] * (m + 1)
+    owner = [0] * (m + 1)   # row assigned to each column (1-based, 0 = none)
+    way = [0] * (m + 1)
+    for row in range(1, n + 1):
+        owner[0] = row
+        column = 0
+        min_slack = [inf] * (m + 1)
+        used = [False] * (m + 1)
+        while True:
+            used[column] = True
+            current_row = owner[column]
+            delta = inf
+            next_column = 0
+            row_cost = cost[current_row - 1]
+            for j in range(1, m + 1):
+                if not used[j]:
+                    slack = row_cost[j - 1] - u[current_row] - v[j]
+                    if slack < min_slack[j]:
+                        min_slack[j] = slack
+                        way[j] = column
+                    if min_slack[j] < delta:
+                        delta = min_slack[j]
+                        next_column = j
+            for j in range(m + 1):
+                if used[j]:
+                    u[owner[j]] += delta
+                    v[j] -= delta
+                else:
+                    min_slack[j] -= delta
+            column = next_column
+            if owner[column] == 0:
+                break
+        # Flip the augmenting path
+        while column:
+            previous = way[column]
+            owner[column] = owner[previous]
+            column = previous
+    assignment = [0] * n
+    for j in range(1, m + 1):
+        if owner[j]:
+            assignment[owner[j] - 1] = j - 1
+    return assignment
+
+POLICIES = {
+    FirstAvailablePolicy.name: FirstAvailablePolicy,
+    GreedyCompatiblePolicy.name: GreedyCompatiblePolicy,
+    ThroughputPolicy.name: ThroughputPolicy,
+}
+
+def create_policy(name: str, **options) -> MatchingPolicy:
+    if name not in POLICIES:
+        raise ValueError(f"Unknown scheduling policy {name}, expected one of {list(POLICIES)}")
+    return POLICIES[name](**options)
+
+class Scheduler:
+    """
+    Matches idle printers with a window of the top priority jobs through a pluggable policy,
+    and keeps track of the filament loaded in each printer.
+    """
+
+    def __init__(self, policy: MatchingPolicy, window: int = 1,
+                 printers: Optional[Dict[str, dict]] = None, default_printer: Optional[dict] = None,
+                 default_job: Optional[dict] = None, analyzer: Optional[GcodeAnalyzer] = None):
+        self.policy = policy
+        # Jobs requested per idle printer; the ones not assigned are given back to the queue
+        self.window = max(1, window)
+        self.printer_configs = printers or {}
+        self.default_printer = default_printer or {}
+        self.default_job = default_job or {}
+        # Estimates jobs from their G-code, jobs without one get default_job
+        self.analyzer = analyzer
+        self.printers: Dict[str, PrinterProfile] = {}
+
+    @classmethod
+    def from_config(cls, config: dict) -> "Scheduler":
+        scheduler_config = config.get("scheduler", {})
+        gcode_config = config.get("gcode", {})
+        analyzer = None
+        if gcode_config.get("models_dir"):
+            analyzer = GcodeAnalyzer(gcode_config["models_dir"], cache_size=gcode_config.get("cache_size", 1024))
+        name = scheduler_config.get("policy", FirstAvailablePolicy.name)
+        policy = create_policy(name, **scheduler_config.get("options", {}).get(name, {}))
+        return cls(
+            policy,
+            window=scheduler_config.get("window", 1),
+            printers=config.get("printers", {}),
+            default_printer=scheduler_config.get("default_printer"),
+            default_job=scheduler_config.get("default_job"),
+            analyzer=analyzer
+        )
+
+    def window_size(self, idle_printers: int) -> int:
+        return idle_printers * self.window
+
+    def printer(self, printer_id: str) -> PrinterProfile:
+        profile = self.printers.get(printer_id)
+        if profile is None:
+            config = {**self.default_printer, **self.printer_configs.get(printer_id, {})}
+            profile = self.printers[printer_id] = PrinterProfile(printer_id=printer_id, **config)
+        return profile
+
+    def profile_job(self, job: Job) -> JobProfile:
+        profile = JobProfile(job=job, **self.default_job)
+        stats = self.analyzer.analyze_model(job.modelId) if self.analyzer else None
+        if stats is not None:
+            self.apply_stats(profile, stats)
+        return profile
+
+    @staticmethod
+    def apply_stats(profile: JobProfile, stats: GcodeStats):
+        # Values the slicer did not write keep the defaults
+        profile.estimated_time = max(1, math.ceil(stats.print_time / 60))
+        if stats.max_nozzle_temp:
+            profile.nozzle_temp = stats.max_nozzle_temp
+        if stats.max_bed_temp:
+            profile.bed_temp = stats.max_bed_temp
+        if stats.filament_type:
+            profile.filament_type = stats.filament_type
+        if stats.layer_height:
+            profile.layer_height = stats.layer_height
+        if stats.infill is not None:
+            profile.infill = stats.infill
+
+    def match(self, printer_ids: List[str], jobs: List[Job]) -> List[Tuple[str, JobProfile]]:
+        return self.match_profiles(printer_ids, [self.profile_job(job) for job in jobs])
+
+    def match_profiles(self, printer_ids: List[str], jobs: List[JobProfile]) -> List[Tuple[str, JobProfile]]:
+        matches = self.policy.match([self.printer(printer_id) for printer_id in printer_ids], jobs)
+        for printer, job in matches:
+            if printer.filament_type != job.filament_type:
+                logging.info(f"Printer {printer.printer_id} switches from {printer.filament_type} to {job.filament_type}")
+                printer.filament_type = job.filament_type
+        return [(printer.printer_id, job) for printer, job in matches]
@@ -1,8 +1,47 @@
-from typing import Dict, Optional, Set
+import time
+import threading
+from functools import wraps
+from dataclasses import asdict, dataclass, replace
+from typing import Dict, List, Optional, Set
 from app.dto.job_dto import Job
+from app.dto.assignment_dto import Assignment
+
+@dataclass
+class InFlightAssignment:
+    # Assignment published to a printer that has not started printing it yet
+    printer_id: str
+    job: Job
+    assignment: Assignment
+    lease_id: Optional[str]
+    lease_expires: float        # monotonic time at which the queue manager re-queues the job
+    deadline: float             # monotonic time by which the printer must report it is printing
+                                # (reserved: by which the lease has to be renewed)
+    attempts: int = 1           # times the assignment was published
+    reserved: bool = False      # published while the printer awaits cleaning, started once the plate is cleared
+
+def synchronized(method):
+    # Printer states are updated from the MQTT thread and read by the dispatcher and the checkpoint thread
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+def changes_state(method):
+    # Bumps the version so the next checkpoint writes the state file
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            result = method(self, *args, **kwargs)
+            self.version += 1
+            return result
+    return wrapper
 
 class JobHandlerRepository:
     def __init__(self):
+        self._lock = threading.RLock()
+        # Incremented on every state change
+        self.version = 0
         # Set of printerIds that are available for assignment
         self.available_printers: Set[str] = set()
         # Set of printerIds that are currently busy (printing or awaiting cleaning)
@@ -11,36 +50,204 @@ class JobHandlerRepository:
         self.printer_jobs: Dict[str, Job] = {}
         # Set of printerIds that are awaiting cleaning
         self.awaiting_cleaning: Set[str] = set()
+        # Map of jobId to its assignment, until the printer reports it is printing the job
+        self.in_flight: Dict[str, InFlightAssignment] = {}
+        # Map of printerId to the jobId in flight to it
+        self.in_flight_printers: Dict[str, str] = {}
 
+    @changes_state
     def add_available_printer(self, printer_id: str):
         self.available_printers.add(printer_id)
         self.busy_printers.discard(printer_id)
         self.awaiting_cleaning.discard(printer_id)
 
+    @changes_state
     def mark_printer_busy(self, printer_id: str, job: Job):
         self.busy_printers.add(printer_id)
         self.available_printers.discard(printer_id)
         self.awaiting_cleaning.discard(printer_id)
         self.printer_jobs[printer_id] = job
 
+    @changes_state
     def mark_printer_awaiting_cleaning(self, printer_id: str):
         self.awaiting_cleaning.add(printer_id)
         self.busy_printers.add(printer_id)
         self.available_printers.discard(printer_id)
 
+    @changes_state
     def mark_printer_available(self, printer_id: str):
         self.add_available_printer(printer_id)
         if printer_id in self.printer_jobs:
             del self.printer_jobs[printer_id]
 
+    @changes_state
+    def mark_printer_printing(self, printer_id: str):
+        self.busy_printers.add(printer_id)
+        self.available_printers.discard(printer_id)
+        self.awaiting_cleaning.discard(printer_id)
+
+    @changes_state
+    def mark_printer_unreachable(self, printer_id: str):
+        # The printer never picked up its assignment: it is dispatched to again once it reports idle
+        self.available_printers.discard(printer_id)
+        self.busy_printers.discard(printer_id)
+        self.awaiting_cleaning.discard(printer_id)
+        self.printer_jobs.pop(printer_id, None)
+
+    @changes_state
+    def add_in_flight(self, in_flight: InFlightAssignment):
+        self.in_flight[in_flight.job.id] = in_flight
+        self.in_flight_printers[in_flight.printer_id] = in_flight.job.id
+
+    @changes_state
+    def pop_in_flight(self, job_id: str) -> Optional[InFlightAssignment]:
+        in_flight = self.in_flight.pop(job_id, None)
+        if in_flight is not None and self.in_flight_printers.get(in_flight.printer_id) == job_id:
+            del self.in_flight_printers[in_flight.printer_id]
+        return in_flight
+
+    @changes_state
+    def retry_in_flight(self, job_id: str, deadline: float) -> Optional[InFlightAssignment]:
+        """
+        Count one more publication of an in-flight assignment, due to start by `deadline`.
+        Returns None if the printer started it (or it was dropped) in the meantime.
+        """
+        in_flight = self.in_flight.get(job_id)
+        if in_flight is not None:
+            in_flight.attempts += 1
+            in_flight.deadline = deadline
+        return in_flight
+
+    @changes_state
+    def renew_in_flight(self, job_id: str, deadline: float,
+                        lease_expires: Optional[float] = None) -> Optional[InFlightAssignment]:
+        """
+        Move the deadline of an in-flight assignment and, if given, the expiry of its lease.
+        Returns None if it is no longer in flight.
+        """
+        in_flight = self.in_flight.get(job_id)
+        if in_flight is not None:
+            in_flight.deadline = deadline
+            if lease_expires is not None:
+                in_flight.lease_expires = lease_expires
+        return in_flight
+
+    @changes_state
+    def reserve(self, in_flight: InFlightAssignment) -> bool:
+        """
+        Track a reservation, unless the printer was cleaned in the meantime (then nothing is recorded)
+        """
+        if in_flight.printer_id not in self.awaiting_cleaning:
+            return False
+        self.add_in_flight(in_flight)
+        return True
+
+    @changes_state
+    def mark_printer_cleaned(self, printer_id: str, ack_timeout: float) -> Optional[InFlightAssignment]:
+        """
+        The robot cleared the plate: a printer with a reservation turns busy and its reservation becomes a
+        normal in-flight assignment, to be started right away (returned); any other printer becomes available.
+        """
+        in_flight = self.get_in_flight_for_printer(printer_id)
+        if in_flight is None or not in_flight.reserved:
+            self.mark_printer_available(printer_id)
+            return None
+        in_flight.reserved = False
+        in_flight.assignment = replace(in_flight.assignment, startAfterCleaning=False)
+        in_flight.deadline = time.monotonic() + ack_timeout
+        self.mark_printer_busy(printer_id, in_flight.job)
+        return in_flight
+
+    @synchronized
+    def get_reservable_printers(self) -> List[str]:
+        # Printers awaiting cleaning that have no next job yet
+        return [printer_id for printer_id in self.awaiting_cleaning if printer_id not in self.in_flight_printers]
+
+    @synchronized
+    def get_in_flight_for_printer(self, printer_id: str) -> Optional[InFlightAssignment]:
+        job_id = self.in_flight_printers.get(printer_id)
+        return self.in_flight.get(job_id) if job_id else None
+
+    @synchronized
+    def get_expired_in_flight(self, now: float) -> List[InFlightAssignment]:
+        return [in_flight for in_flight in self.in_flight.values() if in_flight.deadline <= now]
+
+    @synchronized
+    def next_in_flight_deadline(self) -> Optional[float]:
+        return min((in_flight.deadline for in_flight in self.in_flight.values()), default=None)
+
+    @synchronized
+    def get_known_printers(self) -> Set[str]:
+        return self.available_printers | self.busy_printers | self.awaiting_cleaning | set(self.in_flight_printers)
+
+    @synchronized
     def get_available_printers(self):
         return list(self.available_printers)
 
+    @synchronized
     def get_busy_printers(self):
         return list(self.busy_printers)
 
+    @synchronized
     def get_awaiting_cleaning_printers(self):
         return list(self.awaiting_cleaning)
 
     def get_job_for_printer(self, printer_id: str) -> Optional[Job]:
-        return self.printer_jobs.get(printer_id)
\ No newline at end of file
+        return self.printer_jobs.get(printer_id)
+
+    @synchronized
+    def to_state(self) -> dict:
+        """
+        Printer states and in-flight assignments as a JSON-serializable dict.
+        Monotonic deadlines are stored as wall-clock times, they do not survive a restart.
+        """
+        offset = time.time() - time.monotonic()
+        return {
+            "available": sorted(self.available_printers),
+            "busy": sorted(self.busy_printers),
+            "awaitingCleaning": sorted(self.awaiting_cleaning),
+            "printerJobs": {printer_id: asdict(job) for printer_id, job in self.printer_jobs.items()},
+            "inFlight": [
+                {
+                    "printerId": in_flight.printer_id,
+                    "job": asdict(in_flight.job),
+                    "assignment": asdict(in_flight.assignment),
+                    "leaseId": in_flight.lease_id,
+                    "leaseExpiresAt": in_flight.lease_expires + offset,
+                    "attempts": in_flight.attempts,
+                    "reserved": in_flight.reserved
+                }
+                for in_flight in self.in_flight.values()
+            ]
+        }
+
+    @changes_state
+    def load_state(self, state: dict, ack_timeout: float):
+        """
+        Restore a state written by `to_state`. In-flight assignments get a fresh deadline of `ack_timeout`
+        seconds, the printer may have started them while the handler was down; reservations are due for
+        a lease renewal right away.
+        Those whose lease already expired were re-queued by the queue manager and are dropped.
+        """
+        offset = time.time() - time.monotonic()
+        now = time.monotonic()
+        self.available_printers = set(state.get("available", []))
+        self.busy_printers = set(state.get("busy", []))
+        self.awaiting_cleaning = set(state.get("awaitingCleaning", []))
+        self.printer_jobs = {printer_id: Job(**job) for printer_id, job in state.get("printerJobs", {}).items()}
+        self.in_flight = {}
+        self.in_flight_printers = {}
+        for record in state.get("inFlight", []):
+            lease_expires = record["leaseExpiresAt"] - offset
+            if lease_expires <= now:
+                continue
+            self.add_in_flight(InFlightAssignment(
+                printer_id=record["printerId"],
+                job=Job(**record["job"]),
+                assignment=Assignment(**record["assignment"]),
+                lease_id=record["leaseId"],
+                lease_expires=lease_expires,
+                deadline=now if record.get("reserved") else now + ack_timeout,
+                attempts=record.get("attempts", 1),
+                reserved=record.get("reserved", False)
+            ))
@@ -0,0 +1,80 @@
+import json
+import os
+import time
+import logging
+import threading
+from typing import Optional
+from app.persistence.repository import JobHandlerRepository
+
+class PrinterStateFile:
+    """
+    Checkpoints the printer states of the repository to a local JSON file, so a
+    restarted handler can dispatch right away instead of waiting for the printers'
+    idle heartbeats.
+
+    A background thread rewrites the file atomically (temporary file, fsync, rename)
+    at most every `interval` seconds, and only when the repository changed.
+    """
+
+    def __init__(self, path: str, interval: float = 1.0, max_age: Optional[float] = None):
+        self.path = path
+        self.interval = interval
+        # States older than this (seconds) are not restored, None restores any state
+        self.max_age = max_age
+        self._saved_version = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def load(self) -> Optional[dict]:
+        """
+        Return the saved state, or None if there is none or it is unusable
+        """
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, "r") as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable state file {self.path}: {e}")
+            return None
+        age = time.time() - state.get("savedAt", 0)
+        if self.max_age is not None and age > self.max_age:
+            logging.info(f"Ignoring state file {self.path}, it is {age:.0f}s old")
+            return None
+        return state
+
+    def save(self, repo: JobHandlerRepository):
+        version = repo.version
+        if version == self._saved_version:
+            return
+        state = repo.to_state()
+        state["savedAt"] = time.time()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(json.dumps(state, separators=(",", ":"), default=str))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._saved_version = version
+
+    def start(self, repo: JobHandlerRepository):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(repo,), daemon=True)
+        self._thread.start()
+
+    def _run(self, repo: JobHandlerRepository):
+        while not self._stop.wait(self.interval):
+            try:
+                self.save(repo)
+            except Exception as e:
+                logging.error(f"Failed to checkpoint printer states to {self.path}: {e}")
+
+    def stop(self, repo: JobHandlerRepository):
+        # Final checkpoint, so a clean shutdown loses nothing
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.save(repo)
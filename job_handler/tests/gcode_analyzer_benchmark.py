@@ -0,0 +1,104 @@
+import argparse
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# Run from the job_handler directory:
+#   python3 tests/gcode_analyzer_benchmark.py
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.model.gcode_analyzer import GcodeAnalyzer
+
+LAYER_HEIGHT = 0.2
+SEGMENTS_PER_LAYER = 2000
+FEED_RATE = 3000        # mm/min of the printing moves
+TRAVEL_RATE = 9000      # mm/min of the travel moves
+EXTRUSION_PER_MM = 0.033
+
+def write_model(path: str, layers: int) -> dict:
+    """
+    Slicer-like G-code: a circle per layer, relative extrusion with a retraction and a Z hop at
+    each layer change, the settings block at the end. Returns the values the analyzer should find.
+    """
+    radius = 40.0
+    step = 2 * math.pi / SEGMENTS_PER_LAYER
+    segment = 2 * radius * math.sin(step / 2)
+    expected = {"layers": layers, "time": 0.0, "filament": 0.0}
+    with open(path, "w") as f:
+        f.write("; generated by gcode_analyzer_benchmark\nM140 S60\nM104 S200\nM190 S60\nM109 S215\n")
+        f.write("G21\nG90\nM83\nG28\nG92 E0\n")
+        f.write(f"G1 Z0.3 F{TRAVEL_RATE}\n")
+        x, y, z = 0.0, 0.0, 0.3
+        for layer in range(layers):
+            z = round(0.2 + (layer + 1) * LAYER_HEIGHT, 3)
+            f.write(f";LAYER_CHANGE\n;Z:{z}\nG1 E-0.8 F2100\nG1 Z{z + 0.4:.3f} F{TRAVEL_RATE}\n")
+            start_x, start_y = 100 + radius, 100.0
+            f.write(f"G1 X{start_x:.3f} Y{start_y:.3f} F{TRAVEL_RATE}\nG1 Z{z:.3f}\nG1 E0.8 F2100\n")
+            expected["time"] += 0.4 * 60 / TRAVEL_RATE + math.hypot(start_x - x, start_y - y) * 60 / TRAVEL_RATE
+            expected["time"] += 0.4 * 60 / TRAVEL_RATE + 2 * 0.8 * 60 / 2100
+            f.write(f"G1 F{FEED_RATE}\n")
+            for i in range(1, SEGMENTS_PER_LAYER + 1):
+                x = 100 + radius * math.cos(i * step)
+                y = 100 + radius * math.sin(i * step)
+                f.write(f"G1 X{x:.3f} Y{y:.3f} E{segment * EXTRUSION_PER_MM:.5f}\n")
+            expected["time"] += SEGMENTS_PER_LAYER * segment * 60 / FEED_RATE
+            expected["filament"] += SEGMENTS_PER_LAYER * round(segment * EXTRUSION_PER_MM, 5)
+        f.write("M104 S0\nM140 S0\nG28 X0\nM84\n")
+        f.write(f"; filament_type = PETG\n; layer_height = {LAYER_HEIGHT}\n; fill_density = 15%\n")
+    return expected
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput of the G-code analyzer and of its content-addressed cache")
+    parser.add_argument("--layers", type=int, default=250)
+    parser.add_argument("--repeats", type=int, default=1000)
+    args = parser.parse_args()
+
+    models_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(models_dir, "model-a.gcode")
+        expected = write_model(path, args.layers)
+        # Same content under another model ID, e.g. a job submitted twice
+        shutil.copy(path, os.path.join(models_dir, "model-b.gcode"))
+        size_mb = os.path.getsize(path) / 1e6
+        with open(path, "rb") as f:
+            lines = sum(1 for _ in f)
+
+        analyzer = GcodeAnalyzer(models_dir)
+        start = time.perf_counter()
+        stats = analyzer.analyze_model("model-a")
+        cold = time.perf_counter() - start
+
+        start = time.perf_counter()
+        analyzer.analyze_model("model-b")
+        content_hit = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(args.repeats):
+            analyzer.analyze_model("model-a")
+        file_hit = (time.perf_counter() - start) / args.repeats
+
+        print("=" * 80)
+        print(f"G-code analyzer benchmark: {lines} lines, {size_mb:.1f} MB, {args.layers} layers")
+        print("=" * 80)
+        print(f"{'case':<34}{'time [ms]':>14}{'lines/s':>16}{'MB/s':>12}")
+        print(f"{'cold (hash + parse)':<34}{cold * 1000:>14.1f}{lines / cold:>16,.0f}{size_mb / cold:>12.1f}")
+        print(f"{'same content, new model ID (hash)':<34}{content_hit * 1000:>14.1f}{lines / content_hit:>16,.0f}"
+              f"{size_mb / content_hit:>12.1f}")
+        print(f"{'same file (stat)':<34}{file_hit * 1000:>14.3f}")
+        print("=" * 80)
+        print(f"{'':<16}{'analyzed':>16}{'expected':>16}")
+        print(f"{'print time [s]':<16}{stats.print_time:>16.1f}{expected['time']:>16.1f}")
+        print(f"{'layers':<16}{stats.layer_count:>16}{expected['layers']:>16}")
+        print(f"{'filament [mm]':<16}{stats.filament_length:>16.1f}{expected['filament']:>16.1f}")
+        print(f"nozzle {stats.max_nozzle_temp} C, bed {stats.max_bed_temp} C, {stats.filament_type}, "
+              f"layer height {stats.layer_height}, infill {stats.infill}%")
+        print(f"cache: {analyzer.counters}")
+        print("=" * 80)
+    finally:
+        shutil.rmtree(models_dir)
+
+if __name__ == "__main__":
+    main()
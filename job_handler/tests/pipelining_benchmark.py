@@ -0,0 +1,197 @@
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import uuid
+
+import numpy as np
+import requests
+
+# Run from the job_handler directory, with a Priority Queue Manager listening on --queue-manager-url:
+#   python3 tests/pipelining_benchmark.py
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import app.model.job_handler as job_handler_module
+from app.dto.printer_progress_dto import PrinterProgress
+from app.dto.robot_progress_dto import RobotProgress
+from app.model.scheduler import Scheduler, FirstAvailablePolicy
+
+# Simulated farm, times in seconds (a print takes minutes in reality, what matters is the gap around it)
+PRINTERS = 6
+PRINT_SECONDS = 0.5
+CLEANING_SECONDS = 0.1      # one robot trip; a single robot serves the printers one at a time
+MQTT_HOP_SECONDS = 0.002    # broker latency of one message
+RUN_SECONDS = 10
+JOBS = 400
+
+class LoopbackBus:
+    """
+    Stands in for the broker: messages reach the simulated printers, the robot and the
+    job handler after MQTT_HOP_SECONDS, in publish order
+    """
+
+    def __init__(self):
+        self.printers = {}
+        self.robot = None
+        self.handler = None
+
+    def deliver(self, callback, *args):
+        timer = threading.Timer(MQTT_HOP_SECONDS, callback, args)
+        timer.daemon = True
+        timer.start()
+
+class LoopbackPublisher:
+    bus: LoopbackBus = None
+
+    def __init__(self, *args):
+        pass
+
+    def publish_assignment(self, printer_id, assignment):
+        self.bus.deliver(self.bus.printers[printer_id].on_assignment, assignment)
+
+    def publish_printers_list(self, printers_list):
+        self.bus.deliver(self.bus.robot.on_printers_list, printers_list.printers[0].printerId)
+
+    def disconnect(self):
+        pass
+
+class LoopbackSubscriber(LoopbackPublisher):
+    def connect(self):
+        pass
+
+class SimPrinter:
+    """
+    Same assignment handling as st_printer's PrintingService: one next-job slot, a job
+    reserved with startAfterCleaning waits for the same assignment without the flag
+    """
+
+    def __init__(self, printer_id, bus, stats):
+        self.printer_id = printer_id
+        self.bus = bus
+        self.stats = stats
+        self.lock = threading.Lock()
+        self.current_job = None
+        self.next_job = None
+        self.last_job_id = None
+        self.cleared_at = None
+
+    def report(self, status, job_id, progress):
+        self.bus.deliver(self.bus.handler.on_printer_progress,
+                         PrinterProgress(self.printer_id, job_id, status, progress, str(time.time())))
+
+    def on_assignment(self, assignment):
+        with self.lock:
+            if assignment.jobId == self.last_job_id:
+                return
+            if self.next_job is None or self.next_job.jobId != assignment.jobId:
+                self.next_job = assignment
+            else:
+                self.next_job.startAfterCleaning = assignment.startAfterCleaning
+            self.try_start_next_job()
+
+    def try_start_next_job(self):
+        if self.current_job is None and self.next_job is not None and not self.next_job.startAfterCleaning:
+            self.current_job, self.next_job = self.next_job, None
+            if self.cleared_at is not None:
+                self.stats["gaps"].append(time.monotonic() - self.cleared_at)
+                self.cleared_at = None
+            self.report("printing", self.current_job.jobId, 0)
+            timer = threading.Timer(PRINT_SECONDS, self.on_job_finished)
+            timer.daemon = True
+            timer.start()
+
+    def on_job_finished(self):
+        with self.lock:
+            self.last_job_id = self.current_job.jobId
+            self.current_job = None
+            self.stats["completed"] += 1
+            # Waits for the robot: an assignment received meanwhile would be printed on a dirty plate
+            self.report("idle", self.last_job_id, 100)
+
+    def on_plate_cleared(self):
+        with self.lock:
+            self.cleared_at = time.monotonic()
+
+class SimRobot:
+    def __init__(self, bus):
+        self.bus = bus
+        self.lock = threading.Lock()
+        self.free_at = 0.0
+
+    def on_printers_list(self, printer_id):
+        with self.lock:
+            start = max(time.monotonic(), self.free_at)
+            self.free_at = start + CLEANING_SECONDS
+            delay = self.free_at - time.monotonic()
+        timer = threading.Timer(delay, self.finish, (printer_id,))
+        timer.daemon = True
+        timer.start()
+
+    def finish(self, printer_id):
+        self.bus.printers[printer_id].on_plate_cleared()
+        self.bus.deliver(self.bus.handler.on_robot_progress,
+                         RobotProgress(robotId="robot-1", printerId=printer_id, action="clean",
+                                       status="completed", timestamp=str(time.time())))
+
+def run(pipelining, url, results):
+    logging.disable(logging.WARNING)
+    bus = LoopbackBus()
+    LoopbackPublisher.bus = bus
+    job_handler_module.MQTTPublisher = LoopbackPublisher
+    job_handler_module.MQTTSubscriber = LoopbackSubscriber
+    stats = {"gaps": [], "completed": 0}
+    handler = job_handler_module.JobHandler("loopback", 0, url, poll_wait=1, lease_time=30,
+                                            scheduler=Scheduler(FirstAvailablePolicy()), pipelining=pipelining)
+    bus.handler = handler
+    bus.robot = SimRobot(bus)
+    bus.printers = {f"printer-{i + 1}": SimPrinter(f"printer-{i + 1}", bus, stats) for i in range(PRINTERS)}
+    threading.Thread(target=handler.main_loop, daemon=True).start()
+    for printer in bus.printers.values():
+        printer.report("idle", "", 0)
+    time.sleep(RUN_SECONDS)
+    results.put((pipelining, stats["completed"], stats["gaps"]))
+
+def main():
+    parser = argparse.ArgumentParser(description="Idle gap per printer with and without pre-assignment")
+    parser.add_argument("--queue-manager-url", default="http://localhost:8090")
+    args = parser.parse_args()
+
+    # Unique model IDs, so the leftover jobs of this run can be removed afterwards
+    run_id = uuid.uuid4().hex[:6]
+    resp = requests.post(f"{args.queue_manager_url}/jobs:batch",
+                         json={"jobs": [{"modelId": f"bench-{run_id}-{i}", "priority": 1} for i in range(JOBS)]})
+    resp.raise_for_status()
+
+    results = {}
+    try:
+        for pipelining in (False, True):
+            queue = multiprocessing.Queue()
+            # One process per mode: the dispatch loop of a run never stops
+            process = multiprocessing.Process(target=run, args=(pipelining, args.queue_manager_url, queue))
+            process.start()
+            mode, completed, gaps = queue.get()
+            process.terminate()
+            results[mode] = (completed, gaps)
+    finally:
+        for job in requests.get(f"{args.queue_manager_url}/jobs").json().get("jobs", []):
+            if job["modelId"].startswith(f"bench-{run_id}-"):
+                requests.delete(f"{args.queue_manager_url}/jobs/{job['id']}")
+
+    print("=" * 96)
+    print(f"Pipelining benchmark: {PRINTERS} printers, {PRINT_SECONDS * 1000:.0f} ms prints, "
+          f"{CLEANING_SECONDS * 1000:.0f} ms robot trips, {MQTT_HOP_SECONDS * 1000:.0f} ms MQTT hops, {RUN_SECONDS}s")
+    print("Idle gap: plate cleared by the robot -> printer starts its next job")
+    print("=" * 96)
+    print(f"{'mode':<22}{'prints':>10}{'mean gap [ms]':>16}{'p50 [ms]':>12}{'p95 [ms]':>12}{'max [ms]':>12}")
+    for mode, name in ((False, "assign after cleaning"), (True, "pre-assignment")):
+        completed, gaps = results[mode]
+        samples = np.array(gaps) * 1000 if gaps else np.zeros(1)
+        print(f"{name:<22}{completed:>10}{samples.mean():>16.1f}{np.percentile(samples, 50):>12.1f}"
+              f"{np.percentile(samples, 95):>12.1f}{samples.max():>12.1f}")
+    print("=" * 96)
+
+if __name__ == "__main__":
+    main()
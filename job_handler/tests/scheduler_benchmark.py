@@ -0,0 +1,136 @@
+import heapq
+import logging
+import os
+import random
+import sys
+
+# Run from the job_handler directory:
+#   python3 tests/scheduler_benchmark.py
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.dto.job_dto import Job
+from app.model.scheduler import JobProfile, Scheduler, create_policy
+
+# Synthetic farm and day of jobs
+SEED = 7
+PRINTERS = 12
+DAY_MINUTES = 24 * 60
+JOBS = 220
+WINDOW = 3
+SWAP_MINUTES = 15       # filament change
+CLEANING_MINUTES = 5    # robot cleaning after every print
+# Filament -> (share of the jobs, nozzle temperature)
+FILAMENTS = {"PLA": (0.55, 210), "PETG": (0.25, 240), "ABS": (0.15, 250), "PC": (0.05, 280)}
+
+POLICIES = [
+    ("first_available", {}),
+    ("greedy_compatible", {}),
+    ("throughput", {"swap_minutes": SWAP_MINUTES}),
+    ("throughput (min swaps)", {"swap_minutes": 10 * SWAP_MINUTES}),
+]
+
+def make_farm(rng):
+    printers = {}
+    for i in range(PRINTERS):
+        printers[f"printer-{i + 1}"] = {
+            "filament_type": rng.choice(list(FILAMENTS)),
+            "nozzle_diameter": 0.4,
+            "max_nozzle_temp": 300 if i % 4 == 0 else 260,
+            "print_speed": rng.choice([40, 60, 80]),
+        }
+    return printers
+
+def make_day(rng, printers):
+    jobs = []
+    names = list(FILAMENTS)
+    weights = [FILAMENTS[name][0] for name in names]
+    for i in range(JOBS):
+        arrival = rng.uniform(0, DAY_MINUTES)
+        filament = rng.choices(names, weights)[0]
+        preferred = rng.choice(list(printers)) if rng.random() < 0.1 else None
+        job = Job(id=f"job-{i}", modelId=f"model-{i}", assignedPrinterId=preferred,
+                  priority=rng.choices(range(10), [30, 20, 15, 10, 8, 6, 4, 3, 2, 2])[0],
+                  status="pending", submittedAt=arrival, updatedAt=arrival)
+        minutes = int(min(480, max(15, rng.lognormvariate(4.2, 0.6))))
+        jobs.append(JobProfile(job=job, filament_type=filament, nozzle_temp=FILAMENTS[filament][1], estimated_time=minutes))
+    jobs.sort(key=lambda profile: profile.job.submittedAt)
+    return jobs
+
+def simulate(policy_name, options, printers, day):
+    scheduler = Scheduler(create_policy(policy_name.split(" ")[0], **options), window=WINDOW,
+                          printers={printer_id: dict(config) for printer_id, config in printers.items()})
+    pending = list(day)
+    queue = []              # (-priority, submittedAt, index, profile), same order as the queue manager
+    idle = set(printers)
+    finishing = []          # (time, printer_id)
+    waits = {"high": [], "low": []}
+    swaps = failures = completed_in_day = 0
+    done = 0
+    now = 0.0
+    index = 0
+    while done < len(day):
+        # Next event: a job arrives or a printer is free again
+        next_arrival = pending[0].job.submittedAt if pending else float("inf")
+        next_free = finishing[0][0] if finishing else float("inf")
+        now = min(next_arrival, next_free)
+        while pending and pending[0].job.submittedAt <= now:
+            profile = pending.pop(0)
+            heapq.heappush(queue, (-profile.job.priority, profile.job.submittedAt, index, profile))
+            index += 1
+        while finishing and finishing[0][0] <= now:
+            idle.add(heapq.heappop(finishing)[1])
+        if not idle or not queue:
+            continue
+
+        window = [heapq.heappop(queue) for _ in range(min(len(queue), scheduler.window_size(len(idle))))]
+        loaded = {printer_id: scheduler.printer(printer_id).filament_type for printer_id in idle}
+        matches = scheduler.match_profiles(sorted(idle), [entry[-1] for entry in window])
+        assigned = {id(profile) for _, profile in matches}
+        for entry in window:
+            if id(entry[-1]) not in assigned:
+                heapq.heappush(queue, entry)
+        for printer_id, profile in matches:
+            idle.discard(printer_id)
+            printer = scheduler.printer(printer_id)
+            busy = CLEANING_MINUTES
+            if profile.nozzle_temp > printer.max_nozzle_temp:
+                # Failed print: the job goes back to the queue
+                failures += 1
+                heapq.heappush(queue, (-profile.job.priority, profile.job.submittedAt, index, profile))
+                index += 1
+            else:
+                if loaded[printer_id] != profile.filament_type:
+                    swaps += 1
+                    busy += SWAP_MINUTES
+                busy += profile.print_time_on(printer)
+                waits["high" if profile.job.priority >= 7 else "low"].append(now - profile.job.submittedAt)
+                done += 1
+                if now + busy - CLEANING_MINUTES <= DAY_MINUTES:
+                    completed_in_day += 1
+            heapq.heappush(finishing, (now + busy, printer_id))
+    makespan = max(time for time, _ in finishing) if finishing else now
+    return {
+        "completed in 24h": completed_in_day,
+        "makespan [h]": makespan / 60,
+        "mean wait [min]": sum(waits["low"] + waits["high"]) / len(day),
+        "high prio wait [min]": sum(waits["high"]) / max(1, len(waits["high"])),
+        "filament swaps": swaps,
+        "failed prints": failures,
+    }
+
+if __name__ == "__main__":
+    logging.disable(logging.INFO)
+    rng = random.Random(SEED)
+    printers = make_farm(rng)
+    day = make_day(rng, printers)
+    results = [(name, simulate(name, options, printers, day)) for name, options in POLICIES]
+    columns = list(results[0][1])
+    print("=" * 156)
+    print(f"Scheduler benchmark: {PRINTERS} printers, {JOBS} jobs over 24h, window {WINDOW} jobs per idle printer")
+    print("=" * 156)
+    print(f"{'policy':<24}" + "".join(f"{column:>22}" for column in columns))
+    for name, metrics in results:
+        print(f"{name:<24}" + "".join(
+            f"{metrics[column]:>22.1f}" if isinstance(metrics[column], float) else f"{metrics[column]:>22}"
+            for column in columns))
+    print("=" * 156)
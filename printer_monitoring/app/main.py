@@ -10,14 +10,16 @@ def str2bool(val):
 def main():
     debug_communication = str2bool(os.getenv("DEBUG_COMMUNICATION", "True"))
     debug_service = str2bool(os.getenv("DEBUG", "False"))
-    timer = int(os.getenv("timer_hear", 60))
+    timer = int(os.getenv("timer_hear", 2))
+    printer_ttl = float(os.getenv("PRINTER_TTL", 90))
 
     # Initialize MQTT client
     client = MQTTClient(debug=debug_communication)  # Enable debug mode for MQTT communication
 
     service = PrinterMonitoringService(mqtt_client=client, 
                                        debug=debug_service, 
-                                       discover_printers_timeout=timer)
+                                       discover_printers_timeout=timer,
+                                       printer_ttl=printer_ttl)
     service.start()
 
     api = ApiEndpoint(printer_monitoring_service=service,
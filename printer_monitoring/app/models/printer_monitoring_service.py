@@ -1,16 +1,21 @@
 from http import client
-from app.persistence.status_history import StatusHistory
+from app.persistence.status_history import StatusHistory, FIELDNAMES
+from app.persistence.history_sink import HistorySink
 from app.mqtt.subscriber import MQTTSubscriber
 from app.services.discover_printers import discover_printers
-import threading
-import time
+from app.services.liveness_registry import LivenessRegistry
+import atexit
 
 class PrinterMonitoringService:
-    def __init__(self, mqtt_client, debug=True, discover_printers_timeout=60):
+    def __init__(self, mqtt_client, debug=True, discover_printers_timeout=2, printer_ttl=90):
 
         self.debug = debug
         self.discover_printers_timeout = discover_printers_timeout
 
+        # Printers that sent a progress message within printer_ttl seconds
+        self.liveness = LivenessRegistry(ttl=printer_ttl, debug=self.debug)
+        self.liveness.subscribe(on_online=self._on_printer_online, on_offline=self._on_printer_offline)
+
         # Initialize MQTT client
         self.mqtt_client = mqtt_client
         self.mqtt_client.connect()
@@ -22,14 +27,19 @@ class PrinterMonitoringService:
         if self.debug:
             print("[PRINTER_MONITORING DEBUG] Initialized MQTT client and pub/sub")
 
-        # Search all printers in the network -> blocking call
-        # Any payload with printerId will be added to the discovered printers
-        print(f"\033[91m[PRINTER_MONITORING DEBUG] Discovering printers with timeout {self.discover_printers_timeout} seconds...\033[0m")
+        # Initialize status history, printers are added as they are discovered
+        self.history = StatusHistory([], debug=self.debug)
+
+        # Printers from their retained announces -> returns within milliseconds,
+        # printers joining or leaving later are tracked through the callbacks
+        print(f"\033[91m[PRINTER_MONITORING DEBUG] Discovering printers (at most {self.discover_printers_timeout} seconds)...\033[0m")
 
-        self.printers = discover_printers(self.subscriber, timeout=self.discover_printers_timeout, debug=self.debug)
+        self.printers = discover_printers(self.subscriber, timeout=self.discover_printers_timeout, debug=self.debug,
+                                          on_join=self.liveness.touch, on_leave=self.liveness.forget)
 
-        # Initialize status history
-        self.history = StatusHistory(self.printers, debug=self.debug)
+        # Discovered printers are online until their TTL runs out without a message
+        for printer_id in self.printers:
+            self.liveness.touch(printer_id)
 
 
 
@@ -47,16 +57,28 @@ class PrinterMonitoringService:
         # Start periodic CSV dump
         self.periodic_csv_dump()
 
+        # Expire printers that stopped sending messages
+        self.liveness.start()
+
         print(f"\033[92m[PRINTER_MONITORING] Service started successfully. ({len(self.printers)} printers discovered.)\033[0m")
 
     # Custom callbacks for MQTT messages, for store status readings
     def _on_progress(self, client, userdata, dto):
+        self.liveness.touch(dto.printerId)
         self.history.add_status_reading(dto)
 
+    # Liveness events
+    def _on_printer_online(self, printer_id):
+        # Printers that join after the discovery are reported too
+        self.history.add_printer(printer_id)
+
+    def _on_printer_offline(self, printer_id):
+        print(f"\033[91m[PRINTER_MONITORING] Printer {printer_id} offline: no message for {self.liveness.ttl} seconds\033[0m")
+
 
     # get all status readings for API response
     def get_status_api_response(self):
-        printers_status = self.history.get_latest_status_list()
+        printers_status = self.history.get_latest_status_list(online=self.liveness.online_printers())
 
         if self.debug:
             print(f"[PRINTER_STATUS DEBUG] Latest printer statuses for API: {printers_status}")
@@ -64,14 +86,18 @@ class PrinterMonitoringService:
         return printers_status
 
 
-    def periodic_csv_dump(self, file_path="app/persistence/save/status_history.csv", interval=60):
-        """Periodically dump the status history to a CSV file."""
-        def run():
-            while True:
-                self.history.csv_dump(file_path)
-                time.sleep(interval)
-        thread = threading.Thread(target=run, daemon=True)
-        thread.start()
+    def periodic_csv_dump(self, file_path="app/persistence/save/status_history.csv", interval=60,
+                          max_bytes=10_000_000, max_age=86400, backups=7):
+        """
+        Stream the status history to a CSV file: the readings added since the last flush are
+        written every `interval` seconds, the file is rotated and gzipped by size or age.
+        """
+        self.sink = HistorySink(file_path, FIELDNAMES, flush_interval=interval,
+                                max_bytes=max_bytes, max_age=max_age, backups=backups)
+        self.history.sink = self.sink
+        self.sink.start()
+        # Write the last readings when the service exits
+        atexit.register(self.sink.stop)
         if self.debug:
             print(f"[PRINTER_MONITORING DEBUG] Periodic CSV dump started with interval {interval} seconds.")
 
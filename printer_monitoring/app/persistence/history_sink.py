@@ -0,0 +1,147 @@
+"""
+HistorySink: Streams history rows to a CSV file, rotating and compressing it by size or age.
+The same module is used by anomaly_detection, global_temperature and printer_monitoring.
+"""
+from collections import deque
+from datetime import datetime
+from typing import List, Optional, Sequence
+import csv
+import glob
+import gzip
+import os
+import shutil
+import threading
+import time
+
+
+class HistorySink:
+    """
+    Rows are appended by the histories as they are added (O(1), any thread) and
+    written by a background thread every `flush_interval` seconds, so each flush
+    only writes the rows added since the previous one and never holds a history lock.
+
+    The file stays open with a buffered writer between flushes. When it reaches
+    `max_bytes` or is older than `max_age` seconds it is renamed with a timestamp
+    suffix and gzipped, and only the newest `backups` rotated files are kept (all of them if 0).
+    """
+
+    def __init__(self, file_path: str, fieldnames: Sequence[str], flush_interval: float = 60,
+                 max_bytes: int = 10_000_000, max_age: float = 86400, backups: int = 7, debug: bool = False):
+        self.file_path = file_path
+        self.fieldnames = list(fieldnames)
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.backups = backups
+        self.debug = debug
+
+        # Rows waiting for the next flush, deque appends and pops are thread-safe
+        self._pending: deque = deque()
+        self._file = None
+        self._writer = None
+        self._opened_at = 0.0
+        # Serializes flushes: the periodic one and the final one on stop()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.rows_written = 0
+
+    def append(self, row: Sequence):
+        """Queue a row, values in the order of `fieldnames`."""
+        self._pending.append(row)
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.file_path) or ".", exist_ok=True)
+        self._file = open(self.file_path, mode="a", newline="", buffering=1 << 16)
+        self._writer = csv.writer(self._file)
+        # A file left by a previous run keeps its age, so it still rotates on time
+        self._opened_at = os.path.getmtime(self.file_path) if self._file.tell() > 0 else time.time()
+        if self._file.tell() == 0:
+            self._writer.writerow(self.fieldnames)
+
+    def flush(self) -> int:
+        """Write the pending rows, rotating the file if needed. Returns the number of rows written."""
+        with self._flush_lock:
+            rows = []
+            while self._pending:
+                rows.append(self._pending.popleft())
+            if not rows:
+                return 0
+            if self._file is None:
+                self._open()
+            self._writer.writerows(rows)
+            self._file.flush()
+            self.rows_written += len(rows)
+            if self._file.tell() >= self.max_bytes or time.time() - self._opened_at >= self.max_age:
+                self._rotate()
+            if self.debug:
+                print(f"[HISTORY_SINK DEBUG] Wrote {len(rows)} rows to {self.file_path}")
+            return len(rows)
+
+    def _rotate(self):
+        self._file.close()
+        self._file = self._writer = None
+
+        stem, ext = os.path.splitext(self.file_path)
+        rotated = f"{stem}.{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}{ext}"
+        os.replace(self.file_path, rotated)
+        with open(rotated, "rb") as src, gzip.open(rotated + ".gz", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(rotated)
+
+        # The suffix sorts by time: drop the oldest beyond the number of backups
+        if self.backups > 0:
+            for old in self.rotated_files()[:-self.backups]:
+                os.remove(old)
+        if self.debug:
+            print(f"[HISTORY_SINK DEBUG] Rotated {self.file_path} to {rotated}.gz")
+
+    def rotated_files(self) -> List[str]:
+        stem, ext = os.path.splitext(self.file_path)
+        return sorted(glob.glob(f"{glob.escape(stem)}.*{ext}.gz"))
+
+    def start(self):
+        """Flush every `flush_interval` seconds on a daemon thread."""
+        if self._thread is not None:
+            return
+        def run():
+            while not self._stop.wait(self.flush_interval):
+                try:
+                    self.flush()
+                except OSError as e:
+                    print(f"[HISTORY_SINK ERROR] Could not write {self.file_path}: {e}")
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the thread and write the rows still pending."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval)
+            self._thread = None
+        self.flush()
+        with self._flush_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = self._writer = None
+
+
+if __name__ == "__main__":
+    # Example usage for testing
+    #
+    # From the service directory:
+    #    python3 -m app.persistence.history_sink
+    #
+    import tempfile
+
+    directory = tempfile.mkdtemp()
+    sink = HistorySink(os.path.join(directory, "history.csv"), ["timestamp", "value"], max_bytes=2000, backups=2, debug=True)
+    for i in range(500):
+        sink.append((i, i * 2))
+        if i % 100 == 99:
+            sink.flush()
+    sink.stop()
+    print("Current file rows:", sum(1 for _ in open(sink.file_path)) if os.path.exists(sink.file_path) else 0)
+    print("Rotated files:", sink.rotated_files())
+    shutil.rmtree(directory)
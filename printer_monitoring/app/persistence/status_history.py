@@ -1,19 +1,31 @@
-from typing import List, Dict
+from typing import List, Dict, Optional, Set
 from app.dto.printer_progress_dto import PrinterProgressDTO
 from app.dto.monitoring_dto import PrinterStatusDTO, APIResponseDTO
+from app.persistence.history_sink import HistorySink
 import threading
 import csv
 import datetime
 
+FIELDNAMES = ["timestamp", "status", "progress", "printerId", "jobId"]
+
 class StatusHistory:
     def __init__(self, printer_ids: List[str], debug: bool = False):
         self._lock = threading.RLock()
         self.status_readings: List[PrinterProgressDTO] = []
         self.printer_ids = printer_ids
+        # Optional sink the readings are streamed to as they are added
+        self.sink: Optional[HistorySink] = None
+
+    def add_printer(self, printer_id: str):
+        with self._lock:
+            if printer_id not in self.printer_ids:
+                self.printer_ids = [*self.printer_ids, printer_id]
 
     def add_status_reading(self, reading: PrinterProgressDTO):
         with self._lock:
             self.status_readings.append(reading)
+        if self.sink is not None:
+            self.sink.append((reading.timestamp, reading.status, reading.progress, reading.printerId, reading.jobId))
 
     def get_latest_status_dict(self) -> Dict[str, PrinterProgressDTO]:
         """Get the latest status for each printer ID."""
@@ -26,14 +38,17 @@ class StatusHistory:
                     latest_status[printer_id] = latest
             return latest_status
 
-    def get_latest_status_list(self) -> APIResponseDTO:
-        """Get the latest status for all printers as an APIResponseDTO."""
+    def get_latest_status_list(self, online: Optional[Set[str]] = None) -> APIResponseDTO:
+        """
+        Get the latest status for all printers as an APIResponseDTO.
+        If `online` is given, printers not in it are reported as "offline".
+        """
         with self._lock:
             latest_status = self.get_latest_status_dict().values()
             printers = [
                 PrinterStatusDTO(
                     printerId=r.printerId,
-                    status=r.status,
+                    status=r.status if online is None or r.printerId in online else "offline",
                     currentJobId=r.jobId,
                     modelUrl=getattr(r, "modelUrl", ""),
                     progress=r.progress,
@@ -52,14 +67,12 @@ class StatusHistory:
             self.status_readings.clear()
 
     def csv_dump(self, file_path: str):
-        """Dump the status history to a CSV file."""
+        """Write the readings in memory to a CSV file, overwriting it (the periodic history is streamed through the sink)."""
         import os
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        with open(file_path, mode="a", newline="") as csvfile:
-            fieldnames = ["timestamp", "status", "progress", "printerId", "jobId"]
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            if os.path.getsize(file_path) == 0:
-                writer.writeheader()
+        with open(file_path, mode="w", newline="") as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES)
+            writer.writeheader()
             for reading in self.status_readings:
                 writer.writerow({
                     "timestamp": reading.timestamp,
@@ -1,62 +1,93 @@
 ## Discover Printers Service
-# launched periodically by the global temperature
-#  service to discover printers
-#  update the printer list
+# builds the printer list from the retained announce messages
+#  of the printers, and keeps it updated while printers
+#  join or leave
 
-def discover_printers(subscriber, timeout=60, debug=True):
+def discover_printers(subscriber, timeout=2, quiet=0.1, debug=True, on_join=None, on_leave=None):
     """
-    Listens for incoming printer temperature messages for a short period,
-    and returns a set of discovered printer IDs.
+    Subscribes to the printers' retained announce topic and returns the set of
+    printers announced online. The broker delivers the retained messages right
+    after the subscription, so this returns as soon as no announce arrived for
+    `quiet` seconds (at most `timeout` seconds), without waiting for heartbeats.
+
+    The subscription stays active: printers that come online later are passed
+    to on_join(printer_id), printers that go offline (clean shutdown or
+    last will) to on_leave(printer_id).
 
     Args:
         subscriber: MQTTSubscriber instance
-        timeout: seconds to listen for printer messages
+        timeout: maximum seconds to wait for the retained messages
+        quiet: seconds without announces after which the retained ones are considered all received
+        on_join, on_leave: callbacks for later changes, called on the MQTT thread
 
     Returns:
-        Set of printer IDs discovered
+        Set of printer IDs online at startup
     """
 
     import threading
     import time
 
-    discovered = set()
+    online = set()
+    lock = threading.Lock()
+    started = threading.Event()
 
-    def printer_callback(client, userdata, dto):
-        if hasattr(dto, "printerId"):
-            discovered.add(dto.printerId)
+    def announce_callback(client, userdata, dto):
+        if not dto.printerId:
+            return
+        with lock:
+            last_message[0] = time.time()
+            was_online = dto.printerId in online
+            if dto.status == "online":
+                online.add(dto.printerId)
+            else:
+                online.discard(dto.printerId)
+        if not started.is_set():
+            return
+        if dto.status == "online" and not was_online and on_join is not None:
+            on_join(dto.printerId)
+        elif dto.status != "online" and was_online and on_leave is not None:
+            on_leave(dto.printerId)
 
     if debug:
-        print(f"[DISCOVER DEBUG] Listening for printers for {timeout} seconds...")
-
-    subscriber.subscribe_progress(printer_callback)
+        print(f"[DISCOVER DEBUG] Reading the retained printer announces (at most {timeout} seconds)...")
 
-    # Collect for the entire timeout period
     start = time.time()
-    while time.time() - start < timeout:
-        time.sleep(0.2)  # allow time for messages to arrive
+    last_message = [start]
+    subscriber.subscribe_printer_announce(announce_callback)
+
+    # Retained messages arrive in a burst right after the subscription
+    while time.time() - start < timeout and time.time() - last_message[0] < quiet:
+        time.sleep(0.01)
+    with lock:
+        discovered = set(online)
+        started.set()
 
     if debug:
-        print(f"[DISCOVER DEBUG] Discovered printers: {discovered}")
+        print(f"[DISCOVER DEBUG] Discovered printers in {(time.time() - start) * 1000:.0f} ms: {discovered}")
 
     return discovered
 
 if __name__ == "__main__":
     # Example usage for testing
     #
-    # From global_temperature directory:
-    #    #    cd IoT_Project/global_temperature
+    # From the service directory (anomaly_detection, global_temperature or printer_monitoring):
     #    #    python3 -m app.services.discover_printers
     #
     from app.mqtt.client import MQTTClient
     from app.mqtt.subscriber import MQTTSubscriber
+    import time
 
     client = MQTTClient("app/mqtt_config.yaml")
     client.connect()
     client.loop_start()
     subscriber = MQTTSubscriber(client)
-    timeout = 60  # seconds to wait for printer messages
-    print(f"Listening for printers for {timeout} seconds...")
-    printers = discover_printers(subscriber, timeout=timeout)
+    printers = discover_printers(subscriber,
+                                 on_join=lambda printer_id: print("Printer joined:", printer_id),
+                                 on_leave=lambda printer_id: print("Printer left:", printer_id))
     print("Discovered printers:", printers)
-    client.loop_stop()
-    client.client.disconnect()
\ No newline at end of file
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        client.loop_stop()
+        client.client.disconnect()
@@ -1,5 +1,8 @@
-from flask import Blueprint, request, jsonify
+import math
+import time
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from app.model.priority_queue_service import PriorityQueueManager
+from app.model.jobs_view import InvalidCursorError
 from app.dto.job_request_dto import JobRequestDTO
 import logging
 
@@ -12,6 +15,17 @@ service = PriorityQueueManager()
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Maximum number of items accepted by the batch endpoints
+MAX_BATCH_SIZE = 10000
+
+# Maximum number of jobs in a page of GET /jobs
+MAX_PAGE_SIZE = 1000
+
+# Change feed: how often an idle stream checks for changes made by other workers,
+# and how long it may stay silent before a keep-alive comment is sent
+FEED_POLL_SECONDS = 1.0
+FEED_KEEPALIVE_SECONDS = 15
+
 @api_bp.route('/jobs', methods=['POST'])
 def create_job():
     """
@@ -25,12 +39,16 @@ def create_job():
         # Validate required fields
         if 'modelId' not in data:
             return jsonify({"error": "modelId is required"}), 400
+        try:
+            priority = int(data.get('priority', 0))
+        except (TypeError, ValueError):
+            return jsonify({"error": "priority must be an integer"}), 400
         
         # Create JobRequestDTO
         job_request = JobRequestDTO(
             modelId=data['modelId'],
             printerId=data.get('printerId'),
-            priority=data.get('priority', 0)
+            priority=priority
         )
         
         # Add job via service
@@ -48,25 +66,189 @@ def create_job():
         logger.error(f"Error creating job: {str(e)}")
         return jsonify({"error": "Internal server error"}), 500
 
-@api_bp.route('/jobs', methods=['GET'])
-def get_all_jobs():
+@api_bp.route('/jobs:batch', methods=['POST'])
+def create_jobs_batch():
     """
-    GET /jobs - Retrieves all jobs sorted from highest to lowest priority
+    POST /jobs:batch - Creates many jobs in a single request, with a single reordering pass
+    Body: {"jobs": [{"modelId": ..., "printerId": ..., "priority": ...}, ...]}
     """
     try:
-        jobs = service.get_all_jobs()
-        
+        data = request.get_json()
+        if not data or not isinstance(data.get('jobs'), list) or not data['jobs']:
+            return jsonify({"error": "jobs list is required"}), 400
+        if len(data['jobs']) > MAX_BATCH_SIZE:
+            return jsonify({"error": f"At most {MAX_BATCH_SIZE} jobs per batch"}), 400
+
+        # Validate the whole batch before inserting anything
+        job_requests = []
+        for index, item in enumerate(data['jobs']):
+            if not isinstance(item, dict) or 'modelId' not in item:
+                return jsonify({"error": f"jobs[{index}]: modelId is required"}), 400
+            try:
+                priority = int(item.get('priority', 0))
+            except (TypeError, ValueError):
+                return jsonify({"error": f"jobs[{index}]: priority must be an integer"}), 400
+            job_requests.append(JobRequestDTO(
+                modelId=item['modelId'],
+                printerId=item.get('printerId'),
+                priority=priority
+            ))
+
+        new_jobs = service.add_jobs(job_requests)
+
         response = {
-            "jobs": [job.to_dict() for job in jobs]
+            "jobs": [job.to_dict() for job in new_jobs]
         }
-        
-        logger.info(f"Retrieved {len(jobs)} jobs")
+
+        logger.info(f"Created {len(new_jobs)} jobs in batch")
+        return jsonify(response), 201
+
+    except Exception as e:
+        logger.error(f"Error creating jobs batch: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
+@api_bp.route('/jobs:batch', methods=['PATCH'])
+def update_jobs_batch():
+    """
+    PATCH /jobs:batch - Modifies the priority of many jobs in a single request, with a single reordering pass
+    Body: {"jobs": [{"id": ..., "priority": ...}, ...]}
+    """
+    try:
+        data = request.get_json()
+        if not data or not isinstance(data.get('jobs'), list) or not data['jobs']:
+            return jsonify({"error": "jobs list is required"}), 400
+        if len(data['jobs']) > MAX_BATCH_SIZE:
+            return jsonify({"error": f"At most {MAX_BATCH_SIZE} jobs per batch"}), 400
+
+        priorities = {}
+        for index, item in enumerate(data['jobs']):
+            if not isinstance(item, dict) or 'id' not in item or 'priority' not in item:
+                return jsonify({"error": f"jobs[{index}]: id and priority are required"}), 400
+            try:
+                priorities[item['id']] = int(item['priority'])
+            except (TypeError, ValueError):
+                return jsonify({"error": f"jobs[{index}]: priority must be an integer"}), 400
+
+        updated_jobs = service.update_job_priorities(priorities)
+        updated_ids = {job.id for job in updated_jobs}
+
+        response = {
+            "jobs": [job.to_dict() for job in updated_jobs],
+            "notFound": [job_id for job_id in priorities if job_id not in updated_ids]
+        }
+
+        logger.info(f"Updated priority of {len(updated_jobs)} jobs in batch")
         return jsonify(response), 200
+
+    except Exception as e:
+        logger.error(f"Error updating jobs batch: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
+@api_bp.route('/jobs', methods=['GET'])
+def get_all_jobs():
+    """
+    GET /jobs - Retrieves all jobs sorted from highest to lowest priority
+    GET /jobs?limit=N&after=CURSOR - Retrieves a page of at most N jobs; the response carries the
+        nextCursor to pass as `after` for the following page (null on the last page).
+    The response carries an ETag: with If-None-Match and an unchanged queue the answer is 304 Not Modified.
+    """
+    try:
+        limit = None
+        if 'limit' in request.args:
+            try:
+                limit = int(request.args['limit'])
+            except ValueError:
+                return jsonify({"error": "limit must be an integer"}), 400
+            if limit < 1 or limit > MAX_PAGE_SIZE:
+                return jsonify({"error": f"limit must be between 1 and {MAX_PAGE_SIZE}"}), 400
+        after = request.args.get('after') or None
+
+        # Cheap version check first, nothing is encoded for an unchanged queue
+        current_etag = service.get_jobs_etag()
+        if request.if_none_match.contains(current_etag):
+            response = Response(status=304)
+            response.set_etag(current_etag)
+            return response
+
+        try:
+            etag, body = service.get_jobs_response(limit, after)
+        except InvalidCursorError as e:
+            return jsonify({"error": str(e)}), 400
+
+        response = Response(body, status=200, mimetype='application/json')
+        response.set_etag(etag)
+        # Clients may keep the response but must revalidate it
+        response.headers['Cache-Control'] = 'no-cache'
+
+        logger.info(f"Retrieved jobs (version {etag})")
+        return response
         
     except Exception as e:
         logger.error(f"Error getting jobs: {str(e)}")
         return jsonify({"error": "Internal server error"}), 500
 
+@api_bp.route('/jobs/events', methods=['GET'])
+def stream_job_events():
+    """
+    GET /jobs/events - Server-sent events stream of the queue changes: add, update, delete, dequeue and reset.
+    Every event carries the queue version; event IDs have the same format as the ETag of GET /jobs.
+    To keep a local copy: load GET /jobs, then open the stream with ?lastEventId=<ETag> (EventSource sends
+    the Last-Event-ID header by itself when reconnecting) to receive every change after that version.
+    A reset event means the changes cannot be replayed and the copy must be reloaded.
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('lastEventId')
+    version = service.parse_feed_event_id(last_event_id) if last_event_id else None
+    reset = last_event_id is not None and version is None
+    if version is None:
+        version = service.repository.get_version()
+
+    logger.info(f"Change feed subscriber connected at version {version}")
+    return Response(
+        stream_with_context(_feed_stream(version, reset)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def _sse(event_type: str, version: int, data: str) -> str:
+    return f"event: {event_type}\nid: {service.get_feed_event_id(version)}\ndata: {data}\n\n"
+
+def _reset_event(version: int) -> str:
+    return _sse("reset", version, f'{{"version":{version}}}')
+
+def _feed_stream(version: int, reset: bool):
+    """
+    Yield the change events after `version` as they happen
+    """
+    if reset:
+        # Position from another instance (e.g. before a restart): the client must reload
+        yield _reset_event(version)
+    # Sent right away so that clients and proxies see the stream is open
+    yield ": connected\n\n"
+    last_sent = time.monotonic()
+    while True:
+        events = service.get_feed_events(version, FEED_POLL_SECONDS)
+        if events is None:
+            # The subscriber fell behind the feed
+            version = service.feed.last_version
+            yield _reset_event(version)
+            last_sent = time.monotonic()
+            continue
+        for event in events:
+            yield _sse(event.type, event.version, event.data())
+            version = event.version
+        if events:
+            last_sent = time.monotonic()
+            continue
+        current = service.repository.get_version()
+        if current > version and current > service.feed.last_version:
+            # Changed by another worker sharing the database, not replayable from this feed
+            version = current
+            yield _reset_event(version)
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent >= FEED_KEEPALIVE_SECONDS:
+            yield ": keep-alive\n\n"
+            last_sent = time.monotonic()
+
 @api_bp.route('/jobs/<string:job_id>', methods=['PUT'])
 def update_job_priority(job_id):
     """
@@ -79,9 +261,13 @@ def update_job_priority(job_id):
         
         if 'priority' not in data:
             return jsonify({"error": "priority is required"}), 400
+        try:
+            priority = int(data['priority'])
+        except (TypeError, ValueError):
+            return jsonify({"error": "priority must be an integer"}), 400
         
         # Update job priority via service
-        updated_job = service.update_job_priority(job_id, data['priority'])
+        updated_job = service.update_job_priority(job_id, priority)
         
         if not updated_job:
             return jsonify({"error": "Job not found"}), 404
@@ -90,7 +276,7 @@ def update_job_priority(job_id):
             "job": updated_job.to_dict()
         }
         
-        logger.info(f"Updated job {job_id} priority to {data['priority']}")
+        logger.info(f"Updated job {job_id} priority to {priority}")
         return jsonify(response), 200
         
     except Exception as e:
@@ -144,26 +330,120 @@ def delete_multiple_jobs():
 def get_prioritary_job():
     """
     GET /prioritary_job - Retrieves the job with highest priority (consumer approach - removes the job)
+    GET /prioritary_job?count=N&printerIds=printer-1,printer-2 - Atomically retrieves and removes up to N jobs.
+        With printerIds only jobs without a preferred printer or preferring one of the listed printers are returned.
+    GET /prioritary_job?wait=S - Long poll: if no job is available, waits up to S seconds for one to be enqueued.
+    GET /prioritary_job?lease=S - Jobs are leased for S seconds instead of removed; they must be acked via
+        POST /leases/{leaseId}/ack, otherwise they are re-queued when the lease expires.
     """
     try:
-        highest_priority_job = service.get_highest_priority_job()
-        
-        if not highest_priority_job:
+        try:
+            count = int(request.args.get('count', 1))
+            wait = float(request.args.get('wait', 0))
+            lease_time = float(request.args['lease']) if 'lease' in request.args else None
+        except ValueError:
+            return jsonify({"error": "count, wait and lease must be numbers"}), 400
+        if count < 1:
+            return jsonify({"error": "count must be at least 1"}), 400
+        if not math.isfinite(wait):
+            return jsonify({"error": "wait must be a finite number"}), 400
+        if lease_time is not None and not 0 < lease_time <= service.MAX_LEASE_SECONDS:
+            return jsonify({"error": f"lease must be between 0 and {service.MAX_LEASE_SECONDS} seconds"}), 400
+
+        printer_ids = None
+        printer_ids_param = request.args.get('printerIds')
+        if printer_ids_param:
+            printer_ids = {printer_id.strip() for printer_id in printer_ids_param.split(',') if printer_id.strip()}
+
+        leases = []
+        if lease_time is not None:
+            leases = service.lease_highest_priority_jobs(count, lease_time, printer_ids, wait)
+            jobs = [job for _, _, job in leases]
+        else:
+            jobs = service.get_highest_priority_jobs(count, printer_ids, wait)
+
+        if not jobs:
             return jsonify({"error": "No jobs available"}), 404
-        
-        # Note: The spec shows response wrapped in "jobs" array, but it's a single job
-        # Following the spec format from the howtodo.md
+
+        # Response wrapped in "jobs" array following the spec format from the howtodo.md
+        # (a single job unless count > 1)
         response = {
-            "jobs": [highest_priority_job.to_dict()]
+            "jobs": [job.to_dict() for job in jobs]
         }
-        
-        logger.info(f"Retrieved and removed highest priority job {highest_priority_job.id}")
+        if lease_time is not None:
+            response["leases"] = [
+                {"leaseId": lease_id, "jobId": job.id, "expiresAt": expires_at.isoformat()}
+                for lease_id, expires_at, job in leases
+            ]
+
+        logger.info(f"Retrieved {len(jobs)} highest priority jobs ({'leased' if leases else 'removed'})")
         return jsonify(response), 200
         
     except Exception as e:
         logger.error(f"Error getting prioritary job: {str(e)}")
         return jsonify({"error": "Internal server error"}), 500
 
+@api_bp.route('/leases/<string:lease_id>/ack', methods=['POST'])
+def ack_lease(lease_id):
+    """
+    POST /leases/{leaseId}/ack - Confirms a leased job was consumed, it is removed from the queue for good
+    """
+    try:
+        job = service.ack_lease(lease_id)
+
+        if not job:
+            return jsonify({"error": "Lease not found or expired"}), 404
+
+        logger.info(f"Acked lease {lease_id} for job {job.id}")
+        return '', 204
+
+    except Exception as e:
+        logger.error(f"Error acking lease: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
+@api_bp.route('/leases/<string:lease_id>/extend', methods=['POST'])
+def extend_lease(lease_id):
+    """
+    POST /leases/{leaseId}/extend?lease=S - Renews a lease for S more seconds, the job stays out of the queue
+    """
+    try:
+        try:
+            lease_time = float(request.args['lease'])
+        except (KeyError, ValueError):
+            return jsonify({"error": "lease must be a number of seconds"}), 400
+        if not 0 < lease_time <= service.MAX_LEASE_SECONDS:
+            return jsonify({"error": f"lease must be between 0 and {service.MAX_LEASE_SECONDS} seconds"}), 400
+
+        extended = service.extend_lease(lease_id, lease_time)
+
+        if not extended:
+            return jsonify({"error": "Lease not found or expired"}), 404
+
+        expires_at, job = extended
+        return jsonify({"leaseId": lease_id, "jobId": job.id, "expiresAt": expires_at.isoformat()}), 200
+
+    except Exception as e:
+        logger.error(f"Error extending lease: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
+@api_bp.route('/leases/<string:lease_id>/nack', methods=['POST'])
+def nack_lease(lease_id):
+    """
+    POST /leases/{leaseId}/nack - Gives a leased job back, it is re-queued immediately
+    """
+    try:
+        job = service.nack_lease(lease_id)
+
+        if not job:
+            return jsonify({"error": "Lease not found or expired"}), 404
+
+        logger.info(f"Nacked lease {lease_id}, job {job.id} re-queued")
+        return '', 204
+
+    except Exception as e:
+        logger.error(f"Error nacking lease: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
 # Health check endpoint 
 @api_bp.route('/health', methods=['GET'])
 def health_check():
@@ -171,7 +451,7 @@ def health_check():
     GET /health - Simple health check endpoint
     """
     try:
-        job_count = len(service.get_all_jobs())
+        job_count = service.get_job_count()
         return jsonify({
             "status": "healthy",
             "service": "priority-queue-manager",
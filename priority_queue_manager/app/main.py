@@ -1,11 +1,11 @@
 import os
+import atexit
 import logging
 import yaml
 from flask import Flask
 from logging.handlers import RotatingFileHandler
 
-from app.api.routes import api_bp
-from app.model.priority_queue_service import PriorityQueueManager
+from app.api.routes import api_bp, service
 
 # Create Flask application
 app = Flask(__name__)
@@ -69,8 +69,13 @@ app.config['HOST'] = config['server']['host']
 app.config['PORT'] = config['server']['port']
 app.config['DEBUG'] = config['server']['debug']
 
-# Initialize service (singleton)
-priority_queue_manager = PriorityQueueManager()
+# Share the service used by the API routes (singleton) and restore the persisted queue
+priority_queue_manager = service
+priority_queue_manager.enable_persistence(
+    config.get('persistence', {}),
+    os.path.join(os.path.dirname(__file__), '..')
+)
+atexit.register(priority_queue_manager.close)
 
 # Register blueprints
 app.register_blueprint(api_bp)
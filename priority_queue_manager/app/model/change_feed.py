@@ -0,0 +1,77 @@
+import json
+import threading
+from collections import deque
+from typing import List, Optional, Sequence
+
+class ChangeEvent:
+    """
+    A change of the queue: `version` is the queue version once the change is applied.
+    `items` holds the jobs (add, update) or the job IDs (delete, dequeue); reset has none.
+    """
+    __slots__ = ("version", "type", "items", "_data")
+
+    def __init__(self, version: int, event_type: str, items: Sequence):
+        self.version = version
+        self.type = event_type
+        self.items = items
+        self._data: Optional[str] = None
+
+    def data(self) -> str:
+        # Encoded on first use, then shared by every subscriber
+        if self._data is None:
+            payload = {"version": self.version}
+            if self.type in ("add", "update"):
+                payload["jobs"] = [job.to_dict() for job in self.items]
+            elif self.type in ("delete", "dequeue"):
+                payload["ids"] = list(self.items)
+            self._data = json.dumps(payload, separators=(",", ":"))
+        return self._data
+
+class ChangeFeed:
+    """
+    Bounded in-memory log of queue changes, read by the server-sent-events endpoint.
+
+    The repository publishes one event per mutation while holding its write
+    lock, so versions are strictly increasing. Subscribers that fall behind
+    the log must reload the queue.
+    """
+
+    def __init__(self, capacity: int = 10000):
+        self._events = deque(maxlen=capacity)
+        self._cond = threading.Condition(threading.Lock())
+        self._last_version = 0
+        self._evicted_version = 0  # version of the newest event dropped from the log
+
+    @property
+    def last_version(self) -> int:
+        return self._last_version
+
+    def publish(self, version: int, event_type: str, items: Sequence = ()):
+        """
+        Append an event and wake up the subscribers
+        """
+        with self._cond:
+            if len(self._events) == self._events.maxlen:
+                self._evicted_version = self._events[0].version
+            self._events.append(ChangeEvent(version, event_type, items))
+            self._last_version = version
+            self._cond.notify_all()
+
+    def events_after(self, version: int, timeout: float) -> Optional[List[ChangeEvent]]:
+        """
+        Events newer than `version`, waiting up to `timeout` seconds for one.
+        Returns None when some of them already left the log (the subscriber must reload the queue).
+        """
+        with self._cond:
+            if self._last_version <= version:
+                self._cond.wait(timeout)
+            if version < self._evicted_version:
+                return None
+            events = []
+            # New events are at the right end of the log
+            for event in reversed(self._events):
+                if event.version <= version:
+                    break
+                events.append(event)
+            events.reverse()
+            return events
@@ -0,0 +1,73 @@
+import json
+from bisect import bisect_right
+from typing import Dict, List, Optional, Tuple
+from app.dto.job_response_dto import JobResponseDTO
+
+class InvalidCursorError(ValueError):
+    pass
+
+class JobsView:
+    """
+    Encoded GET /jobs responses for one version of the queue.
+
+    The sorted jobs of a version never change, so the full response and the
+    pages requested so far are encoded once and then served as bytes until
+    the queue is modified.
+    """
+
+    # Pages kept per version (the UI keeps asking for the same few)
+    MAX_CACHED_PAGES = 64
+
+    def __init__(self, version: int, jobs: Tuple[JobResponseDTO, ...]):
+        self.version = version
+        self.jobs = jobs
+        self._pages: Dict[Tuple[Optional[int], Optional[str]], bytes] = {}
+        self._keys: Optional[List[Tuple[int, float, str]]] = None
+
+    @staticmethod
+    def _encode(payload: dict) -> bytes:
+        return json.dumps(payload, separators=(",", ":")).encode()
+
+    @staticmethod
+    def _sort_key(job: JobResponseDTO) -> Tuple[int, float, str]:
+        # Same order as the view: priority, submission time, then ID for jobs submitted together
+        return -int(job.priority), job.submittedAt.timestamp(), job.id
+
+    @classmethod
+    def make_cursor(cls, job: JobResponseDTO) -> str:
+        # Sort key of the last job of a page: the next page can be found even once that job left the queue
+        priority, submitted_at, job_id = cls._sort_key(job)
+        return f"{-priority}:{submitted_at!r}:{job_id}"
+
+    def _start_after(self, cursor: str) -> int:
+        """
+        Index of the first job that comes after the cursor
+        """
+        try:
+            priority, submitted_at, job_id = cursor.split(":", 2)
+            key = (-int(priority), float(submitted_at), job_id)
+        except ValueError:
+            raise InvalidCursorError(f"Invalid cursor {cursor}")
+        if self._keys is None:
+            self._keys = [self._sort_key(job) for job in self.jobs]
+        return bisect_right(self._keys, key)
+
+    def body(self, limit: Optional[int] = None, after: Optional[str] = None) -> bytes:
+        """
+        Encoded response: every job, or at most `limit` jobs after the `after` cursor
+        """
+        page_key = (limit, after)
+        body = self._pages.get(page_key)
+        if body is not None:
+            return body
+        if limit is None and after is None:
+            body = self._encode({"jobs": [job.to_dict() for job in self.jobs]})
+        else:
+            start = self._start_after(after) if after else 0
+            end = len(self.jobs) if limit is None else start + limit
+            page = self.jobs[start:end]
+            next_cursor = self.make_cursor(page[-1]) if page and end < len(self.jobs) else None
+            body = self._encode({"jobs": [job.to_dict() for job in page], "nextCursor": next_cursor})
+        if len(self._pages) < self.MAX_CACHED_PAGES:
+            self._pages[page_key] = body
+        return body
@@ -1,33 +1,120 @@
-from typing import List, Optional
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set, Tuple
 from app.persistence.repository import PriorityQueueRepository
+from app.persistence.journal import QueueJournal
+from app.persistence.sqlite_repository import SqlitePriorityQueueRepository
 from app.dto.job_request_dto import JobRequestDTO
 from app.dto.job_response_dto import JobResponseDTO
+from app.model.jobs_view import JobsView
+from app.model.change_feed import ChangeFeed
 import logging
 from flask import jsonify
 
 class PriorityQueueManager:
+    # Upper bound of a long-poll request, in seconds
+    MAX_WAIT_SECONDS = 30
+    # Upper bound of a lease (and of a lease extension), in seconds
+    MAX_LEASE_SECONDS = 86400
+    # Waiting consumers re-check the queue at least this often so expired leases are noticed
+    LEASE_CHECK_INTERVAL = 1.0
+
     def __init__(self):
         self.repository = PriorityQueueRepository()
+        # Changes of the queue, streamed to observers by GET /jobs/events
+        self.feed = ChangeFeed()
+        self.repository.attach_feed(self.feed)
+        # Notified whenever jobs become available (new job or lease given back)
+        self._jobs_available = threading.Condition()
+        # Encoded GET /jobs responses of the latest version; ETags also carry the epoch ID of the
+        # repository (per process in memory, stored in the database with SQLite)
+        self._jobs_view: Optional[JobsView] = None
         self.logger = logging.getLogger(__name__)
+
+    def enable_persistence(self, persistence_config: dict, base_dir: str):
+        """Select the storage backend: in-memory heap with a journal, or a SQLite database shared by workers"""
+        if not persistence_config.get('enabled', False):
+            self.logger.info("Queue persistence disabled, jobs are kept in memory only")
+            return
+        data_dir = os.path.join(base_dir, persistence_config.get('data_dir', 'data'))
+        backend = persistence_config.get('backend', 'memory')
+        if backend == 'sqlite':
+            self.repository = SqlitePriorityQueueRepository(
+                os.path.join(data_dir, persistence_config.get('sqlite_file', 'queue.db')),
+                busy_timeout_ms=persistence_config.get('busy_timeout_ms', 5000)
+            )
+            self.repository.attach_feed(self.feed)
+            return
+        if backend != 'memory':
+            raise ValueError(f"Unknown queue backend {backend}")
+        journal = QueueJournal(
+            data_dir,
+            fsync_interval=persistence_config.get('fsync_interval_ms', 50) / 1000,
+            snapshot_every=persistence_config.get('snapshot_every', 10000),
+            sync_writes=persistence_config.get('sync_writes', False)
+        )
+        self.repository.attach_journal(journal)
+
+    def close(self):
+        """Flush pending journal records / close the database connection"""
+        self.repository.close()
     
     def add_job(self, job_request: JobRequestDTO) -> JobResponseDTO:
-        """Add job and reorder queue"""
-        new_job = self.repository.add_job(job_request)
-        self._reorder_queue()
+        """Add job (the repository keeps the queue ordered) and wake up waiting consumers"""
+        with self._jobs_available:
+            new_job = self.repository.add_job(job_request)
+            self._jobs_available.notify_all()
         return new_job
     
+    def add_jobs(self, job_requests: List[JobRequestDTO]) -> List[JobResponseDTO]:
+        """Add many jobs with a single reordering pass and wake up waiting consumers"""
+        with self._jobs_available:
+            new_jobs = self.repository.add_jobs(job_requests)
+            self._jobs_available.notify_all()
+        return new_jobs
+
     def update_job_priority(self, job_id: str, new_priority: int) -> Optional[JobResponseDTO]:
-        """Update priority and reorder queue"""
-        updated_job = self.repository.update_job_priority(job_id, new_priority)
-        if updated_job:
-            self._reorder_queue()   # <---------------------------------
-        return updated_job
+        """Update priority (the job is re-positioned in the heap)"""
+        return self.repository.update_job_priority(job_id, new_priority)
     
+    def update_job_priorities(self, priorities: Dict[str, int]) -> List[JobResponseDTO]:
+        """Update many priorities with a single reordering pass"""
+        return self.repository.update_job_priorities(priorities)
+
     def get_all_jobs(self) -> List[JobResponseDTO]:
-        """Get all jobs (already sorted)"""
-        self._reorder_queue()
+        """Get all jobs (sorted view, the queue is not modified)"""
         return self.repository.get_all_jobs()
     
+    def get_jobs_etag(self) -> str:
+        """ETag of the current version of the queue"""
+        return self.get_feed_event_id(self.repository.get_version())
+
+    def get_jobs_response(self, limit: Optional[int] = None, after: Optional[str] = None) -> Tuple[str, bytes]:
+        """Get the ETag and the encoded GET /jobs response (every job, or a page after a cursor).
+        Responses are encoded once per queue version."""
+        version, jobs = self.repository.get_jobs_snapshot()
+        view = self._jobs_view
+        if view is None or view.version != version:
+            view = self._jobs_view = JobsView(version, jobs)
+        return self.get_feed_event_id(version), view.body(limit, after)
+
+    def get_feed_events(self, version: int, timeout: float) -> Optional[list]:
+        """Changes newer than `version`, waiting up to `timeout` seconds for one (None: reload the queue)"""
+        return self.feed.events_after(version, timeout)
+
+    def get_feed_event_id(self, version: int) -> str:
+        """Event ID of a version, same format as the ETag of GET /jobs"""
+        return f"{self.repository.get_epoch_id()}-{version}"
+
+    def parse_feed_event_id(self, event_id: str) -> Optional[int]:
+        """Version of an event ID / ETag of this queue, None if it comes from another one (e.g. before a restart)"""
+        epoch_id, _, version = event_id.strip('"').rpartition('-')
+        if epoch_id != self.repository.get_epoch_id() or not version.isdigit():
+            return None
+        return int(version)
+
     def delete_job(self, job_id: str) -> bool:
         """Delete single job"""
         return self.repository.delete_job(job_id)
@@ -38,20 +125,56 @@ class PriorityQueueManager:
     
     def get_highest_priority_job(self) -> Optional[JobResponseDTO]:
         """Get and remove highest priority job"""
-        self._reorder_queue()   # <---------------------------------
         return self.repository.get_highest_priority_job()
+
+    def get_highest_priority_jobs(self, count: int, printer_ids: Optional[Set[str]] = None,
+                                  wait: float = 0) -> List[JobResponseDTO]:
+        """Get and remove up to count highest priority jobs, optionally only those the given printers can take.
+        If none is available, wait up to `wait` seconds for one to be enqueued."""
+        return self._wait_for_jobs(lambda: self.repository.get_highest_priority_jobs(count, printer_ids), wait)
+
+    def lease_highest_priority_jobs(self, count: int, lease_time: float, printer_ids: Optional[Set[str]] = None,
+                                    wait: float = 0) -> List[Tuple[str, datetime, JobResponseDTO]]:
+        """Lease up to count highest priority jobs for lease_time seconds, waiting up to `wait` seconds.
+        Leased jobs must be acked, otherwise they are re-queued when the lease expires."""
+        return self._wait_for_jobs(
+            lambda: self.repository.lease_highest_priority_jobs(count, lease_time, printer_ids), wait)
+
+    def ack_lease(self, lease_id: str) -> Optional[JobResponseDTO]:
+        """Confirm a leased job was consumed"""
+        with self._jobs_available:
+            return self.repository.ack_lease(lease_id)
+
+    def extend_lease(self, lease_id: str, lease_time: float) -> Optional[Tuple[datetime, JobResponseDTO]]:
+        """Keep a leased job out of the queue for lease_time more seconds"""
+        with self._jobs_available:
+            return self.repository.extend_lease(lease_id, lease_time)
+
+    def nack_lease(self, lease_id: str) -> Optional[JobResponseDTO]:
+        """Give a leased job back to the queue and wake up waiting consumers"""
+        with self._jobs_available:
+            job = self.repository.nack_lease(lease_id)
+            if job:
+                self._jobs_available.notify_all()
+            return job
+
+    def _wait_for_jobs(self, take: Callable[[], list], wait: float) -> list:
+        """Call take() until it returns jobs or the long-poll deadline passes"""
+        deadline = time.monotonic() + min(max(wait, 0), self.MAX_WAIT_SECONDS)
+        with self._jobs_available:
+            taken = take()
+            while not taken:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._jobs_available.wait(min(remaining, self.LEASE_CHECK_INTERVAL))
+                taken = take()
+            return taken
     
     def get_job_count(self) -> int:
         """Get total job count"""
         return self.repository.get_job_count()
     
-    def _reorder_queue(self):
-        """Sort jobs by priority (highest first), then by submission time"""
-        jobs = self.repository.get_all_jobs()
-        jobs.sort(key=lambda job: (-int(job.priority), job.submittedAt))
-        self.repository.set_jobs(jobs)
-        self.logger.debug("Queue reordered by priority")
-
     @staticmethod
     def validate_model_id(data):
         # Validate required fields
@@ -0,0 +1,239 @@
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+import logging
+
+class QueueJournal:
+    """
+    Append-only journal of queue mutations with periodic compact snapshots.
+
+    Records are JSON lines written to a buffered file; a background thread
+    flushes and fsyncs them in groups every `fsync_interval` seconds. With
+    `sync_writes` enabled, `append` waits for the group commit that covers
+    its record instead of returning immediately.
+
+    Snapshots are written off the write path: the records so far move to a
+    pending segment, writers go on with a fresh journal, and a helper thread
+    writes the snapshot and then deletes the pending segment. Until then the
+    pending segment is replayed after the previous snapshot.
+    """
+
+    JOURNAL_FILE = "queue.journal"
+    PENDING_FILE = "queue.journal.pending"
+    SNAPSHOT_FILE = "queue.snapshot.json"
+    # Job rows encoded per json.dumps call when writing a snapshot
+    SNAPSHOT_CHUNK = 1000
+
+    def __init__(self, data_dir: str, fsync_interval: float = 0.05,
+                 snapshot_every: int = 10000, sync_writes: bool = False):
+        self.data_dir = data_dir
+        self.fsync_interval = fsync_interval
+        self.snapshot_every = snapshot_every
+        self.sync_writes = sync_writes
+
+        self.journal_path = os.path.join(data_dir, self.JOURNAL_FILE)
+        self.pending_path = os.path.join(data_dir, self.PENDING_FILE)
+        self.snapshot_path = os.path.join(data_dir, self.SNAPSHOT_FILE)
+
+        self._file = None
+        self._cond = threading.Condition()
+        self._written = 0       # records written to the buffered file
+        self._synced = 0        # records known to be on disk
+        self._since_snapshot = 0
+        self._running = False
+        self._thread = None
+        self._snapshot_thread: Optional[threading.Thread] = None
+        self._logger = logging.getLogger(__name__)
+
+    def load(self) -> Tuple[List[list], List[dict]]:
+        """
+        Return the job rows of the last snapshot and the journal records
+        written after it
+        """
+        os.makedirs(self.data_dir, exist_ok=True)
+        jobs = []
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r") as f:
+                jobs = json.loads(f.read()).get("jobs", [])
+        # A pending segment is left by a snapshot that did not complete, its records come first
+        records = self._read_records(self.pending_path) + self._read_records(self.journal_path)
+        self._since_snapshot = len(records)
+        return jobs, records
+
+    def _read_records(self, path: str) -> List[dict]:
+        if not os.path.exists(path):
+            return []
+        with open(path, "rb") as f:
+            lines = f.read().split(b"\n")
+        complete, tail = lines[:-1], lines[-1]
+        if not tail:
+            try:
+                # Decode the whole journal in a single call, much faster than line by line
+                return json.loads(b"[" + b",".join(complete) + b"]")
+            except ValueError:
+                pass
+            lines = complete
+        records = []
+        valid_bytes = 0
+        for number, line in enumerate(lines, start=1):
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                if number < len(lines):
+                    # Only the last record can be torn, anything before it means the file is corrupted
+                    raise ValueError(f"Corrupted journal record at line {number} of {path}")
+                # Torn write at the tail of the journal (crash mid-append): cut it off
+                # so that new records are not appended to a broken line
+                self._logger.warning(f"Ignoring truncated journal record at the end of {path}")
+                with open(path, "r+b") as f:
+                    f.truncate(valid_bytes)
+                break
+            valid_bytes += len(line) + 1
+        return records
+
+    def open(self):
+        """
+        Open the journal for appending and start the group-commit thread
+        """
+        os.makedirs(self.data_dir, exist_ok=True)
+        self._file = open(self.journal_path, "a")
+        self._running = True
+        self._thread = threading.Thread(target=self._sync_loop, name="queue-journal", daemon=True)
+        self._thread.start()
+        self._logger.info(f"Queue journal opened at {self.journal_path}")
+
+    def append(self, record: dict):
+        """
+        Append a mutation record to the journal
+        """
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._cond:
+            self._file.write(line)
+            self._written += 1
+            self._since_snapshot += 1
+            ticket = self._written
+            if self.sync_writes:
+                self._cond.notify_all()
+                while self._synced < ticket and self._running:
+                    self._cond.wait()
+
+    def needs_snapshot(self) -> bool:
+        return self._since_snapshot >= self.snapshot_every
+
+    def _install_snapshot(self, jobs: List[list]):
+        """
+        Atomically replace the snapshot with the given jobs
+        """
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            # Encoded in chunks: a single dumps call holds the GIL, and would stall writers, for the whole queue
+            f.write(f'{{"createdAt":{json.dumps(time.time())},"jobs":[')
+            for i in range(0, len(jobs), self.SNAPSHOT_CHUNK):
+                if i:
+                    f.write(",")
+                f.write(json.dumps(jobs[i:i + self.SNAPSHOT_CHUNK], separators=(",", ":"))[1:-1])
+            f.write("]}")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+    def write_snapshot(self, jobs: List[list]):
+        """
+        Atomically replace the snapshot with the given jobs and truncate the journal, blocking writers meanwhile.
+        Replay is idempotent, so a crash between the two steps is harmless.
+        """
+        with self._cond:
+            start = time.perf_counter()
+            self._install_snapshot(jobs)
+            self._file.close()
+            self._file = open(self.journal_path, "w")
+            if os.path.exists(self.pending_path):
+                os.remove(self.pending_path)
+            self._synced = self._written
+            self._since_snapshot = 0
+            self._cond.notify_all()
+        self._logger.info(f"Wrote queue snapshot with {len(jobs)} jobs in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    def start_snapshot(self, build_jobs: Callable[[], List[list]]) -> bool:
+        """
+        Snapshot the queue on a helper thread: the records written so far move to the pending
+        segment and `build_jobs` (the rows of the queue at this point) runs on the helper thread.
+        Returns False if a snapshot is still being written.
+        """
+        with self._cond:
+            if self._snapshot_thread is not None and self._snapshot_thread.is_alive():
+                return False
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            if os.path.exists(self.pending_path):
+                # The previous snapshot did not complete: both segments are needed until this one is in place
+                with open(self.journal_path, "rb") as src, open(self.pending_path, "ab") as dst:
+                    shutil.copyfileobj(src, dst)
+                    dst.flush()
+                    os.fsync(dst.fileno())
+            else:
+                os.replace(self.journal_path, self.pending_path)
+            self._file = open(self.journal_path, "w")
+            self._synced = self._written
+            self._since_snapshot = 0
+            self._cond.notify_all()
+        self._snapshot_thread = threading.Thread(target=self._write_snapshot_async, args=(build_jobs,),
+                                                 name="queue-snapshot", daemon=True)
+        self._snapshot_thread.start()
+        return True
+
+    def _write_snapshot_async(self, build_jobs: Callable[[], List[list]]):
+        start = time.perf_counter()
+        try:
+            jobs = build_jobs()
+            self._install_snapshot(jobs)
+            # The snapshot covers the pending records now
+            os.remove(self.pending_path)
+        except (OSError, ValueError, TypeError) as e:
+            # The pending segment stays and is replayed after the previous snapshot
+            self._logger.error(f"Queue snapshot failed: {e}")
+            return
+        self._logger.info(f"Wrote queue snapshot with {len(jobs)} jobs in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    def _sync(self):
+        # Called with self._cond held
+        if self._synced == self._written:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._synced = self._written
+        self._cond.notify_all()
+
+    def _sync_loop(self):
+        while self._running:
+            with self._cond:
+                if self._synced == self._written:
+                    self._cond.wait(self.fsync_interval)
+                else:
+                    # Let concurrent writers join this group commit
+                    self._cond.wait(self.fsync_interval if not self.sync_writes else 0.001)
+                try:
+                    self._sync()
+                except (OSError, ValueError) as e:
+                    self._logger.error(f"Journal fsync failed: {e}")
+
+    def close(self):
+        """
+        Flush pending records and stop the group-commit thread
+        """
+        with self._cond:
+            if not self._running:
+                return
+            self._running = False
+            self._sync()
+            self._cond.notify_all()
+        self._thread.join()
+        if self._snapshot_thread is not None:
+            self._snapshot_thread.join()
+        self._file.close()
+        self._logger.info("Queue journal closed")
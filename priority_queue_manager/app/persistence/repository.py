@@ -1,29 +1,220 @@
+import gc
+import heapq
+import itertools
+import threading
+import time
+import uuid
+from dataclasses import replace
+from functools import wraps
 from random import randint
-from typing import List, Optional
+from typing import Dict, List, Optional, Set, Tuple
 from app.dto.job_request_dto import JobRequestDTO
 from app.dto.job_response_dto import JobResponseDTO
-from datetime import datetime, timezone
+from app.persistence.journal import QueueJournal
+from app.model.change_feed import ChangeFeed
+from datetime import datetime, timedelta, timezone
 
 import logging
 
+def synchronized(method):
+    """
+    Run a writer method under the repository lock and publish the new
+    version and job count for lock-free readers when it returns
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                self._publish()
+    return wrapper
+
 class PriorityQueueRepository:
+    # Heap entries are lists [-priority, submittedAt, seq, job]; job is set to None when invalidated.
+    # Job objects are never modified once queued (updates replace them), so readers can share them.
+    _REMOVED = None
+
     def __init__(self):
-        # In-memory storage for jobs
-        self._jobs: List[JobResponseDTO] = []
+        # In-memory storage for jobs: binary heap ordered by (-priority, submittedAt, seq)
+        self._heap: List[list] = []
+        # Index jobId -> live heap entry (stale entries are skipped lazily)
+        self._entries: Dict[str, list] = {}
+        # Tie breaker so entries submitted in the same instant keep insertion order
+        self._sequence = itertools.count()
         self._job_counter = 0  # Counter for job IDs starting from 0. Not implemented in this version.
+        # Leased jobs: leaseId -> (monotonic deadline, expiresAt, job), plus a heap of deadlines for expiry.
+        # A leased job is out of the queue but still journaled as queued until it is acked.
+        self._leases: Dict[str, Tuple[float, datetime, JobResponseDTO]] = {}
+        self._lease_deadlines: List[Tuple[float, str]] = []
+        # IDs of the leased jobs: they may come back to the queue, so new jobs must not reuse them
+        self._leased_ids: Set[str] = set()
+        # Optional durable journal, every mutation is appended to it once attached
+        self._journal: Optional[QueueJournal] = None
+        # Optional change feed, every change of the queue is published to it once attached
+        self._feed: Optional[ChangeFeed] = None
+        # Writers hold the lock; readers use the state published when the last writer returned
+        self._lock = threading.RLock()
+        self._mutations = 0                     # bumped by every structural change
+        self._version = 0                       # last published value of _mutations
+        self._job_count = 0                     # job count at _version
+        self._view: Tuple[int, Tuple[JobResponseDTO, ...]] = (0, ())  # sorted jobs, built lazily per version
+        # Versions restart with the process, so ETags and event IDs also carry an ID of this instance
+        self._epoch_id = uuid.uuid4().hex[:8]
         self._logger = logging.getLogger(__name__)
         self._logger.info("PriorityQueueRepository initialized")
 
-    def add_job(self, job_request: JobRequestDTO) -> JobResponseDTO:
+    @staticmethod
+    def _job_to_record(job: JobResponseDTO) -> list:
+        # Compact positional row with epoch timestamps, much cheaper to parse than ISO strings on replay
+        return [job.id, job.modelId, job.assignedPrinterId, job.priority, job.status,
+                job.submittedAt.timestamp(), job.updatedAt.timestamp()]
+
+    @staticmethod
+    def _job_from_record(row: list) -> JobResponseDTO:
+        return JobResponseDTO(
+            row[0], row[1], row[2], row[3], row[4],
+            datetime.fromtimestamp(row[5], timezone.utc),
+            datetime.fromtimestamp(row[6], timezone.utc)
+        )
+
+    def _publish(self):
+        # Called with the lock held, at the end of every writer
+        if self._version != self._mutations:
+            self._job_count = len(self._entries)
+            self._version = self._mutations
+
+    @synchronized
+    def attach_journal(self, journal: QueueJournal):
         """
-        Add a new job to the repository
+        Restore the queue from the journal's snapshot and records, then journal every further mutation
         """
-        
-        job_id = f"{job_request.modelId}-{randint(10,99)}{randint(10,99)}"
-        now = datetime.now(timezone.utc)
-        
-        new_job = JobResponseDTO(
-            id=job_id,
+        # Restoring allocates one object per job; cyclic GC passes over them are pure overhead here
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            rows, records = journal.load()
+            restored: Dict[str, JobResponseDTO] = {}
+            for row in rows:
+                job = self._job_from_record(row)
+                restored[job.id] = job
+            for record in records:
+                self._apply_record(restored, record)
+            self._rebuild(restored.values())
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        self._logger.info(f"Restored {len(self._entries)} jobs ({len(rows)} from snapshot, {len(records)} journal records)")
+        journal.open()
+        self._journal = journal
+
+    def _apply_record(self, jobs: Dict[str, JobResponseDTO], record: dict):
+        """
+        Apply a journal record to the jobs being restored. Every operation is idempotent.
+        """
+        op = record["op"]
+        if op == "add":
+            job = self._job_from_record(record["job"])
+            jobs[job.id] = job
+        elif op in ("priority", "status"):
+            job = jobs.get(record["id"])
+            if job:
+                setattr(job, op, record[op])
+                job.updatedAt = datetime.fromtimestamp(record["at"], timezone.utc)
+        elif op in ("delete", "dequeue"):
+            jobs.pop(record["id"], None)
+        elif op == "clear":
+            jobs.clear()
+        else:
+            self._logger.warning(f"Unknown journal operation {op}")
+
+    def attach_feed(self, feed: ChangeFeed):
+        """
+        Publish every further change of the queue to the feed
+        """
+        self._feed = feed
+
+    def _emit(self, event_type: str, items=()):
+        """
+        Publish a change to the feed (if any); called with the lock held, after the change
+        """
+        if self._feed is not None:
+            self._feed.publish(self._mutations, event_type, tuple(items))
+
+    def _rebuild(self, jobs):
+        """
+        Rebuild index and heap from scratch in O(n)
+        """
+        self._entries = {}
+        for job in jobs:
+            self._entries[job.id] = [-int(job.priority), job.submittedAt, next(self._sequence), job]
+        self._heap = list(self._entries.values())
+        heapq.heapify(self._heap)
+        self._mutations += 1
+
+    def _record(self, record: dict):
+        """
+        Append a mutation to the journal (if any) and snapshot the queue when due
+        """
+        if self._journal is None:
+            return
+        self._journal.append(record)
+        if self._journal.needs_snapshot():
+            # Job objects are never modified once queued: copying the list is enough, the rows
+            # are built, serialized and fsynced on the journal's snapshot thread
+            jobs = [entry[-1] for entry in self._entries.values()] + [lease[2] for lease in self._leases.values()]
+            self._journal.start_snapshot(lambda: [self._job_to_record(job) for job in jobs])
+
+    def close(self):
+        """
+        Flush and close the journal
+        """
+        if self._journal is not None:
+            self._journal.close()
+
+    def _generate_job_id(self, model_id: str, reserved: Set[str] = frozenset()) -> str:
+        """
+        Generate a job ID that is not already in the queue, leased (nor in `reserved`)
+        """
+        job_id = f"{model_id}-{randint(10,99)}{randint(10,99)}"
+        while job_id in self._entries or job_id in self._leased_ids or job_id in reserved:
+            job_id = f"{model_id}-{randint(10,99)}{randint(10,99)}"
+        return job_id
+
+    def _push(self, job: JobResponseDTO):
+        """
+        Push a heap entry for the job and index it by ID
+        """
+        entry = [-int(job.priority), job.submittedAt, next(self._sequence), job]
+        self._entries[job.id] = entry
+        heapq.heappush(self._heap, entry)
+        self._mutations += 1
+
+    def _invalidate(self, job_id: str) -> Optional[JobResponseDTO]:
+        """
+        Remove the job from the index and mark its heap entry as stale
+        """
+        entry = self._entries.pop(job_id, None)
+        if entry is None:
+            return None
+        job = entry[-1]
+        entry[-1] = self._REMOVED
+        self._mutations += 1
+        self._compact_if_needed()
+        return job
+
+    def _compact_if_needed(self):
+        """
+        Rebuild the heap when stale entries outnumber live ones
+        """
+        if len(self._heap) > 64 and len(self._heap) > 2 * len(self._entries):
+            self._heap = [entry for entry in self._heap if entry[-1] is not self._REMOVED]
+            heapq.heapify(self._heap)
+            self._logger.debug("Heap compacted")
+
+    def _new_job(self, job_request: JobRequestDTO, now: datetime, reserved: Set[str] = frozenset()) -> JobResponseDTO:
+        return JobResponseDTO(
+            id=self._generate_job_id(job_request.modelId, reserved),
             modelId=job_request.modelId,
             assignedPrinterId=job_request.printerId,
             priority=job_request.priority,
@@ -31,109 +222,362 @@ class PriorityQueueRepository:
             submittedAt=now,
             updatedAt=now
         )
-        
-        self._jobs.append(new_job)
-        self._logger.info(f"Added job {job_id} with priority {job_request.priority}")
+
+    def _push_many(self, jobs: List[JobResponseDTO]):
+        """
+        Insert many jobs with a single reordering pass: heapify when the batch
+        is large compared to the heap, individual pushes otherwise
+        """
+        entries = [[-int(job.priority), job.submittedAt, next(self._sequence), job] for job in jobs]
+        for entry in entries:
+            self._entries[entry[-1].id] = entry
+        if len(entries) * 8 > len(self._heap):
+            self._heap.extend(entries)
+            heapq.heapify(self._heap)
+        else:
+            for entry in entries:
+                heapq.heappush(self._heap, entry)
+        self._mutations += 1
+
+    @synchronized
+    def add_job(self, job_request: JobRequestDTO) -> JobResponseDTO:
+        """
+        Add a new job to the repository
+        """
+        new_job = self._new_job(job_request, datetime.now(timezone.utc))
+        self._push(new_job)
+        self._record({"op": "add", "job": self._job_to_record(new_job)})
+        self._emit("add", (new_job,))
+        self._logger.info(f"Added job {new_job.id} with priority {job_request.priority}")
         return new_job
 
+    @synchronized
+    def add_jobs(self, job_requests: List[JobRequestDTO]) -> List[JobResponseDTO]:
+        """
+        Add many jobs at once, in request order
+        """
+        now = datetime.now(timezone.utc)
+        new_jobs = []
+        reserved: Set[str] = set()
+        for job_request in job_requests:
+            new_job = self._new_job(job_request, now, reserved)
+            # Reserve the ID right away so the batch cannot generate duplicates
+            reserved.add(new_job.id)
+            new_jobs.append(new_job)
+        self._push_many(new_jobs)
+        for new_job in new_jobs:
+            self._record({"op": "add", "job": self._job_to_record(new_job)})
+        self._emit("add", new_jobs)
+        self._logger.info(f"Added {len(new_jobs)} jobs in batch")
+        return new_jobs
+
     def get_all_jobs(self) -> List[JobResponseDTO]:
         """
-        Get all jobs
+        Get all jobs sorted from highest to lowest priority (the queue is not modified).
+        Lock-free while the queue is unchanged; the sorted view is rebuilt once per version.
+        """
+        return list(self.get_jobs_snapshot()[1])
+
+    def get_jobs_snapshot(self) -> Tuple[int, Tuple[JobResponseDTO, ...]]:
+        """
+        Get the queue version together with the sorted jobs of that version
+        """
+        view = self._view
+        if view[0] != self._version:
+            with self._lock:
+                if self._view[0] != self._version:
+                    # Jobs submitted in the same instant are listed by ID, so that pages can resume from a sort key
+                    entries = sorted(self._entries.values(), key=lambda entry: (entry[0], entry[1], entry[-1].id))
+                    self._view = (self._version, tuple(entry[-1] for entry in entries))
+                view = self._view
+        return view
+
+    def get_version(self) -> int:
+        """
+        Get the version of the queue, it changes whenever the queue is modified
+        """
+        return self._version
+
+    def get_epoch_id(self) -> str:
+        """
+        Get the ID of this instance of the queue, versions are only comparable within it
         """
-        return self._jobs.copy()
+        return self._epoch_id
 
+    @synchronized
     def set_jobs(self, jobs: List[JobResponseDTO]):
         """
-        Set the jobs list (used by service for reordering)
+        Replace the content of the queue with the given jobs
         """
-        self._jobs = jobs
+        self._rebuild(jobs)
+        self._record({"op": "clear"})
+        for job in jobs:
+            self._record({"op": "add", "job": self._job_to_record(job)})
+        self._emit("reset")
 
+    @synchronized
     def get_job_by_id(self, job_id: str) -> Optional[JobResponseDTO]:
         """
         Get a specific job by its ID
         """
-        for job in self._jobs:
-            if job.id == job_id:
-                return job
-        return None
+        entry = self._entries.get(job_id)
+        return entry[-1] if entry else None
 
+    @synchronized
     def update_job_priority(self, job_id: str, new_priority: int) -> Optional[JobResponseDTO]:
         """
         Update the priority of an existing job
         """
-        job = self.get_job_by_id(job_id)
-        if job:
-            job.priority = new_priority
-            job.updatedAt = datetime.now(timezone.utc)
+        entry = self._entries.get(job_id)
+        if entry:
+            # Converted before the old entry is touched: an invalid priority leaves the job queued
+            new_priority = int(new_priority)
+            job = replace(entry[-1], priority=new_priority, updatedAt=datetime.now(timezone.utc))
+            self._invalidate(job_id)
+            self._push(job)
+            self._record({"op": "priority", "id": job_id, "priority": new_priority, "at": job.updatedAt.timestamp()})
+            self._emit("update", (job,))
             self._logger.info(f"Updated job {job_id} priority to {new_priority}")
             return job
         return None
 
+    @synchronized
+    def update_job_priorities(self, priorities: Dict[str, int]) -> List[JobResponseDTO]:
+        """
+        Update the priority of many jobs with a single reordering pass
+        Returns the updated jobs, unknown IDs are ignored
+        """
+        # Converted before any entry is touched: an invalid priority leaves every job queued
+        priorities = {job_id: int(new_priority) for job_id, new_priority in priorities.items()}
+        now = datetime.now(timezone.utc)
+        updated = []
+        for job_id, new_priority in priorities.items():
+            entry = self._entries.pop(job_id, None)
+            if entry is None:
+                continue
+            job = entry[-1]
+            entry[-1] = self._REMOVED
+            updated.append(replace(job, priority=new_priority, updatedAt=now))
+        if updated:
+            self._push_many(updated)
+            self._compact_if_needed()
+        for job in updated:
+            self._record({"op": "priority", "id": job.id, "priority": job.priority, "at": now.timestamp()})
+        if updated:
+            self._emit("update", updated)
+        self._logger.info(f"Updated priority of {len(updated)} jobs in batch")
+        return updated
+
+    @synchronized
     def delete_job(self, job_id: str) -> bool:
         """
         Delete a single job by ID
         Returns True if job was found and deleted, False otherwise
         """
-        for i, job in enumerate(self._jobs):
-            if job.id == job_id:
-                deleted_job = self._jobs.pop(i)
-                self._logger.info(f"Deleted job {job_id}")
-                return True
+        if self._invalidate(job_id):
+            self._record({"op": "delete", "id": job_id})
+            self._emit("delete", (job_id,))
+            self._logger.info(f"Deleted job {job_id}")
+            return True
         return False
 
+    @synchronized
     def delete_multiple_jobs(self, job_ids: List[str]) -> int:
         """
         Delete multiple jobs by their IDs
         Returns the number of jobs actually deleted
         """
-        deleted_count = 0
-        job_ids_set = set(job_ids)
-        
-        # Filter out jobs that should be deleted
-        original_count = len(self._jobs)
-        self._jobs = [job for job in self._jobs if job.id not in job_ids_set]
-        deleted_count = original_count - len(self._jobs)
-        
-        if deleted_count > 0:
-            self._logger.info(f"Deleted {deleted_count} jobs")
-        
-        return deleted_count
+        deleted = []
+        for job_id in set(job_ids):
+            if self._invalidate(job_id):
+                self._record({"op": "delete", "id": job_id})
+                deleted.append(job_id)
+
+        if deleted:
+            self._emit("delete", deleted)
+            self._logger.info(f"Deleted {len(deleted)} jobs")
+
+        return len(deleted)
 
     def get_highest_priority_job(self) -> Optional[JobResponseDTO]:
         """
         Get the job with highest priority (consumer approach - removes the job)
         Returns None if no jobs are available
         """
-        if not self._jobs:
+        jobs = self.get_highest_priority_jobs(1)
+        return jobs[0] if jobs else None
+
+    @synchronized
+    def get_highest_priority_jobs(self, count: int, printer_ids: Optional[Set[str]] = None) -> List[JobResponseDTO]:
+        """
+        Get and remove up to `count` jobs in priority order (consumer approach).
+        If printer_ids is given, only jobs without a preferred printer or preferring
+        one of those printers are taken; the others stay queued.
+        """
+        self.requeue_expired_leases()
+        taken = self._pop_jobs(count, printer_ids)
+        for job in taken:
+            self._record({"op": "dequeue", "id": job.id})
+        if taken:
+            self._emit("dequeue", [job.id for job in taken])
+            self._logger.info(f"Retrieved and removed {len(taken)} highest priority jobs: {[job.id for job in taken]}")
+        return taken
+
+    def _pop_jobs(self, count: int, printer_ids: Optional[Set[str]]) -> List[JobResponseDTO]:
+        """
+        Pop up to `count` matching jobs from the heap (not journaled)
+        """
+        taken: List[JobResponseDTO] = []
+        skipped: List[list] = []
+        while self._heap and len(taken) < count:
+            entry = heapq.heappop(self._heap)
+            job = entry[-1]
+            if job is self._REMOVED:
+                continue
+            if printer_ids is not None and job.assignedPrinterId and job.assignedPrinterId not in printer_ids:
+                skipped.append(entry)
+                continue
+            del self._entries[job.id]
+            self._mutations += 1
+            taken.append(job)
+        # Skipped entries are still live and indexed, just put them back
+        for entry in skipped:
+            heapq.heappush(self._heap, entry)
+        return taken
+
+    @synchronized
+    def lease_highest_priority_jobs(self, count: int, lease_time: float,
+                                    printer_ids: Optional[Set[str]] = None) -> List[Tuple[str, datetime, JobResponseDTO]]:
+        """
+        Take up to `count` jobs out of the queue under a lease of `lease_time` seconds.
+        Returns (leaseId, expiresAt, job) tuples; the job is removed for good only when the lease is acked.
+        """
+        self.requeue_expired_leases()
+        leased = []
+        deadline = time.monotonic() + lease_time
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=lease_time)
+        for job in self._pop_jobs(count, printer_ids):
+            lease_id = uuid.uuid4().hex
+            self._leases[lease_id] = (deadline, expires_at, job)
+            self._leased_ids.add(job.id)
+            heapq.heappush(self._lease_deadlines, (deadline, lease_id))
+            leased.append((lease_id, expires_at, job))
+        if leased:
+            # Leased jobs leave the queue like dequeued ones; they come back with an add event if not acked
+            self._emit("dequeue", [lease[2].id for lease in leased])
+            self._logger.info(f"Leased {len(leased)} jobs for {lease_time}s: {[lease[2].id for lease in leased]}")
+        return leased
+
+    @synchronized
+    def ack_lease(self, lease_id: str) -> Optional[JobResponseDTO]:
+        """
+        Confirm a leased job was consumed, it is removed for good.
+        Returns None if the lease is unknown or already expired (the job is back in the queue).
+        """
+        self.requeue_expired_leases()
+        lease = self._leases.pop(lease_id, None)
+        if lease is None:
             return None
-        
-        # Get the first job (highest priority) and remove it
-        highest_priority_job = self._jobs.pop(0)
-        self._logger.info(f"Retrieved and removed highest priority job {highest_priority_job.id}")
-        return highest_priority_job
+        job = lease[2]
+        self._leased_ids.discard(job.id)
+        self._record({"op": "dequeue", "id": job.id})
+        self._logger.info(f"Lease {lease_id} acked, job {job.id} consumed")
+        return job
+
+    @synchronized
+    def extend_lease(self, lease_id: str, lease_time: float) -> Optional[Tuple[datetime, JobResponseDTO]]:
+        """
+        Move the expiry of a live lease to `lease_time` seconds from now, for consumers that hold a job longer.
+        Returns (expiresAt, job), or None if the lease is unknown or already expired.
+        """
+        self.requeue_expired_leases()
+        lease = self._leases.get(lease_id)
+        if lease is None:
+            return None
+        deadline = time.monotonic() + lease_time
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=lease_time)
+        self._leases[lease_id] = (deadline, expires_at, lease[2])
+        # The previous heap entry becomes stale, expiry checks the deadline stored with the lease
+        heapq.heappush(self._lease_deadlines, (deadline, lease_id))
+        return expires_at, lease[2]
+
+    @synchronized
+    def nack_lease(self, lease_id: str) -> Optional[JobResponseDTO]:
+        """
+        Give a leased job back, it is re-queued with its original priority and submission time
+        """
+        lease = self._leases.pop(lease_id, None)
+        if lease is None:
+            return None
+        job = lease[2]
+        self._leased_ids.discard(job.id)
+        self._push(job)
+        self._emit("add", (job,))
+        self._logger.info(f"Lease {lease_id} nacked, job {job.id} re-queued")
+        return job
+
+    @synchronized
+    def requeue_expired_leases(self) -> int:
+        """
+        Re-queue the jobs of every expired lease
+        Returns the number of re-queued jobs
+        """
+        now = time.monotonic()
+        requeued = []
+        while self._lease_deadlines and self._lease_deadlines[0][0] <= now:
+            _, lease_id = heapq.heappop(self._lease_deadlines)
+            lease = self._leases.get(lease_id)
+            if lease is None or lease[0] > now:
+                continue  # already acked or nacked, or extended
+            del self._leases[lease_id]
+            self._leased_ids.discard(lease[2].id)
+            self._push(lease[2])
+            requeued.append(lease[2])
+            self._logger.warning(f"Lease {lease_id} expired, job {lease[2].id} re-queued")
+        if requeued:
+            self._emit("add", requeued)
+        return len(requeued)
+
+    def get_lease_count(self) -> int:
+        """
+        Get the number of jobs currently leased
+        """
+        return len(self._leases)
 
     def get_job_count(self) -> int:
         """
-        Get the total number of jobs in the queue
+        Get the total number of jobs in the queue (lock-free)
         """
-        return len(self._jobs)
+        return self._job_count
 
+    @synchronized
     def update_job_status(self, job_id: str, status: str) -> Optional[JobResponseDTO]:
         """
         Update the status of an existing job
         """
-        job = self.get_job_by_id(job_id)
-        if job:
-            job.status = status
-            job.updatedAt = datetime.now(timezone.utc)
+        entry = self._entries.get(job_id)
+        if entry:
+            # Same heap position, the new job object replaces the old one in place
+            job = entry[-1] = replace(entry[-1], status=status, updatedAt=datetime.now(timezone.utc))
+            self._mutations += 1
+            self._record({"op": "status", "id": job_id, "status": status, "at": job.updatedAt.timestamp()})
+            self._emit("update", (job,))
             self._logger.info(f"Updated job {job_id} status to {status}")
             return job
         return None
 
+    @synchronized
     def clear_all_jobs(self):
         """
         Remove all jobs from the queue (useful for testing)
         """
-        count = len(self._jobs)
-        self._jobs.clear()
-        self._logger.info(f"Cleared all {count} jobs from queue")
\ No newline at end of file
+        count = len(self._entries)
+        self._heap.clear()
+        self._entries.clear()
+        self._leases.clear()
+        self._leased_ids.clear()
+        self._lease_deadlines.clear()
+        self._mutations += 1
+        self._record({"op": "clear"})
+        self._emit("reset")
+        self._logger.info(f"Cleared all {count} jobs from queue")
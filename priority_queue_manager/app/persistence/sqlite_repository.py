@@ -0,0 +1,478 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from random import randint
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+from app.dto.job_request_dto import JobRequestDTO
+from app.dto.job_response_dto import JobResponseDTO
+from app.model.change_feed import ChangeFeed
+from datetime import datetime, timezone
+
+import logging
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id                TEXT PRIMARY KEY,
+    modelId           TEXT NOT NULL,
+    assignedPrinterId TEXT,
+    priority          INTEGER NOT NULL,
+    status            TEXT NOT NULL,
+    submittedAt       REAL NOT NULL,
+    updatedAt         REAL NOT NULL,
+    leaseId           TEXT,
+    leaseExpiresAt    REAL
+);
+-- Queue order of the jobs that are not leased
+-- (the rowid, last key of every index, keeps equal priorities and submission times in insertion order)
+CREATE INDEX IF NOT EXISTS jobs_queue_order ON jobs (priority DESC, submittedAt) WHERE leaseId IS NULL;
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_lease ON jobs (leaseId) WHERE leaseId IS NOT NULL;
+CREATE INDEX IF NOT EXISTS jobs_lease_expiry ON jobs (leaseExpiresAt) WHERE leaseId IS NOT NULL;
+-- Queue version, incremented by every write transaction that changes the queue
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+"""
+
+JOB_COLUMNS = "id, modelId, assignedPrinterId, priority, status, submittedAt, updatedAt"
+
+class SqlitePriorityQueueRepository:
+    """
+    Priority queue stored in an embedded SQLite database (WAL mode).
+
+    Same interface as PriorityQueueRepository, but the state lives in a
+    file shared by every process that opens it, so the API can be served by
+    several workers. Each thread uses its own connection; dequeues and
+    leases are a single DELETE/UPDATE ... RETURNING statement.
+    """
+
+    def __init__(self, db_path: str, busy_timeout_ms: int = 5000):
+        self.db_path = db_path
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._feed: Optional[ChangeFeed] = None
+        self._logger = logging.getLogger(__name__)
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        connection = self._connection()
+        connection.executescript(SCHEMA)
+        # Versions are shared by the workers, so is the epoch their ETags and event IDs carry:
+        # the first process to open the database picks it
+        connection.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('epoch', ?)", (randint(1, 2**31 - 1),))
+        epoch = connection.execute("SELECT value FROM meta WHERE key = 'epoch'").fetchone()[0]
+        self._epoch_id = f"{epoch:08x}"
+        self._logger.info(f"SqlitePriorityQueueRepository initialized at {db_path} ({self.get_job_count()} jobs)")
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # Autocommit mode, transactions are opened explicitly with BEGIN IMMEDIATE
+            connection = sqlite3.connect(self.db_path, isolation_level=None, timeout=self.busy_timeout_ms / 1000)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _write(self) -> "_WriteTransaction":
+        """
+        Context manager for a write transaction; it also bumps the queue version
+        """
+        return _WriteTransaction(self._connection(), self._feed)
+
+    def attach_feed(self, feed: ChangeFeed):
+        """
+        Publish every further change made through this process to the feed
+        """
+        self._feed = feed
+
+    @staticmethod
+    def _to_job(row) -> JobResponseDTO:
+        return JobResponseDTO(
+            row[0], row[1], row[2], row[3], row[4],
+            datetime.fromtimestamp(row[5], timezone.utc),
+            datetime.fromtimestamp(row[6], timezone.utc)
+        )
+
+    @staticmethod
+    def _sorted(rows) -> list:
+        # RETURNING does not guarantee any order: queue order of rows returning JOB_COLUMNS, rowid
+        return sorted(rows, key=lambda row: (-row[3], row[5], row[7]))
+
+    @staticmethod
+    def _printer_filter(printer_ids: Optional[Set[str]]) -> Tuple[str, list]:
+        if printer_ids is None:
+            return "", []
+        placeholders = ",".join("?" * len(printer_ids))
+        return f" AND (assignedPrinterId IS NULL OR assignedPrinterId IN ({placeholders}))", list(printer_ids)
+
+    def close(self):
+        """
+        Close the connection of the calling thread
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def _insert(self, transaction, job_request: JobRequestDTO, now: float) -> JobResponseDTO:
+        priority = int(job_request.priority)
+        while True:
+            job_id = f"{job_request.modelId}-{randint(10,99)}{randint(10,99)}"
+            try:
+                transaction.execute(
+                    f"INSERT INTO jobs ({JOB_COLUMNS}) VALUES (?, ?, ?, ?, 'pending', ?, ?)",
+                    (job_id, job_request.modelId, job_request.printerId, priority, now, now)
+                )
+                break
+            except sqlite3.IntegrityError:
+                continue  # ID already taken, draw another one
+        return self._to_job((job_id, job_request.modelId, job_request.printerId, priority, "pending", now, now))
+
+    def add_job(self, job_request: JobRequestDTO) -> JobResponseDTO:
+        """
+        Add a new job to the repository
+        """
+        with self._write() as transaction:
+            new_job = self._insert(transaction, job_request, time.time())
+            transaction.emit("add", (new_job,))
+        self._logger.info(f"Added job {new_job.id} with priority {job_request.priority}")
+        return new_job
+
+    def add_jobs(self, job_requests: List[JobRequestDTO]) -> List[JobResponseDTO]:
+        """
+        Add many jobs in a single transaction, in request order
+        """
+        now = time.time()
+        with self._write() as transaction:
+            new_jobs = [self._insert(transaction, job_request, now) for job_request in job_requests]
+            transaction.emit("add", new_jobs)
+        self._logger.info(f"Added {len(new_jobs)} jobs in batch")
+        return new_jobs
+
+    def get_all_jobs(self) -> List[JobResponseDTO]:
+        """
+        Get all queued jobs sorted from highest to lowest priority
+        """
+        rows = self._connection().execute(
+            f"SELECT {JOB_COLUMNS} FROM jobs WHERE leaseId IS NULL ORDER BY priority DESC, submittedAt, rowid"
+        ).fetchall()
+        return [self._to_job(row) for row in rows]
+
+    def get_jobs_snapshot(self) -> Tuple[int, Tuple[JobResponseDTO, ...]]:
+        """
+        Get the queue version together with the sorted jobs of that version
+        """
+        connection = self._connection()
+        # Both reads see the same WAL snapshot
+        connection.execute("BEGIN")
+        try:
+            version = connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+            rows = connection.execute(
+                f"SELECT {JOB_COLUMNS} FROM jobs WHERE leaseId IS NULL ORDER BY priority DESC, submittedAt, rowid"
+            ).fetchall()
+        finally:
+            connection.execute("COMMIT")
+        return version, tuple(self._to_job(row) for row in rows)
+
+    def get_version(self) -> int:
+        """
+        Get the version of the queue, it changes whenever the queue is modified
+        """
+        return self._connection().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    def get_epoch_id(self) -> str:
+        """
+        Get the ID of this database, the same for every worker that opens it
+        """
+        return self._epoch_id
+
+    def set_jobs(self, jobs: List[JobResponseDTO]):
+        """
+        Replace the content of the queue with the given jobs
+        """
+        with self._write() as transaction:
+            transaction.execute("DELETE FROM jobs")
+            transaction.executemany(
+                f"INSERT INTO jobs ({JOB_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(job.id, job.modelId, job.assignedPrinterId, int(job.priority), job.status,
+                  job.submittedAt.timestamp(), job.updatedAt.timestamp()) for job in jobs]
+            )
+            transaction.emit("reset")
+
+    def get_job_by_id(self, job_id: str) -> Optional[JobResponseDTO]:
+        """
+        Get a specific job by its ID
+        """
+        row = self._connection().execute(
+            f"SELECT {JOB_COLUMNS} FROM jobs WHERE id = ? AND leaseId IS NULL", (job_id,)
+        ).fetchone()
+        return self._to_job(row) if row else None
+
+    def update_job_priority(self, job_id: str, new_priority: int) -> Optional[JobResponseDTO]:
+        """
+        Update the priority of an existing job
+        """
+        updated = self.update_job_priorities({job_id: new_priority})
+        if updated:
+            self._logger.info(f"Updated job {job_id} priority to {new_priority}")
+            return updated[0]
+        return None
+
+    def update_job_priorities(self, priorities: Dict[str, int]) -> List[JobResponseDTO]:
+        """
+        Update the priority of many jobs in a single transaction
+        Returns the updated jobs, unknown IDs are ignored
+        """
+        now = time.time()
+        updated = []
+        with self._write() as transaction:
+            for job_id, new_priority in priorities.items():
+                row = transaction.execute(
+                    f"UPDATE jobs SET priority = ?, updatedAt = ? WHERE id = ? AND leaseId IS NULL RETURNING {JOB_COLUMNS}",
+                    (int(new_priority), now, job_id)
+                ).fetchone()
+                if row:
+                    updated.append(self._to_job(row))
+            if updated:
+                transaction.emit("update", updated)
+        if len(priorities) > 1:
+            self._logger.info(f"Updated priority of {len(updated)} jobs in batch")
+        return updated
+
+    def delete_job(self, job_id: str) -> bool:
+        """
+        Delete a single job by ID
+        Returns True if job was found and deleted, False otherwise
+        """
+        if self.delete_multiple_jobs([job_id]):
+            self._logger.info(f"Deleted job {job_id}")
+            return True
+        return False
+
+    def delete_multiple_jobs(self, job_ids: List[str]) -> int:
+        """
+        Delete multiple jobs by their IDs
+        Returns the number of jobs actually deleted
+        """
+        deleted = []
+        with self._write() as transaction:
+            for job_id in set(job_ids):
+                if transaction.execute("DELETE FROM jobs WHERE id = ? AND leaseId IS NULL RETURNING id", (job_id,)).fetchone():
+                    deleted.append(job_id)
+            if deleted:
+                transaction.emit("delete", deleted)
+        if len(deleted) > 1:
+            self._logger.info(f"Deleted {len(deleted)} jobs")
+        return len(deleted)
+
+    def get_highest_priority_job(self) -> Optional[JobResponseDTO]:
+        """
+        Get the job with highest priority (consumer approach - removes the job)
+        Returns None if no jobs are available
+        """
+        jobs = self.get_highest_priority_jobs(1)
+        return jobs[0] if jobs else None
+
+    def get_highest_priority_jobs(self, count: int, printer_ids: Optional[Set[str]] = None) -> List[JobResponseDTO]:
+        """
+        Atomically get and remove up to `count` jobs in priority order (consumer approach).
+        If printer_ids is given, only jobs without a preferred printer or preferring
+        one of those printers are taken; the others stay queued.
+        """
+        self.requeue_expired_leases()
+        printer_filter, params = self._printer_filter(printer_ids)
+        with self._write() as transaction:
+            rows = transaction.execute(
+                f"DELETE FROM jobs WHERE id IN ("
+                f"SELECT id FROM jobs WHERE leaseId IS NULL{printer_filter} "
+                f"ORDER BY priority DESC, submittedAt, rowid LIMIT ?) RETURNING {JOB_COLUMNS}, rowid",
+                params + [count]
+            ).fetchall()
+            if rows:
+                transaction.emit("dequeue", [row[0] for row in rows])
+        taken = [self._to_job(row) for row in self._sorted(rows)]
+        if taken:
+            self._logger.info(f"Retrieved and removed {len(taken)} highest priority jobs: {[job.id for job in taken]}")
+        return taken
+
+    def lease_highest_priority_jobs(self, count: int, lease_time: float,
+                                    printer_ids: Optional[Set[str]] = None) -> List[Tuple[str, datetime, JobResponseDTO]]:
+        """
+        Take up to `count` jobs out of the queue under a lease of `lease_time` seconds.
+        Returns (leaseId, expiresAt, job) tuples; the job is removed for good only when the lease is acked.
+        """
+        self.requeue_expired_leases()
+        expires_at = time.time() + lease_time
+        printer_filter, params = self._printer_filter(printer_ids)
+        # One lease per job; the row's rowid makes the lease ID unique within the statement
+        lease_prefix = uuid.uuid4().hex
+        with self._write() as transaction:
+            rows = transaction.execute(
+                f"UPDATE jobs SET leaseId = ? || '-' || rowid, leaseExpiresAt = ? WHERE id IN ("
+                f"SELECT id FROM jobs WHERE leaseId IS NULL{printer_filter} "
+                f"ORDER BY priority DESC, submittedAt, rowid LIMIT ?) RETURNING {JOB_COLUMNS}, rowid, leaseId",
+                [lease_prefix, expires_at] + params + [count]
+            ).fetchall()
+            if rows:
+                # Leased jobs leave the queue like dequeued ones; they come back with an add event if not acked
+                transaction.emit("dequeue", [row[0] for row in rows])
+        expires = datetime.fromtimestamp(expires_at, timezone.utc)
+        leased = [(row[8], expires, self._to_job(row)) for row in self._sorted(rows)]
+        if leased:
+            self._logger.info(f"Leased {len(leased)} jobs for {lease_time}s: {[lease[2].id for lease in leased]}")
+        return leased
+
+    def ack_lease(self, lease_id: str) -> Optional[JobResponseDTO]:
+        """
+        Confirm a leased job was consumed, it is removed for good
+        """
+        with self._write() as transaction:
+            row = transaction.execute(
+                f"DELETE FROM jobs WHERE leaseId = ? AND leaseExpiresAt > ? RETURNING {JOB_COLUMNS}",
+                (lease_id, time.time())
+            ).fetchone()
+        if row is None:
+            return None
+        self._logger.info(f"Lease {lease_id} acked, job {row[0]} consumed")
+        return self._to_job(row)
+
+    def extend_lease(self, lease_id: str, lease_time: float) -> Optional[Tuple[datetime, JobResponseDTO]]:
+        """
+        Move the expiry of a live lease to `lease_time` seconds from now, for consumers that hold a job longer.
+        Returns (expiresAt, job), or None if the lease is unknown or already expired.
+        """
+        now = time.time()
+        expires_at = now + lease_time
+        with self._write() as transaction:
+            row = transaction.execute(
+                f"UPDATE jobs SET leaseExpiresAt = ? WHERE leaseId = ? AND leaseExpiresAt > ? RETURNING {JOB_COLUMNS}",
+                (expires_at, lease_id, now)
+            ).fetchone()
+        if row is None:
+            return None
+        return datetime.fromtimestamp(expires_at, timezone.utc), self._to_job(row)
+
+    def nack_lease(self, lease_id: str) -> Optional[JobResponseDTO]:
+        """
+        Give a leased job back, it is re-queued with its original priority and submission time
+        """
+        with self._write() as transaction:
+            row = transaction.execute(
+                f"UPDATE jobs SET leaseId = NULL, leaseExpiresAt = NULL WHERE leaseId = ? RETURNING {JOB_COLUMNS}",
+                (lease_id,)
+            ).fetchone()
+            if row:
+                transaction.emit("add", (self._to_job(row),))
+        if row is None:
+            return None
+        self._logger.info(f"Lease {lease_id} nacked, job {row[0]} re-queued")
+        return self._to_job(row)
+
+    def requeue_expired_leases(self) -> int:
+        """
+        Re-queue the jobs of every expired lease
+        Returns the number of re-queued jobs
+        """
+        connection = self._connection()
+        now = time.time()
+        # Cheap read first, so the common case does not take the write lock
+        if connection.execute(
+            "SELECT 1 FROM jobs WHERE leaseId IS NOT NULL AND leaseExpiresAt <= ? LIMIT 1", (now,)
+        ).fetchone() is None:
+            return 0
+        with self._write() as transaction:
+            rows = transaction.execute(
+                f"UPDATE jobs SET leaseId = NULL, leaseExpiresAt = NULL WHERE leaseId IS NOT NULL AND leaseExpiresAt <= ? "
+                f"RETURNING {JOB_COLUMNS}, rowid",
+                (now,)
+            ).fetchall()
+            if rows:
+                transaction.emit("add", [self._to_job(row) for row in self._sorted(rows)])
+        if rows:
+            self._logger.warning(f"{len(rows)} leases expired, jobs re-queued")
+        return len(rows)
+
+    def get_lease_count(self) -> int:
+        """
+        Get the number of jobs currently leased
+        """
+        return self._connection().execute("SELECT COUNT(*) FROM jobs WHERE leaseId IS NOT NULL").fetchone()[0]
+
+    def get_job_count(self) -> int:
+        """
+        Get the total number of jobs in the queue
+        """
+        return self._connection().execute("SELECT COUNT(*) FROM jobs WHERE leaseId IS NULL").fetchone()[0]
+
+    def update_job_status(self, job_id: str, status: str) -> Optional[JobResponseDTO]:
+        """
+        Update the status of an existing job
+        """
+        with self._write() as transaction:
+            row = transaction.execute(
+                f"UPDATE jobs SET status = ?, updatedAt = ? WHERE id = ? AND leaseId IS NULL RETURNING {JOB_COLUMNS}",
+                (status, time.time(), job_id)
+            ).fetchone()
+            if row:
+                transaction.emit("update", (self._to_job(row),))
+        if row is None:
+            return None
+        self._logger.info(f"Updated job {job_id} status to {status}")
+        return self._to_job(row)
+
+    def clear_all_jobs(self):
+        """
+        Remove all jobs from the queue (useful for testing)
+        """
+        with self._write() as transaction:
+            count = transaction.execute("DELETE FROM jobs").rowcount
+            transaction.emit("reset")
+        self._logger.info(f"Cleared all {count} jobs from queue")
+
+class _WriteTransaction:
+    """
+    BEGIN IMMEDIATE ... COMMIT/ROLLBACK; takes the database write lock up front
+    so concurrent writers queue on busy_timeout instead of failing on lock upgrade.
+    The queue version is bumped only if the transaction changed the queue, i.e.
+    emitted an event: acking or extending a lease touches rows that are not queued.
+    """
+
+    def __init__(self, connection: sqlite3.Connection, feed: Optional[ChangeFeed]):
+        self.connection = connection
+        self.feed = feed
+        self.events: List[Tuple[str, Sequence]] = []
+
+    def execute(self, sql: str, parameters=()) -> sqlite3.Cursor:
+        return self.connection.execute(sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters) -> sqlite3.Cursor:
+        return self.connection.executemany(sql, seq_of_parameters)
+
+    def emit(self, event_type: str, items=()):
+        """
+        Publish a change to the feed once the new version is known
+        """
+        self.events.append((event_type, tuple(items)))
+
+    def __enter__(self) -> "_WriteTransaction":
+        self.connection.execute("BEGIN IMMEDIATE")
+        self.changes = self.connection.total_changes
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.connection.execute("ROLLBACK")
+            return False
+        if self.events and self.connection.total_changes != self.changes:
+            version = self.connection.execute(
+                "UPDATE meta SET value = value + 1 WHERE key = 'version' RETURNING value"
+            ).fetchone()[0]
+            # Published while the write lock is held, so events of this process stay in version order
+            if self.feed is not None:
+                for event_type, items in self.events:
+                    self.feed.publish(version, event_type, items)
+        self.connection.execute("COMMIT")
+        return False
@@ -0,0 +1,67 @@
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# Run from the priority_queue_manager directory:
+#   python3 test/journal_benchmark.py
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.dto.job_request_dto import JobRequestDTO
+from app.persistence.journal import QueueJournal
+from app.persistence.repository import PriorityQueueRepository
+
+JOBS = 100_000
+
+def fill(repository, count):
+    start = time.perf_counter()
+    for i in range(count):
+        repository.add_job(JobRequestDTO(modelId=f"model-{i}", priority=i % 10))
+    return (time.perf_counter() - start) / count * 1e6
+
+def recover(data_dir):
+    repository = PriorityQueueRepository()
+    journal = QueueJournal(data_dir, snapshot_every=10**9)
+    start = time.perf_counter()
+    repository.attach_journal(journal)
+    elapsed = time.perf_counter() - start
+    count = repository.get_job_count()
+    repository.close()
+    return elapsed, count
+
+def print_result(name, value):
+    print(f"{name:<45} {value}")
+
+if __name__ == "__main__":
+    logging.disable(logging.INFO)
+    data_dir = tempfile.mkdtemp(prefix="queue-journal-")
+    try:
+        print("=" * 60)
+        print(f"Priority queue journal benchmark ({JOBS} jobs)")
+        print("=" * 60)
+
+        print_result("add_job in memory [us/op]", f"{fill(PriorityQueueRepository(), JOBS):.1f}")
+
+        # Journal only: replay every record on startup
+        repository = PriorityQueueRepository()
+        repository.attach_journal(QueueJournal(data_dir, snapshot_every=10**9))
+        print_result("add_job journaled (group commit) [us/op]", f"{fill(repository, JOBS):.1f}")
+        repository.close()
+        elapsed, count = recover(data_dir)
+        print_result("recovery from journal [s]", f"{elapsed:.3f} ({count} jobs)")
+
+        # Snapshot + empty journal
+        repository = PriorityQueueRepository()
+        journal = QueueJournal(data_dir, snapshot_every=10**9)
+        repository.attach_journal(journal)
+        start = time.perf_counter()
+        journal.write_snapshot([repository._job_to_record(job) for job in repository.get_all_jobs()])
+        print_result("snapshot write [s]", f"{time.perf_counter() - start:.3f}")
+        repository.close()
+        elapsed, count = recover(data_dir)
+        print_result("recovery from snapshot [s]", f"{elapsed:.3f} ({count} jobs)")
+        print("=" * 60)
+    finally:
+        shutil.rmtree(data_dir)
@@ -0,0 +1,84 @@
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+# Run from the priority_queue_manager directory:
+#   python3 test/stress_test.py
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.dto.job_request_dto import JobRequestDTO
+from app.model.priority_queue_service import PriorityQueueManager
+
+OPERATIONS = 40_000
+CLIENTS = [1, 8, 32]
+
+def client(name, service, operations, added, consumed, errors, start_barrier):
+    """Mixed workload: add, reprioritize, pop, list (roughly the job handler + web UI mix)"""
+    rng = random.Random()
+    own_jobs = []
+    start_barrier.wait()
+    for i in range(operations):
+        action = rng.random()
+        if action < 0.45:
+            # Job IDs are only unique among queued jobs, so use unique models to spot real duplicates
+            job = service.add_job(JobRequestDTO(modelId=f"model-{name}-{i}", priority=rng.randint(0, 9)))
+            added.append(job.id)
+            own_jobs.append(job.id)
+        elif action < 0.60 and own_jobs:
+            try:
+                service.update_job_priority(rng.choice(own_jobs), rng.randint(0, 9))
+            except Exception as e:
+                errors.append(e)
+        elif action < 0.98:
+            try:
+                consumed.extend(job.id for job in service.get_highest_priority_jobs(1))
+            except Exception as e:
+                errors.append(e)
+        else:
+            service.get_all_jobs()
+            service.get_job_count()
+
+def run(clients):
+    service = PriorityQueueManager()
+    added, consumed, errors = [], [], []
+    start_barrier = threading.Barrier(clients + 1)
+    threads = [
+        threading.Thread(target=client, args=(n, service, OPERATIONS // clients, added, consumed, errors, start_barrier))
+        for n in range(clients)
+    ]
+    for thread in threads:
+        thread.start()
+    start_barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    # Drain what is left, every added job must be consumed exactly once
+    consumed.extend(job.id for job in service.get_highest_priority_jobs(len(added) + 1))
+    counts = Counter(consumed)
+    lost = set(added) - set(counts)
+    duplicated = [job_id for job_id, count in counts.items() if count > 1]
+    unknown = set(counts) - set(added)
+    return OPERATIONS / elapsed, len(added), lost, duplicated, unknown, errors
+
+if __name__ == "__main__":
+    logging.disable(logging.INFO)
+    # Switch threads very often so that races surface within a short run
+    sys.setswitchinterval(1e-6)
+    print("=" * 60)
+    print(f"Priority queue stress test ({OPERATIONS} operations per run)")
+    print("=" * 60)
+    failed = False
+    for clients in CLIENTS:
+        throughput, added, lost, duplicated, unknown, errors = run(clients)
+        ok = not lost and not duplicated and not unknown and not errors
+        failed = failed or not ok
+        print(f"{clients:>3} clients: {throughput:>10.0f} ops/s, {added} jobs, lost={len(lost)} "
+              f"duplicated={len(duplicated)} unknown={len(unknown)} errors={len(errors)} -> {'OK' if ok else 'FAIL'}")
+    print("=" * 60)
+    sys.exit(1 if failed else 0)
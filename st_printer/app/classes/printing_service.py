@@ -78,7 +78,8 @@ class PrintingService:
             assigned_at=assignment_dto.assignedAt,
             layer_height=assignment_dto.parameters.layerHeight,
             infill=assignment_dto.parameters.infill,
-            nozzle_temp=assignment_dto.parameters.nozzleTemp
+            nozzle_temp=assignment_dto.parameters.nozzleTemp,
+            start_after_cleaning=assignment_dto.startAfterCleaning
         )
 
         # Only set as next job if not already set and not already processed
@@ -87,6 +88,8 @@ class PrintingService:
             if self.debug:
                 print(f"[SERVICE DEBUG] Next job set: {self.next_job.job_id}\n")
         else:
+            # Same job again: only its hold can change (the go once the plate is cleared)
+            self.next_job.start_after_cleaning = job.start_after_cleaning
             if self.debug:
                 print(f"[SERVICE DEBUG] [next = current] Job {job.job_id} is already set as next job, ignoring assignment.\n")
 
@@ -136,8 +139,8 @@ class PrintingService:
             time.sleep(self._idle_timer)  # publish every 30 seconds
 
     def try_start_next_job(self):
-        # Start next job if printer is idle
-        if self.current_job is None and self.next_job is not None:
+        # Start next job if printer is idle, a job reserved during cleaning waits for its go
+        if self.current_job is None and self.next_job is not None and not self.next_job.start_after_cleaning:
             # Stop the idle status thread when a print starts
             self._idle_thread_running = False
             if self.idle_status_thread and self.idle_status_thread.is_alive():
@@ -177,6 +180,8 @@ class PrintingService:
 
     def start(self):
         # Start the printer service and begin listening for assignments
+        # Announce the printer (retained), with an "offline" last will if it dies
+        self.publisher.register_announce(self.printer.printer_id)
         self.mqtt_client.connect()
         self.subscriber.subscribe_assignment(self.printer.printer_id, self.on_assignment)
         self.mqtt_client.loop_start()
@@ -188,6 +193,15 @@ class PrintingService:
         self.idle_status_thread = threading.Thread(target=self._publish_idle_status_periodically_beginning, daemon=True)
         self.idle_status_thread.start()
 
+    def stop(self):
+        # Announce the printer offline (a clean disconnect does not trigger the last will)
+        self._idle_thread_running = False
+        self.publisher.publish_announce(self.printer.printer_id, "offline")
+        self.mqtt_client.disconnect()
+        self.mqtt_client.loop_stop()
+        if self.debug:
+            print(f"[SERVICE DEBUG] Printer [{self.printer.printer_id}] service stopped.")
+
 
 if __name__ == "__main__":
     # Example usage for testing
@@ -18,6 +18,7 @@ class PrinterAssignmentDTO:
     priority: int
     assignedAt: str
     parameters: AssignmentParameters
+    startAfterCleaning: bool = False    # reserved job: wait for the go (same assignment without the flag)
 
     def to_json(self) -> str:
         # Serialize nested dataclass
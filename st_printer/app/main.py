@@ -30,6 +30,7 @@ def main():
             time.sleep(1)
     except KeyboardInterrupt:
         print("Exiting subscriber...")
+        service.stop()
 
 if __name__ == "__main__":
     main()
@@ -11,6 +11,7 @@ class PrintJob:
     layer_height: float
     infill: float
     nozzle_temp: float
+    start_after_cleaning: bool = False
     progress: float = 0.0
     status: str = "idle"
 
@@ -21,6 +21,8 @@ class MQTTClient:
         
         # Define connection callback
         self.client.on_connect = self.on_connect
+        # Called after every (re)connection, e.g. to publish a birth message
+        self._on_connected = []
 
         self.debug = debug
 
@@ -28,18 +30,34 @@ class MQTTClient:
         if rc == 0:
             if self.debug:
                 print(f"[MQTT CLIENT DEBUG] Connected to MQTT broker at {self.broker}:{self.port}")
+            for callback in self._on_connected:
+                callback()
         else:
             if self.debug:
                 print(f"[MQTT CLIENT DEBUG] Failed to connect, return code {rc}")
 
+    def add_on_connected(self, callback):
+        # Run callback() after each successful connection (on the network loop thread)
+        self._on_connected.append(callback)
+
+    def set_will(self, topic, payload, qos=0, retain=False):
+        # Last will, published by the broker if the connection drops without a disconnect; set before connect()
+        self.client.will_set(topic, payload, qos=qos, retain=retain)
+
     def connect(self):
         # Connect to the MQTT broker
         self.client.connect(self.broker, self.port)
 
-    def publish(self, topic, payload, qos=0):
+    def publish(self, topic, payload, qos=0, retain=False, wait=True):
         # Publish a message to a topic and wait for confirmation
-        infot = self.client.publish(topic, payload, qos=qos)
-        infot.wait_for_publish()
+        # (wait=False from network loop callbacks, which would block waiting for themselves)
+        infot = self.client.publish(topic, payload, qos=qos, retain=retain)
+        if wait:
+            infot.wait_for_publish()
+
+    def disconnect(self):
+        # Clean disconnect: the broker does not publish the last will
+        self.client.disconnect()
 
     def subscribe(self, topic, callback, qos=0):
         # Subscribe to a topic and set a callback for messages
@@ -1,6 +1,7 @@
 import time
 from app.dto.temperature_reading_printer_dto import TemperatureReadingPrinterDTO
 from app.dto.printer_progress_dto import PrinterProgressDTO
+from app.dto.printer_announce_dto import PrinterAnnounceDTO
 
 class MQTTPublisher:
     def __init__(self, mqtt_client):
@@ -31,6 +32,19 @@ class MQTTPublisher:
         )
         self.mqtt_client.publish(f"device/printer/{printer_id}/progress", dto.to_json())
 
+    def register_announce(self, printer_id):
+        # Retained announce: "online" after every connection, "offline" as last will when the connection drops.
+        # Subscribers get the current status of every printer as soon as they subscribe.
+        # Call before connecting the client.
+        topic = f"device/printer/{printer_id}/announce"
+        will = PrinterAnnounceDTO(printerId=printer_id, status="offline", timestamp=str(time.time()))
+        self.mqtt_client.set_will(topic, will.to_json(), qos=1, retain=True)
+        self.mqtt_client.add_on_connected(lambda: self.publish_announce(printer_id, "online", wait=False))
+
+    def publish_announce(self, printer_id, status, wait=True):
+        dto = PrinterAnnounceDTO(printerId=printer_id, status=status, timestamp=str(time.time()))
+        self.mqtt_client.publish(f"device/printer/{printer_id}/announce", dto.to_json(), qos=1, retain=True, wait=wait)
+
 
 
 if __name__ == "__main__":
@@ -23,7 +23,8 @@ class MQTTSubscriber:
                 estimatedTime=payload.get("estimatedTime"),
                 priority=payload.get("priority"),
                 assignedAt=payload.get("assignedAt"),
-                parameters=params
+                parameters=params,
+                startAfterCleaning=payload.get("startAfterCleaning", False)
             )
             callback(client, userdata, assignment_dto)
         self.mqtt_client.subscribe(topic, dto_callback, qos=1)
@@ -5,7 +5,7 @@ import json
 @dataclass
 class PrinterStatusDTO:
     printerId: str
-    status: str  # "idle" | "printing" | "error"
+    status: str  # "idle" | "printing" | "error" | "offline"
     currentJobId: Optional[str] = None
     modelUrl: Optional[str] = None
     progress: Optional[int] = None  # 0–100